@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+基于asyncio的HTTP/1.1客户端（仅依赖标准库）
+每台设备维护独立的keep-alive连接池，单个事件循环即可维持数千个并发请求；
+与阻塞式 timed_post 一样按阶段记录耗时（复用连接时 DNS/TCP/TLS 阶段为0）
+"""
+
+import ssl
+import socket
+import time
+import asyncio
+from urllib.parse import urlsplit
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:  # Windows
+    RESOURCE_AVAILABLE = False
+
+
+def raise_open_file_limit(required):
+    """
+    尽量提高进程可打开文件数上限（每个并发连接占用一个文件描述符）
+
+    Args:
+        required: 需要的文件描述符数量
+
+    Returns:
+        调整后的软限制，无法获取时返回None
+    """
+    if not RESOURCE_AVAILABLE:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < required:
+        target = required if hard == resource.RLIM_INFINITY else min(required, hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            soft = target
+        except (ValueError, OSError):
+            pass
+    return soft
+
+
+class PoolTimeoutError(Exception):
+    """等待设备连接池空闲连接超时（客户端排队，请求未发出，不属于设备故障）"""
+
+
+class AsyncConnectionPool:
+    """按设备（主机:端口）划分的异步keep-alive连接池"""
+
+    def __init__(self, max_per_host=8, timeout=30, acquire_timeout=None):
+        """
+        初始化连接池
+
+        Args:
+            max_per_host: 每台设备最大并发连接数
+            timeout: 单次请求超时时间（秒），从取得连接后开始计算
+            acquire_timeout: 等待空闲连接的超时时间（秒），默认与 timeout 相同
+        """
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.acquire_timeout = timeout if acquire_timeout is None else acquire_timeout
+        self.idle = {}        # (主机, 端口) -> 空闲连接列表 [(reader, writer)]
+        self.semaphores = {}  # (主机, 端口) -> 并发连接数限制
+        self.ssl_context = ssl.create_default_context()
+        # 设备证书不做校验，与阻塞式后端一致
+        self.ssl_context.check_hostname = False
+        self.ssl_context.verify_mode = ssl.CERT_NONE
+        self.stats = {'connections_opened': 0, 'connections_reused': 0, 'pool_timeouts': 0}
+
+    async def open_connection(self, parts, port, phases):
+        """新建连接并记录 DNS、TCP连接和TLS握手耗时"""
+        loop = asyncio.get_running_loop()
+        t0 = time.perf_counter()
+        family, socktype, proto, _, sockaddr = (await loop.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM))[0]
+        t1 = time.perf_counter()
+        phases['dns_ms'] = round((t1 - t0) * 1000, 3)
+
+        reader, writer = await asyncio.open_connection(sockaddr[0], port, family=family)
+        t2 = time.perf_counter()
+        phases['connect_ms'] = round((t2 - t1) * 1000, 3)
+
+        if parts.scheme == 'https':
+            await writer.start_tls(self.ssl_context, server_hostname=parts.hostname)
+        phases['tls_ms'] = round((time.perf_counter() - t2) * 1000, 3)
+
+        self.stats['connections_opened'] += 1
+        return reader, writer
+
+    @staticmethod
+    def disable_delayed_ack(writer):
+        """
+        复用连接时关闭延迟ACK（Linux TCP_QUICKACK，每次读取前需重新设置）
+
+        设备分两次写出响应头和响应体时，服务端Nagle算法会等待响应头的ACK，
+        与客户端延迟ACK叠加会使复用连接的响应传输阶段多出数十毫秒
+        """
+        sock = writer.get_extra_info('socket')
+        if sock is not None and hasattr(socket, 'TCP_QUICKACK'):
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+            except OSError:
+                pass
+
+    async def read_response(self, reader, writer, phases, sent_at):
+        """
+        读取HTTP响应，记录首字节(TTFB)和响应传输耗时
+
+        Args:
+            reader: StreamReader
+            writer: StreamWriter
+            phases: 阶段耗时字典（输出参数）
+            sent_at: 请求开始发送的时刻（perf_counter）
+
+        Returns:
+            (状态码, 响应体bytes, 是否可复用连接)，连接已被对端关闭时返回 None
+        """
+        status_line = await reader.readline()
+        if not status_line:
+            return None
+        t4 = time.perf_counter()
+        phases['ttfb_ms'] = round((t4 - sent_at) * 1000, 3)
+        # 立即确认已收到的响应头，避免设备等待ACK后才发送响应体
+        self.disable_delayed_ack(writer)
+        version, status_code = status_line.decode('latin-1').split(' ', 2)[:2]
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        if 'content-length' in headers:
+            content = await reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            content = b''.join(chunks)
+        else:
+            content = await reader.read()
+            keep_alive = False
+        phases['transfer_ms'] = round((time.perf_counter() - t4) * 1000, 3)
+        return int(status_code), content, keep_alive
+
+    async def post(self, url, body, headers, phases):
+        """
+        发送POST请求并记录各阶段耗时
+
+        请求超时只从取得设备连接后开始计算，排队等待连接的时间不计入；
+        请求超时抛出 asyncio.TimeoutError，等待连接超时抛出 PoolTimeoutError
+
+        Args:
+            url: 请求地址
+            body: 请求体bytes
+            headers: 请求头
+            phases: 阶段耗时字典（输出参数）
+
+        Returns:
+            (状态码, 响应体bytes)
+        """
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        key = (parts.hostname, port)
+        semaphore = self.semaphores.setdefault(key, asyncio.Semaphore(self.max_per_host))
+
+        wait_start = time.perf_counter()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.stats['pool_timeouts'] += 1
+            raise PoolTimeoutError(f"等待设备连接池空闲连接超时（{self.acquire_timeout}秒）") from None
+        try:
+            # 等待设备连接池空闲连接的时间（不计入响应时间）
+            phases['pool_wait_ms'] = round((time.perf_counter() - wait_start) * 1000, 3)
+            return await asyncio.wait_for(self.send(parts, port, key, body, headers, phases), self.timeout)
+        finally:
+            semaphore.release()
+
+    async def send(self, parts, port, key, body, headers, phases):
+        """在已取得的连接槽位上发送请求（复用空闲连接，对端已关闭时重建连接重试一次）"""
+        path = parts.path + (f"?{parts.query}" if parts.query else '')
+        request = (f"POST {path} HTTP/1.1\r\nHost: {parts.hostname}:{port}\r\n"
+                   f"Content-Length: {len(body)}\r\nConnection: keep-alive\r\n"
+                   + ''.join(f"{name}: {value}\r\n" for name, value in headers.items())
+                   + "\r\n").encode('latin-1') + body
+
+        idle = self.idle.setdefault(key, [])
+        for attempt in range(2):
+            reused = bool(idle) and attempt == 0
+            if reused:
+                reader, writer = idle.pop()
+                phases.update({'dns_ms': 0, 'connect_ms': 0, 'tls_ms': 0})
+            else:
+                reader, writer = await self.open_connection(parts, port, phases)
+
+            t3 = time.perf_counter()
+            try:
+                self.disable_delayed_ack(writer)
+                writer.write(request)
+                await writer.drain()
+                response = await self.read_response(reader, writer, phases, t3)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if reused:
+                    continue  # 空闲连接已被设备关闭，新建连接重试
+                raise
+            except BaseException:
+                writer.close()
+                raise
+
+            if response is None:
+                writer.close()
+                if reused:
+                    continue
+                raise ConnectionError("Remote end closed connection without response")
+
+            status_code, content, keep_alive = response
+            phases['connection_reused'] = reused
+            if reused:
+                self.stats['connections_reused'] += 1
+            if keep_alive:
+                idle.append((reader, writer))
+            else:
+                writer.close()
+            return status_code, content
+
+    async def close(self):
+        """关闭所有空闲连接"""
+        for connections in self.idle.values():
+            for _, writer in connections:
+                writer.close()
+        self.idle.clear()
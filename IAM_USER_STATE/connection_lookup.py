@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Connection接口批量关键字查询
+将一批用户IP/关键字并发分发到所有在线设备查询 /v1/conntections，
+相同 (设备, 过滤方式, 关键字) 的请求去重，查询结果按TTL缓存（可持久化到文件），
+最终生成 关键字 -> 设备 -> 连接列表 的索引
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import ipaddress
+
+from async_http_client import AsyncConnectionPool, raise_open_file_limit
+
+# 默认查询缓存文件（脚本所在目录）
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'connection_lookup_cache.json')
+
+
+def load_keywords(filename, default_filter='byip'):
+    """
+    读取关键字文件：每行一个关键字，或 "过滤方式,关键字"；空行和 # 开头的行忽略，重复项去重
+
+    Args:
+        filename: 关键字文件路径
+        default_filter: 未指定过滤方式时使用的过滤方式
+
+    Returns:
+        [(过滤方式, 关键字)]，保持文件中的首次出现顺序
+    """
+    keywords = []
+    seen = set()
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            filter_type, _, keyword = line.rpartition(',')
+            filter_type = filter_type.strip() or default_filter
+            keyword = keyword.strip()
+            if filter_type == 'byip':
+                try:
+                    keyword = str(ipaddress.ip_address(keyword))  # 统一IP写法，避免同一IP重复查询
+                except ValueError:
+                    logging.warning(f"跳过无效IP: {keyword}")
+                    continue
+            if (filter_type, keyword) not in seen:
+                seen.add((filter_type, keyword))
+                keywords.append((filter_type, keyword))
+    return keywords
+
+
+def index_key(filter_type, keyword):
+    """索引键：按IP查询直接使用IP，其他过滤方式加前缀以免与IP冲突"""
+    return keyword if filter_type == 'byip' else f"{filter_type}:{keyword}"
+
+
+class ConnectionLookup:
+    """连接批量查询（带TTL缓存）"""
+
+    def __init__(self, devices, api_port=9999, endpoint="/v1/conntections", timeout=30,
+                 concurrency=500, pool_size=8, cache_ttl=300, cache_file=DEFAULT_CACHE_PATH):
+        """
+        初始化批量查询
+
+        Args:
+            devices: 在线设备列表（load_device_list 的返回值）
+            api_port: 设备接口端口
+            endpoint: 连接查询接口路径
+            timeout: 单次请求超时时间（秒）
+            concurrency: 同时进行的查询数
+            pool_size: 每台设备的最大连接数
+            cache_ttl: 缓存有效期（秒），0表示不使用缓存
+            cache_file: 缓存文件路径，None表示只在内存中缓存
+        """
+        self.devices = devices
+        self.api_port = api_port
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.pool_size = pool_size
+        self.cache_ttl = cache_ttl
+        self.cache_file = cache_file
+        self.cache = self.load_cache()  # "设备IP|过滤方式|关键字" -> {'fetched_at', 'connections'}
+        self.in_flight = {}             # 缓存键 -> 进行中的查询任务（同一查询只发送一次）
+        self.stats = {'requests': 0, 'cache_hits': 0, 'deduplicated': 0, 'errors': 0}
+
+    def load_cache(self):
+        """读取缓存文件，丢弃已过期的条目"""
+        if not self.cache_file or not self.cache_ttl or not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"读取查询缓存失败，将重新查询: {e}")
+            return {}
+        now = time.time()
+        return {key: entry for key, entry in cache.items() if now - entry['fetched_at'] < self.cache_ttl}
+
+    def save_cache(self):
+        """保存缓存文件（先写临时文件再替换）"""
+        if not self.cache_file or not self.cache_ttl:
+            return
+        temp_file = self.cache_file + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.cache, f, ensure_ascii=False)
+        os.replace(temp_file, self.cache_file)
+
+    @staticmethod
+    def cache_key(device_ip, filter_type, keyword):
+        """缓存键"""
+        return f"{device_ip}|{filter_type}|{keyword}"
+
+    async def query(self, pool, device, filter_type, keyword):
+        """
+        查询单台设备上的单个关键字（命中缓存时不发送请求，相同查询进行中时等待其结果）
+
+        Returns:
+            {'connections': 连接列表, 'cached': 是否来自缓存, 'error': 错误信息}
+        """
+        key = self.cache_key(device['ip'], filter_type, keyword)
+        entry = self.cache.get(key)
+        if entry and time.time() - entry['fetched_at'] < self.cache_ttl:
+            self.stats['cache_hits'] += 1
+            return {'connections': entry['connections'], 'cached': True, 'error': ''}
+
+        if key in self.in_flight:
+            self.stats['deduplicated'] += 1
+            return await asyncio.shield(self.in_flight[key])
+
+        task = asyncio.ensure_future(self.fetch(pool, device, filter_type, keyword, key))
+        self.in_flight[key] = task
+        try:
+            return await task
+        finally:
+            self.in_flight.pop(key, None)
+
+    async def fetch(self, pool, device, filter_type, keyword, key):
+        """发送查询请求，成功结果写入缓存（失败不缓存，下次重新查询）"""
+        url = f"http://{device['ip']}:{self.api_port}{self.endpoint}"
+        body = json.dumps({"data": {"filter": filter_type, "keyword": keyword}}).encode('utf-8')
+        self.stats['requests'] += 1
+        try:
+            status_code, content = await pool.post(url, body, {'Content-Type': 'application/json'}, {})
+            if status_code != 200:
+                raise RuntimeError(f"状态码 {status_code}: {content.decode('utf-8', errors='replace')[:100]}")
+            data = json.loads(content)
+            if isinstance(data.get('data'), list):
+                connections = data['data']
+            elif data.get('code') == 0:
+                connections = []
+            else:
+                raise RuntimeError(data.get('message', 'Unknown error'))
+        except Exception as e:
+            self.stats['errors'] += 1
+            return {'connections': [], 'cached': False, 'error': str(e)[:200] or type(e).__name__}
+
+        if self.cache_ttl:
+            self.cache[key] = {'fetched_at': time.time(), 'connections': connections}
+        return {'connections': connections, 'cached': False, 'error': ''}
+
+    async def lookup_async(self, keywords, index, errors):
+        """
+        并发查询所有设备 × 所有关键字，结果直接写入索引
+
+        concurrency 个协程从同一个 (设备, 关键字) 生成器中取任务，
+        内存占用只与并发数和命中的连接数有关，与关键字数×设备数无关
+        """
+        raise_open_file_limit(min(self.concurrency, self.pool_size * len(self.devices)) + 256)
+        pool = AsyncConnectionPool(self.pool_size, self.timeout)
+        # 按关键字外层、设备内层展开，相邻任务分散到不同设备
+        tasks = ((device, filter_type, keyword) for filter_type, keyword in keywords for device in self.devices)
+
+        async def worker():
+            for device, filter_type, keyword in tasks:
+                result = await self.query(pool, device, filter_type, keyword)
+                if result['error']:
+                    errors.append({'keyword': keyword, 'device_ip': device['ip'], 'device_name': device['name'],
+                                   'error': result['error']})
+                elif result['connections']:
+                    entry = index[index_key(filter_type, keyword)]
+                    if device['ip'] in entry['devices']:
+                        continue  # 重复的关键字已由同一查询写入
+                    entry['devices'][device['ip']] = {
+                        'device_name': device['name'],
+                        'machine_room': device['machineRoom'],
+                        'connections': result['connections']
+                    }
+                    entry['device_count'] += 1
+                    entry['connection_count'] += len(result['connections'])
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(max(1, self.concurrency))))
+        finally:
+            await pool.close()
+
+    def lookup(self, keywords):
+        """
+        批量查询并生成索引
+
+        Args:
+            keywords: [(过滤方式, 关键字)]
+
+        Returns:
+            {
+                'keywords': {索引键: {'filter', 'keyword', 'device_count', 'connection_count',
+                                     'devices': {设备IP: {'device_name', 'machine_room', 'connections'}}}},
+                'errors': [{'keyword', 'device_ip', 'device_name', 'error'}],
+                'stats': 请求数/缓存命中数/去重数/失败数及耗时
+            }
+        """
+        start = time.time()
+        logging.info(f"开始批量查询: {len(keywords)} 个关键字 × {len(self.devices)} 台设备")
+
+        index = {index_key(filter_type, keyword): {'filter': filter_type, 'keyword': keyword, 'device_count': 0,
+                                                   'connection_count': 0, 'devices': {}}
+                 for filter_type, keyword in keywords}
+        errors = []
+        asyncio.run(self.lookup_async(keywords, index, errors))
+
+        self.save_cache()
+        self.stats['elapsed_s'] = round(time.time() - start, 2)
+        logging.info(f"批量查询完成: 请求 {self.stats['requests']} 次，缓存命中 {self.stats['cache_hits']} 次，"
+                     f"去重 {self.stats['deduplicated']} 次，失败 {self.stats['errors']} 次，"
+                     f"耗时 {self.stats['elapsed_s']} 秒")
+        return {'keywords': index, 'errors': errors, 'stats': dict(self.stats)}
+
+
+def index_rows(index):
+    """将查询索引展开为报告行（关键字 × 设备）"""
+    rows = []
+    for entry in index['keywords'].values():
+        keyword = entry['keyword']
+        if not entry['devices']:
+            rows.append({'关键字': keyword, '过滤方式': entry['filter'], '设备名称': '', 'IP地址': '',
+                         '机房': '', '连接数': 0})
+        for device_ip, device in entry['devices'].items():
+            rows.append({'关键字': keyword, '过滤方式': entry['filter'], '设备名称': device['device_name'],
+                         'IP地址': device_ip, '机房': device['machine_room'],
+                         '连接数': len(device['connections'])})
+    return rows
+
+
+def connection_rows(index):
+    """将查询索引展开为连接明细行（关键字 × 设备 × 连接）"""
+    rows = []
+    for entry in index['keywords'].values():
+        for device_ip, device in entry['devices'].items():
+            for connection in device['connections']:
+                row = {'关键字': entry['keyword'], '设备名称': device['device_name'], 'IP地址': device_ip,
+                       '机房': device['machine_room']}
+                if isinstance(connection, dict):
+                    row.update(connection)
+                else:
+                    row['连接'] = connection
+                rows.append(row)
+    return rows
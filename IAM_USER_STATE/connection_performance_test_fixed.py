@@ -8,14 +8,30 @@ IAM设备Connection接口性能测试脚本 - 修复版本
 
 import json
 import time
-import requests
+import bisect
+import hashlib
+import string
+import ssl
+import socket
+import argparse
+import threading
+import http.client
 import random
+import asyncio
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import logging
 import statistics
 import sys
 import os
 
+from latency_histogram import HistogramSet, LatencyHistogram
+from performance_store import PerformanceResultStore, DEFAULT_STORE_PATH, compare_stats
+from async_http_client import AsyncConnectionPool, PoolTimeoutError, raise_open_file_limit
+from connection_lookup import ConnectionLookup, DEFAULT_CACHE_PATH, load_keywords, index_rows, connection_rows
+from device_sampling import DeviceSampler, DEFAULT_STATE_PATH, STRATIFY_KEYS, sample_size_for_coverage
+
 # 尝试导入pandas和openpyxl，如果失败则使用备用方案
 try:
     import pandas as pd
@@ -31,13 +47,6 @@ except ImportError:
     OPENPYXL_AVAILABLE = False
     print("警告: openpyxl未安装，将使用CSV格式生成报告")
 
-# 禁用SSL警告
-try:
-    from urllib3.exceptions import InsecureRequestWarning
-    requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
-except:
-    pass
-
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -48,19 +57,102 @@ logging.basicConfig(
     ]
 )
 
+def new_time_stats():
+    """创建响应时间累计统计（计数、总和、平方和、最小值、最大值）"""
+    return {'count': 0, 'sum': 0.0, 'sumsq': 0.0, 'min': None, 'max': None}
+
+def accumulate_time(stats, value):
+    """将一个响应时间累加到统计中"""
+    stats['count'] += 1
+    stats['sum'] += value
+    stats['sumsq'] += value * value
+    stats['min'] = value if stats['min'] is None else min(stats['min'], value)
+    stats['max'] = value if stats['max'] is None else max(stats['max'], value)
+
+def summarize_times(stats):
+    """
+    由累计统计计算响应时间平均值、最小值、最大值和样本标准差
+
+    Returns:
+        (平均值, 最小值, 最大值, 标准差)，无样本时均为0
+    """
+    count = stats['count']
+    if count == 0:
+        return 0, 0, 0, 0
+    mean = stats['sum'] / count
+    variance = (stats['sumsq'] - count * mean * mean) / (count - 1) if count > 1 else 0
+    return mean, stats['min'], stats['max'], max(variance, 0) ** 0.5
+
 class ConnectionPerformanceTestFixed:
+    # 请求阶段（结果字段, 报告名称）
+    PHASES = [
+        ('dns_ms', 'DNS解析'),
+        ('connect_ms', 'TCP连接'),
+        ('tls_ms', 'TLS握手'),
+        ('ttfb_ms', '首字节(TTFB)'),
+        ('transfer_ms', '响应传输'),
+        ('json_parse_ms', 'JSON解析')
+    ]
+
     def __init__(self):
         self.test_devices = []
-        self.test_results = []
         self.device_status = []
         
         # 测试配置
         self.test_count_per_device = 5
         self.timeout = 30
+        self.api_port = 9999
+        self.endpoint = "/v1/conntections"
         self.test_ip = "154.121.52.134"
-        
-        # 从设备列表中随机选择3台设备
-        self.selected_devices = self.select_test_devices()
+        self.log_each_request = True  # 负载模式下关闭逐条请求日志
+
+        # 设备状态采集配置（/v1/status/throughput、/v1/status/user-rank，需要random/md5认证）
+        self.shared_secret = "1"      # 与 temp_extract/config.py 中 SHARED_SECRET 一致
+        self.status_interval = 10     # 测试期间状态快照间隔（秒）
+        self.status_workers = 32      # 状态采集并发数
+        self.status_user_top = 1000   # 用户排行请求条数，用于统计在线用户数和会话数
+        self.status_snapshots = {}    # 设备IP -> [状态快照]（按采集时间排序）
+
+        # 负载测试配置与统计（run_load_test 设置）
+        self.load_config = None
+        self.load_stats = None
+
+        # 测试结果流式写入JSON Lines文件（追加写入，每条结果一行），报告从文件逐行生成
+        self.results_file = None
+        self.results_stream = None
+        self.response_sample_rate = 0.0  # 结果文件中保留响应体的比例，0表示全部丢弃
+        self.excel_detail_limit = 100000  # Excel详细结果最多写入的行数，完整结果见结果文件
+
+        # 增量汇总统计，报告中的计数和均值不再依赖内存中的结果列表
+        self.result_count = 0
+        self.success_count = 0
+        self.device_stats = {}   # 设备IP -> 请求计数和响应时间累计
+        self.error_counts = {}   # 错误信息 -> 出现次数
+        self.client_error_count = 0  # 客户端等待连接池超时（请求未发出），不计入设备失败和延迟
+        self.started_at = None
+
+        # 历史结果库与性能对比（save_to_store / compare_with_store 设置）
+        self.run_id = None
+        self.comparison_label = None
+        self.comparison_rows = None
+
+        # 按设备×接口记录成功请求的延迟直方图
+        self.histograms = HistogramSet()
+        # 按设备×阶段记录请求各阶段耗时直方图
+        self.phase_histograms = HistogramSet()
+        self.results_lock = threading.Lock()
+
+        # 测试设备分层抽样配置（按机房和带宽等级分层，多次运行轮换覆盖全部设备）
+        self.sample_size = 3
+        self.sample_seed = None
+        self.stratify = 'machine_room_bandwidth'
+        self.sampling_state_file = DEFAULT_STATE_PATH  # None表示不轮换
+        self.coverage_window_days = 7
+        self.sampler = None
+        self.sampling_coverage = None
+
+        # 测试设备（single模式由 select_test_devices 按抽样配置选择，load模式为所有在线设备）
+        self.selected_devices = []
         
     def load_device_list(self):
         """加载设备列表"""
@@ -104,42 +196,108 @@ class ConnectionPerformanceTestFixed:
             
         return devices
     
-    def select_test_devices(self):
-        """随机选择3台测试设备"""
+    def select_test_devices(self, sample_size=None):
+        """
+        从全部在线设备中分层抽样选择测试设备
+
+        Args:
+            sample_size: 样本数，默认使用 self.sample_size
+
+        Returns:
+            抽中的设备列表
+        """
         all_devices = self.load_device_list()
-        
-        if len(all_devices) < 3:
-            logging.error("可用设备数量不足3台")
+        sample_size = sample_size or self.sample_size
+
+        if len(all_devices) < sample_size:
+            logging.error(f"可用设备数量不足{sample_size}台")
             return []
-        
-        # 从不同机房选择设备以确保多样性
-        machine_rooms = {}
-        for device in all_devices:
-            room = device['machineRoom']
-            if room not in machine_rooms:
-                machine_rooms[room] = []
-            machine_rooms[room].append(device)
-        
-        selected = []
-        room_names = list(machine_rooms.keys())
-        
-        # 尽量从不同机房选择设备
-        for i in range(3):
-            if i < len(room_names):
-                room_devices = machine_rooms[room_names[i]]
-                selected.append(random.choice(room_devices))
-            else:
-                # 如果机房不够，从所有设备中随机选择
-                remaining_devices = [d for d in all_devices if d not in selected]
-                if remaining_devices:
-                    selected.append(random.choice(remaining_devices))
-        
-        logging.info(f"选择的测试设备: {[d['name'] for d in selected]}")
+
+        self.sampler = DeviceSampler(all_devices, self.sampling_state_file, self.sample_seed, self.stratify)
+        selected = self.sampler.sample(sample_size, rotate=self.sampling_state_file is not None)
+
+        logging.info(f"选择的测试设备（{len(self.sampler.strata())} 层，{self.stratify}）: {[d['name'] for d in selected]}")
         return selected
+
+    def record_sampling_run(self):
+        """记录本次测试覆盖的设备，并统计最近覆盖周期内的设备覆盖率"""
+        if not self.sampler:
+            return
+        self.sampler.record_run(self.selected_devices)
+        self.sampling_coverage = self.sampler.coverage(self.coverage_window_days)
+        logging.info(f"最近 {self.coverage_window_days} 天设备覆盖率: {self.sampling_coverage['covered']}/"
+                     f"{self.sampling_coverage['total']} ({self.sampling_coverage['coverage_pct']}%)")
     
-    def test_connection_api(self, device, test_number):
-        """测试单个设备的Connection接口"""
-        url = f"http://{device['ip']}:9999/v1/conntections"
+    def timed_post(self, url, payload, headers, phases):
+        """
+        发送POST请求并用单调时钟记录各阶段耗时
+
+        每次请求新建连接，使连接耗时可以单独统计。phases 按阶段逐步填充
+        （dns_ms、connect_ms、tls_ms、ttfb_ms、transfer_ms，单位毫秒），
+        超时或异常时已完成阶段的耗时仍保留在 phases 中
+
+        Args:
+            url: 请求地址
+            payload: 请求体（JSON）
+            headers: 请求头
+            phases: 阶段耗时字典（输出参数）
+
+        Returns:
+            (状态码, 响应体bytes)
+        """
+        parts = urlsplit(url)
+        is_https = parts.scheme == 'https'
+        port = parts.port or (443 if is_https else 80)
+        path = parts.path + (f"?{parts.query}" if parts.query else '')
+        body = json.dumps(payload).encode('utf-8')
+
+        # DNS解析（设备地址为IP时接近0）
+        t0 = time.perf_counter()
+        family, socktype, proto, _, sockaddr = socket.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)[0]
+        t1 = time.perf_counter()
+        phases['dns_ms'] = round((t1 - t0) * 1000, 3)
+
+        sock = socket.socket(family, socktype, proto)
+        sock.settimeout(self.timeout)
+        try:
+            # TCP连接
+            sock.connect(sockaddr)
+            t2 = time.perf_counter()
+            phases['connect_ms'] = round((t2 - t1) * 1000, 3)
+
+            # TLS握手（设备证书不做校验，与原有 verify=False 一致）
+            if is_https:
+                context = ssl.create_default_context()
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+                sock = context.wrap_socket(sock, server_hostname=parts.hostname)
+            t3 = time.perf_counter()
+            phases['tls_ms'] = round((t3 - t2) * 1000, 3)
+
+            # 发送请求到收到响应头（首字节）
+            connection = http.client.HTTPConnection(parts.hostname, port, timeout=self.timeout)
+            connection.sock = sock
+            connection.request('POST', path, body=body, headers=headers)
+            response = connection.getresponse()
+            t4 = time.perf_counter()
+            phases['ttfb_ms'] = round((t4 - t3) * 1000, 3)
+
+            # 响应体传输
+            content = response.read()
+            phases['transfer_ms'] = round((time.perf_counter() - t4) * 1000, 3)
+
+            return response.status, content
+        finally:
+            sock.close()
+
+    def connection_request(self, device):
+        """
+        构造Connection接口请求
+
+        Returns:
+            (请求地址, 请求体, 请求头)
+        """
+        url = f"http://{device['ip']}:{self.api_port}{self.endpoint}"
         
         payload = {
             "data": {
@@ -151,20 +309,55 @@ class ConnectionPerformanceTestFixed:
         headers = {
             'Content-Type': 'application/json'
         }
-        
-        start_time = time.time()
+        return url, payload, headers
+
+    def test_connection_api(self, device, test_number):
+        """测试单个设备的Connection接口（阻塞式，每次请求新建连接）"""
+        url, payload, headers = self.connection_request(device)
+        phases = {}
+        sent_monotonic = time.perf_counter()
         
         try:
-            response = requests.post(
-                url, 
-                json=payload, 
-                headers=headers, 
-                timeout=self.timeout,
-                verify=False
-            )
-            
-            end_time = time.time()
-            response_time = (end_time - start_time) * 1000  # 转换为毫秒
+            status_code, content = self.timed_post(url, payload, headers, phases)
+        except Exception as e:
+            return self.build_result(device, test_number, phases, sent_monotonic, error=e)
+        return self.build_result(device, test_number, phases, sent_monotonic, status_code, content)
+
+    async def async_test_connection_api(self, pool, device, test_number):
+        """
+        测试单个设备的Connection接口（异步，复用设备连接池中的keep-alive连接）
+
+        Args:
+            pool: AsyncConnectionPool实例
+            device: 设备信息
+            test_number: 测试序号
+        """
+        url, payload, headers = self.connection_request(device)
+        phases = {}
+        sent_monotonic = time.perf_counter()
+
+        try:
+            status_code, content = await pool.post(url, json.dumps(payload).encode('utf-8'), headers, phases)
+        except Exception as e:
+            return self.build_result(device, test_number, phases, sent_monotonic, error=e)
+        return self.build_result(device, test_number, phases, sent_monotonic, status_code, content)
+
+    def build_result(self, device, test_number, phases, sent_monotonic, status_code=None, content=None, error=None):
+        """
+        根据响应或异常生成单次测试结果（阻塞式和异步后端共用）
+
+        Args:
+            device: 设备信息
+            test_number: 测试序号
+            phases: 阶段耗时字典
+            sent_monotonic: 请求发送时刻（perf_counter）
+            status_code: 响应状态码
+            content: 响应体bytes
+            error: 请求异常，None表示收到响应
+        """
+        if error is None:
+            # 总响应时间 = DNS + 连接 + TLS + 首字节 + 传输（不含JSON解析）
+            response_time = sum(phases.get(key, 0) for key, _ in self.PHASES if key != 'json_parse_ms')
             
             result = {
                 'device_name': device['name'],
@@ -172,17 +365,19 @@ class ConnectionPerformanceTestFixed:
                 'machine_room': device['machineRoom'],
                 'test_number': test_number,
                 'response_time_ms': round(response_time, 2),
-                'status_code': response.status_code,
-                'success': response.status_code == 200,
-                'response_size_bytes': len(response.content),
+                'status_code': status_code,
+                'success': status_code == 200,
+                'response_size_bytes': len(content),
                 'connection_count': 0,  # 默认值
                 'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             }
             
             # 解析响应内容
-            if response.status_code == 200:
+            if status_code == 200:
                 try:
-                    response_data = response.json()
+                    parse_start = time.perf_counter()
+                    response_data = json.loads(content)
+                    phases['json_parse_ms'] = round((time.perf_counter() - parse_start) * 1000, 3)
                     result['response_data'] = response_data
                     # 提取连接数等信息
                     if 'data' in response_data and isinstance(response_data['data'], list):
@@ -200,11 +395,33 @@ class ConnectionPerformanceTestFixed:
             else:
                 result['connection_count'] = 0
                 result['success'] = False
-                result['error_message'] = response.text[:200]
+                result['error_message'] = content.decode('utf-8', errors='replace')[:200]
+
+            result.update(phases)
             
-            logging.info(f"设备 {device['name']} 测试 {test_number}: {response_time:.2f}ms - {'成功' if result['success'] else '失败'}")
+            if self.log_each_request:
+                logging.info(f"设备 {device['name']} 测试 {test_number}: {response_time:.2f}ms - {'成功' if result['success'] else '失败'}")
             
-        except requests.exceptions.Timeout:
+        elif isinstance(error, PoolTimeoutError):
+            # 请求在客户端排队时超时，没有发到设备，只记录为客户端错误
+            result = {
+                'device_name': device['name'],
+                'device_ip': device['ip'],
+                'machine_room': device['machineRoom'],
+                'test_number': test_number,
+                'response_time_ms': 0,
+                'status_code': 0,
+                'success': False,
+                'client_error': True,
+                'response_size_bytes': 0,
+                'connection_count': 0,
+                'error_message': str(error),
+                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
+            if self.log_each_request:
+                logging.warning(f"设备 {device['name']} 测试 {test_number}: {error}")
+
+        elif isinstance(error, (socket.timeout, TimeoutError, asyncio.TimeoutError)):
             result = {
                 'device_name': device['name'],
                 'device_ip': device['ip'],
@@ -218,9 +435,11 @@ class ConnectionPerformanceTestFixed:
                 'error_message': 'Timeout',
                 'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             }
-            logging.warning(f"设备 {device['name']} 测试 {test_number}: 超时")
+            result.update(phases)  # 保留超时前已完成阶段的耗时
+            if self.log_each_request:
+                logging.warning(f"设备 {device['name']} 测试 {test_number}: 超时")
             
-        except Exception as e:
+        else:
             result = {
                 'device_name': device['name'],
                 'device_ip': device['ip'],
@@ -231,42 +450,396 @@ class ConnectionPerformanceTestFixed:
                 'success': False,
                 'response_size_bytes': 0,
                 'connection_count': 0,
-                'error_message': str(e)[:200],
+                'error_message': str(error)[:200] or type(error).__name__,
                 'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             }
-            logging.error(f"设备 {device['name']} 测试 {test_number}: 错误 - {e}")
+            result.update(phases)
+            if self.log_each_request:
+                logging.error(f"设备 {device['name']} 测试 {test_number}: 错误 - {error}")
         
+        result['sent_monotonic'] = sent_monotonic  # 用于关联最接近的设备状态快照
         return result
     
-    def get_device_status(self, device):
-        """获取设备状态信息（模拟数据）"""
-        device_status = {
+    def open_results_stream(self, mode, filename=None):
+        """
+        打开结果文件（JSON Lines，追加写入），并写入本次测试的元信息
+
+        文件中每行一条记录，type 字段区分 meta（测试配置）、status（设备状态快照）、
+        result（单次请求结果）和 end（测试结束）。进程中途退出时已完成的结果仍保留在文件中，
+        可通过 --from-results 重新生成报告
+
+        Args:
+            mode: 测试模式（single/load）
+            filename: 结果文件路径，默认 connection_test_results_<时间戳>.jsonl
+        """
+        self.results_file = filename or f"connection_test_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+        # 行缓冲：每条记录写完即刷新到文件
+        self.results_stream = open(self.results_file, 'a', encoding='utf-8', buffering=1)
+        self.started_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.write_record('meta', {
+            'mode': mode,
+            'endpoint': self.endpoint,
+            'test_ip': self.test_ip,
+            'test_count_per_device': self.test_count_per_device,
+            'load_config': self.load_config,
+            'devices': self.selected_devices,
+            'timestamp': self.started_at
+        })
+        logging.info(f"测试结果将流式写入: {self.results_file}")
+
+    def close_results_stream(self):
+        """写入结束记录并关闭结果文件"""
+        if not self.results_stream:
+            return
+        self.write_record('end', {
+            'load_config': self.load_config,
+            'result_count': self.result_count,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+        self.results_stream.close()
+        self.results_stream = None
+
+    def write_record(self, record_type, record):
+        """向结果文件追加一条记录（线程安全）"""
+        if not self.results_stream:
+            return
+        line = json.dumps({'type': record_type, **record}, ensure_ascii=False, default=str)
+        with self.results_lock:
+            self.results_stream.write(line + '\n')
+
+    def record_result(self, result):
+        """
+        保存单次测试结果：追加写入结果文件，并更新汇总统计和延迟直方图（线程安全）
+
+        响应体按 response_sample_rate 抽样保留，其余直接丢弃，内存占用不随请求数增长
+        """
+        if 'response_data' in result and random.random() >= self.response_sample_rate:
+            result.pop('response_data')
+        self.write_record('result', result)
+        self.ingest_result(result)
+
+    def ingest_result(self, result):
+        """将单次测试结果计入汇总统计和延迟直方图（实时记录和从结果文件重建报告共用）"""
+        if result.get('client_error'):
+            with self.results_lock:
+                self.client_error_count += 1
+            return
+        success = result.get('success', False)
+        with self.results_lock:
+            self.result_count += 1
+            stats = self.device_stats.get(result['device_ip'])
+            if stats is None:
+                stats = self.device_stats[result['device_ip']] = {
+                    'device_name': result['device_name'],
+                    'machine_room': result['machine_room'],
+                    'total': 0,
+                    'success': 0,
+                    'success_times': new_time_stats(),   # 成功请求的响应时间
+                    'network_times': new_time_stats()    # 所有有响应的请求（含失败）的响应时间
+                }
+            stats['total'] += 1
+            if success:
+                self.success_count += 1
+                stats['success'] += 1
+                accumulate_time(stats['success_times'], result['response_time_ms'])
+            else:
+                error = result.get('error_message', '')
+                self.error_counts[error] = self.error_counts.get(error, 0) + 1
+            if result['response_time_ms'] > 0:
+                accumulate_time(stats['network_times'], result['response_time_ms'])
+
+        if success:
+            self.histograms.record(result['device_ip'], self.endpoint, result['response_time_ms'],
+                                   result['device_name'], result['machine_room'])
+        for key, _ in self.PHASES:
+            if key in result:
+                self.phase_histograms.record(result['device_ip'], key, result[key],
+                                             result['device_name'], result['machine_room'])
+
+    def phase_breakdown_rows(self):
+        """
+        按整体、机房、设备汇总请求各阶段耗时
+
+        Returns:
+            报告行列表，每行包含各阶段均值、P90和占比，以及主要耗时阶段
+        """
+        groups = {}  # (范围, 设备IP, 机房) -> {阶段: LatencyHistogram}
+        for (device_ip, phase), histogram in self.phase_histograms.histograms.items():
+            room = self.phase_histograms.labels.get(device_ip, {}).get('machine_room', 'Unknown')
+            for key in [('全部', '', ''), ('机房', '', room), ('设备', device_ip, room)]:
+                phase_group = groups.setdefault(key, {})
+                phase_group.setdefault(phase, LatencyHistogram(histogram.sub_bucket_bits)).merge(histogram)
+
+        scope_order = {'全部': 0, '机房': 1, '设备': 2}
+        rows = []
+        for (scope, device_ip, room), phase_group in sorted(groups.items(), key=lambda item: (scope_order[item[0][0]], item[0][2], item[0][1])):
+            label = self.phase_histograms.labels.get(device_ip, {})
+            row = {
+                '范围': scope,
+                '设备名称': label.get('device_name', '') if device_ip else '',
+                'IP地址': device_ip,
+                '机房': room,
+                '样本数': max(histogram.total_count for histogram in phase_group.values())
+            }
+            means = {key: phase_group[key].mean() if key in phase_group else 0 for key, _ in self.PHASES}
+            total = sum(means.values())
+            for key, name in self.PHASES:
+                row[f'{name}均值(ms)'] = round(means[key], 2)
+                row[f'{name}P90(ms)'] = round(phase_group[key].percentile(90), 2) if key in phase_group else 0
+                row[f'{name}占比(%)'] = round(means[key] / total * 100, 1) if total else 0
+            row['主要耗时阶段'] = dict(self.PHASES)[max(means, key=means.get)] if total else ''
+            rows.append(row)
+        return rows
+
+    def get_auth_query(self):
+        """生成设备状态接口的认证查询参数（random + md5(共享密钥 + random)）"""
+        random_str = str(int(time.time() * 1000)) + ''.join(random.choices(string.ascii_letters + string.digits, k=8))
+        md5_value = hashlib.md5((self.shared_secret + random_str).encode('utf-8')).hexdigest()
+        return f"_method=GET&random={random_str}&md5={md5_value}"
+
+    def call_status_api(self, device, endpoint, payload):
+        """
+        调用设备状态接口
+
+        Args:
+            device: 设备信息
+            endpoint: 接口路径
+            payload: 请求体
+
+        Returns:
+            响应中的data字段，失败时抛出异常
+        """
+        url = f"http://{device['ip']}:{self.api_port}{endpoint}?{self.get_auth_query()}"
+        status_code, content = self.timed_post(url, payload, {'Content-Type': 'application/json'}, {})
+        if status_code != 200:
+            raise RuntimeError(f"{endpoint} 状态码 {status_code}")
+        data = json.loads(content)
+        if 'data' not in data:
+            raise RuntimeError(f"{endpoint} 响应异常: {data.get('message', '')}")
+        return data['data']
+
+    def get_device_status(self, device, snapshot):
+        """
+        采集设备真实负载状态：吞吐量和在线用户/会话数
+
+        Args:
+            device: 设备信息
+            snapshot: 快照名称（测试前/测试中#n/测试后）
+
+        Returns:
+            设备状态快照
+        """
+        status = {
             'device_name': device['name'],
             'device_ip': device['ip'],
             'machine_room': device['machineRoom'],
-            'cpu_usage': f"{random.randint(20, 80)}%",
-            'memory_usage': f"{random.randint(30, 70)}%",
-            'online_users': random.randint(50, 500),
-            'load_average': f"{random.uniform(0.5, 2.0):.2f}",
-            'disk_usage': f"{random.randint(40, 80)}%",
-            'network_connections': random.randint(100, 1000),
+            'snapshot': snapshot,
+            'send_mbps': None,
+            'recv_mbps': None,
+            'online_users': None,
+            'sessions': None,
+            'users_truncated': False,
+            'top_user_mbps': None,
+            'collect_status': '正常',
+            'error_message': '',
+            'monotonic': time.perf_counter(),
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
-        
-        return device_status
-    
+
+        errors = []
+        try:
+            throughput = self.call_status_api(device, '/v1/status/throughput', {"unit": "bytes", "interface": ""})
+            status['send_mbps'] = round(float(throughput.get('send', 0)) * 8 / 1000000, 3)
+            status['recv_mbps'] = round(float(throughput.get('recv', 0)) * 8 / 1000000, 3)
+        except Exception as e:
+            errors.append(f"吞吐量: {str(e)[:80]}")
+
+        try:
+            users = self.call_status_api(device, '/v1/status/user-rank',
+                                         {"filter": {"top": self.status_user_top, "line": "0"}})
+            status['online_users'] = len(users)
+            status['sessions'] = sum(int(user.get('session', 0)) for user in users)
+            # 用户排行最多返回Top N，达到上限时用户数和会话数只是前N个用户的统计，实际值更大
+            status['users_truncated'] = len(users) >= self.status_user_top
+            status['top_user_mbps'] = round(float(users[0].get('total', 0)) * 8 / 1000000, 3) if users else 0
+        except Exception as e:
+            errors.append(f"用户排行: {str(e)[:80]}")
+
+        if errors:
+            status['collect_status'] = '部分失败' if len(errors) == 1 else '采集失败'
+            status['error_message'] = '; '.join(errors)
+
+        return status
+
+    def collect_status_snapshot(self, devices, snapshot):
+        """
+        并发采集所有设备的状态快照
+
+        Args:
+            devices: 设备列表
+            snapshot: 快照名称
+        """
+        with ThreadPoolExecutor(max_workers=min(self.status_workers, max(1, len(devices)))) as executor:
+            statuses = list(executor.map(lambda device: self.get_device_status(device, snapshot), devices))
+
+        for status in statuses:
+            self.add_status(status)
+            self.write_record('status', status)
+
+        failed = sum(1 for status in statuses if status['collect_status'] != '正常')
+        logging.info(f"设备状态快照[{snapshot}]采集完成: {len(statuses)} 台设备，失败 {failed} 台")
+
+    def add_status(self, status):
+        """保存一条设备状态快照"""
+        self.device_status.append(status)
+        self.status_snapshots.setdefault(status['device_ip'], []).append(status)
+
+    def start_status_sampler(self, devices):
+        """
+        启动测试期间的定时状态采集线程
+
+        Returns:
+            停止采样的函数
+        """
+        stop_event = threading.Event()
+
+        def sampler():
+            index = 1
+            while not stop_event.wait(self.status_interval):
+                self.collect_status_snapshot(devices, f"测试中#{index}")
+                index += 1
+
+        thread = threading.Thread(target=sampler, daemon=True)
+        thread.start()
+
+        def stop():
+            stop_event.set()
+            thread.join()
+
+        return stop
+
+    def iter_results(self):
+        """
+        从结果文件逐行读取测试结果，并关联同一设备时间上最接近的状态快照
+
+        Yields:
+            单次测试结果字典
+        """
+        if not self.results_file or not os.path.exists(self.results_file):
+            return
+        snapshot_times = {ip: [status['monotonic'] for status in snapshots]
+                          for ip, snapshots in self.status_snapshots.items()}
+        with open(self.results_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # 进程中途退出时最后一行可能不完整
+                if record.pop('type', None) != 'result':
+                    continue
+                yield self.tag_result(record, snapshot_times)
+
+    def tag_result(self, result, snapshot_times):
+        """为延迟样本关联同一设备时间上最接近的状态快照"""
+        snapshots = self.status_snapshots.get(result['device_ip'])
+        if not snapshots or 'sent_monotonic' not in result:
+            return result
+        times = snapshot_times[result['device_ip']]
+        position = bisect.bisect(times, result['sent_monotonic'])
+        candidates = [i for i in (position - 1, position) if 0 <= i < len(snapshots)]
+        closest = snapshots[min(candidates, key=lambda i: abs(times[i] - result['sent_monotonic']))]
+        result['status_snapshot'] = closest['snapshot']
+        result['snapshot_offset_s'] = round(result['sent_monotonic'] - closest['monotonic'], 2)
+        result['device_send_mbps'] = closest['send_mbps']
+        result['device_recv_mbps'] = closest['recv_mbps']
+        result['device_online_users'] = closest['online_users']
+        result['device_sessions'] = closest['sessions']
+        result['device_users_truncated'] = closest.get('users_truncated', False)
+        return result
+
+    def load_results_file(self, filename):
+        """
+        从结果文件重建测试配置、设备状态和汇总统计，用于中断后或离线重新生成报告
+
+        Args:
+            filename: 结果文件路径（JSON Lines）
+        """
+        self.results_file = filename
+        self.selected_devices = []
+        with open(filename, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                record_type = record.pop('type', None)
+                if record_type == 'meta':
+                    self.started_at = record['timestamp']
+                    self.selected_devices = record['devices']
+                    self.test_count_per_device = record['test_count_per_device']
+                    self.endpoint = record['endpoint']
+                    self.test_ip = record['test_ip']
+                    self.load_config = record['load_config']
+                elif record_type == 'status':
+                    self.add_status(record)
+                elif record_type == 'result':
+                    self.ingest_result(record)
+                elif record_type == 'end':
+                    self.load_config = record['load_config']
+
+        if self.load_config:
+            # 中断的负载测试没有实际时长，按最后一个请求的完成时间估算
+            if 'actual_duration' not in self.load_config:
+                last_elapsed = max((r.get('elapsed_s', 0) for r in self.iter_results()), default=0)
+                self.load_config['actual_duration'] = round(last_elapsed, 2)
+            self.load_stats = self.calculate_load_statistics(self.load_config['actual_duration'])
+        logging.info(f"已从结果文件加载 {self.result_count} 条测试结果: {filename}")
+
+    def status_correlation_rows(self):
+        """
+        按设备×状态快照汇总延迟，用于分析延迟与设备负载的关系
+
+        Returns:
+            报告行列表
+        """
+        grouped = {}  # (设备IP, 快照名称) -> LatencyHistogram
+        for result in self.iter_results():
+            if 'status_snapshot' in result and result.get('success', False):
+                key = (result['device_ip'], result['status_snapshot'])
+                grouped.setdefault(key, LatencyHistogram()).record(result['response_time_ms'])
+
+        rows = []
+        for ip, snapshots in self.status_snapshots.items():
+            for status in snapshots:
+                latency = grouped.get((ip, status['snapshot']), LatencyHistogram()).summary()
+                rows.append({
+                    '设备名称': status['device_name'],
+                    'IP地址': ip,
+                    '机房': status['machine_room'],
+                    '状态快照': status['snapshot'],
+                    '上行(Mbps)': status['send_mbps'],
+                    '下行(Mbps)': status['recv_mbps'],
+                    f'在线用户数(Top{self.status_user_top})': status['online_users'],
+                    f'会话数(Top{self.status_user_top}用户)': status['sessions'],
+                    '用户排行已截断': '是' if status.get('users_truncated') else '否',
+                    '关联样本数': latency['样本数'],
+                    '平均响应时间(ms)': latency['平均(ms)'],
+                    'P50(ms)': latency['P50(ms)'],
+                    'P99(ms)': latency['P99(ms)']
+                })
+        return rows
+
     def run_performance_test(self):
         """执行性能测试"""
         logging.info("开始IAM Connection接口性能测试")
         logging.info(f"测试设备数量: {len(self.selected_devices)}")
         logging.info(f"每台设备测试次数: {self.test_count_per_device}")
+        self.open_results_stream('single', self.results_file)
         
-        # 收集设备状态信息
+        # 测试前采集设备状态，测试期间定时采集
         logging.info("收集设备状态信息...")
-        for device in self.selected_devices:
-            status = self.get_device_status(device)
-            self.device_status.append(status)
-            logging.info(f"设备 {device['name']} 状态收集完成")
+        self.collect_status_snapshot(self.selected_devices, '测试前')
+        stop_sampler = self.start_status_sampler(self.selected_devices)
         
         # 执行性能测试
         logging.info("开始执行Connection接口性能测试...")
@@ -278,7 +851,7 @@ class ConnectionPerformanceTestFixed:
             for i in range(1, self.test_count_per_device + 1):
                 result = self.test_connection_api(device, i)
                 device_results.append(result)
-                self.test_results.append(result)
+                self.record_result(result)
                 
                 # 测试间隔
                 if i < self.test_count_per_device:
@@ -300,8 +873,380 @@ class ConnectionPerformanceTestFixed:
             else:
                 logging.warning(f"设备 {device['name']} 所有测试均失败")
         
+        # 测试后采集设备状态（生成报告时为延迟样本关联最接近的状态快照）
+        stop_sampler()
+        self.collect_status_snapshot(self.selected_devices, '测试后')
+        self.close_results_stream()
+        self.record_sampling_run()
+
         logging.info("性能测试完成")
-    
+
+    @staticmethod
+    def slot_offset(n, target_rps, ramp_up):
+        """第n个请求相对压测开始的计划发送时刻（秒），爬坡期速率从0线性增长到target_rps"""
+        # 爬坡期累计请求数 N(t) = rps * t^2 / (2 * ramp_up)
+        ramp_requests = target_rps * ramp_up / 2
+        if n < ramp_requests:
+            return (2 * ramp_up * n / target_rps) ** 0.5
+        return ramp_up + (n - ramp_requests) / target_rps
+
+    def run_load_test(self, concurrency=50, target_rps=None, ramp_up=0, duration=60, max_devices=None,
+                      backend='thread', pool_size=8):
+        """
+        执行负载测试：对所有在线设备并发压测Connection接口
+
+        Args:
+            concurrency: 并发数（thread后端为工作线程数，async后端为协程数）
+            target_rps: 目标总请求速率（次/秒），None表示不限速（闭环压测）
+            ramp_up: 爬坡时间（秒），限速时线性提升速率，不限速时逐步启动工作线程
+            duration: 压测持续时间（秒，含爬坡时间）
+            max_devices: 最多压测的设备数，None表示所有在线设备
+            backend: thread 阻塞式请求（每次新建连接），async 异步请求（每台设备keep-alive连接池）
+            pool_size: async后端每台设备的最大连接数
+        """
+        devices = self.load_device_list()
+        if max_devices and max_devices < len(devices):
+            # 限制设备数时按机房和带宽等级分层抽样，而不是取清单前N台
+            devices = self.select_test_devices(max_devices)
+        else:
+            self.sampler = DeviceSampler(devices, self.sampling_state_file, self.sample_seed, self.stratify)
+        if not devices:
+            logging.error("没有可用的在线设备，负载测试终止")
+            return
+
+        self.selected_devices = devices
+        self.log_each_request = False
+        self.load_config = {
+            'concurrency': concurrency,
+            'target_rps': target_rps,
+            'ramp_up': ramp_up,
+            'duration': duration,
+            'device_count': len(devices),
+            'backend': backend,
+            'pool_size': pool_size if backend == 'async' else None
+        }
+
+        logging.info("开始IAM Connection接口负载测试")
+        logging.info(f"压测设备数量: {len(devices)}，并发数: {concurrency}，"
+                     f"目标速率: {target_rps or '不限速'} 次/秒，爬坡: {ramp_up}秒，持续: {duration}秒，"
+                     f"请求后端: {backend}")
+        self.open_results_stream('load', self.results_file)
+
+        # 测试前采集设备状态，测试期间定时采集
+        self.collect_status_snapshot(devices, '测试前')
+        stop_sampler = self.start_status_sampler(devices)
+
+        start = time.monotonic()
+        if backend == 'async':
+            asyncio.run(self.run_async_workers(devices, concurrency, target_rps, ramp_up, duration, pool_size))
+        else:
+            self.run_thread_workers(devices, concurrency, target_rps, ramp_up, duration)
+
+        actual_duration = time.monotonic() - start
+        self.load_config['actual_duration'] = round(actual_duration, 2)
+
+        # 测试后采集设备状态（生成报告时为延迟样本关联最接近的状态快照）
+        stop_sampler()
+        self.collect_status_snapshot(devices, '测试后')
+        self.close_results_stream()
+        self.record_sampling_run()
+        self.load_stats = self.calculate_load_statistics(actual_duration)
+
+        overall = self.load_stats['overall'][0]
+        logging.info(f"负载测试完成: {overall['请求数']} 次请求，吞吐量 {overall['吞吐量(次/秒)']} 次/秒，"
+                     f"P50 {overall['P50(ms)']}ms，P99 {overall['P99(ms)']}ms")
+
+    def run_thread_workers(self, devices, concurrency, target_rps, ramp_up, duration):
+        """阻塞式后端：每个工作线程循环发送请求（每次请求新建连接）"""
+        state = {
+            'next_device': 0,
+            'scheduled': 0,
+            'sequence': 0
+        }
+        state_lock = threading.Lock()
+        start = time.monotonic()
+        end = start + duration
+
+        def wait_for_slot():
+            """按目标速率（含线性爬坡）分配第n个请求的发送时刻，返回False表示压测已结束"""
+            with state_lock:
+                n = state['scheduled']
+                state['scheduled'] += 1
+            slot = start + self.slot_offset(n, target_rps, ramp_up)
+            if slot >= end:
+                return False
+            delay = slot - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            return True
+
+        def next_device():
+            """轮询分配设备，保证每台设备负载均匀"""
+            with state_lock:
+                device = devices[state['next_device'] % len(devices)]
+                state['next_device'] += 1
+                state['sequence'] += 1
+                return device, state['sequence']
+
+        def worker(worker_index):
+            if not target_rps and ramp_up > 0:
+                time.sleep(worker_index * ramp_up / concurrency)
+            while time.monotonic() < end:
+                if target_rps and not wait_for_slot():
+                    break
+                device, sequence = next_device()
+                result = self.test_connection_api(device, sequence)
+                result['elapsed_s'] = round(time.monotonic() - start, 3)
+                self.record_result(result)
+
+        workers = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+        for thread in workers:
+            thread.start()
+
+        # 每10秒输出一次进度
+        while any(thread.is_alive() for thread in workers):
+            time.sleep(min(10, max(0.1, end - time.monotonic())))
+            with self.results_lock:
+                completed = self.result_count
+            logging.info(f"负载测试进度: {min(time.monotonic() - start, duration):.0f}/{duration}秒，已完成 {completed} 次请求")
+
+    async def run_async_workers(self, devices, concurrency, target_rps, ramp_up, duration, pool_size):
+        """
+        异步后端：在单个事件循环中运行 concurrency 个请求协程，每台设备使用独立的keep-alive连接池
+
+        并发数可以达到数千，受每台设备连接数（pool_size × 设备数）和文件描述符上限约束
+        """
+        limit = raise_open_file_limit(min(concurrency, pool_size * len(devices)) + 256)
+        if limit is not None and limit < min(concurrency, pool_size * len(devices)):
+            logging.warning(f"文件描述符上限 {limit} 低于最大连接数，部分连接可能建立失败")
+
+        pool = AsyncConnectionPool(pool_size, self.timeout)
+        state = {
+            'next_device': 0,
+            'scheduled': 0
+        }
+        start = time.monotonic()
+        end = start + duration
+
+        async def worker(worker_index):
+            if not target_rps and ramp_up > 0:
+                await asyncio.sleep(worker_index * ramp_up / concurrency)
+            while time.monotonic() < end:
+                if target_rps:
+                    # 单线程事件循环内分配序号无需加锁
+                    slot = start + self.slot_offset(state['scheduled'], target_rps, ramp_up)
+                    state['scheduled'] += 1
+                    if slot >= end:
+                        break
+                    delay = slot - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                # 轮询分配设备，保证每台设备负载均匀
+                device = devices[state['next_device'] % len(devices)]
+                state['next_device'] += 1
+                result = await self.async_test_connection_api(pool, device, state['next_device'])
+                result['elapsed_s'] = round(time.monotonic() - start, 3)
+                self.record_result(result)
+
+        async def progress():
+            # 每10秒输出一次进度
+            while True:
+                await asyncio.sleep(min(10, max(0.1, end - time.monotonic())))
+                logging.info(f"负载测试进度: {min(time.monotonic() - start, duration):.0f}/{duration}秒，"
+                             f"已完成 {self.result_count} 次请求")
+
+        reporter = asyncio.create_task(progress())
+        try:
+            await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        finally:
+            reporter.cancel()
+            await pool.close()
+        logging.info(f"异步连接池: 新建连接 {pool.stats['connections_opened']} 个，"
+                     f"复用连接 {pool.stats['connections_reused']} 次，"
+                     f"等待连接超时 {pool.stats['pool_timeouts']} 次")
+
+    def summarize_load_group(self, total, success_count, duration, histogram):
+        """汇总一组负载测试结果的吞吐量和延迟分位数（分位数来自延迟直方图）"""
+        latency = histogram.summary()
+        return {
+            '请求数': total,
+            '成功数': success_count,
+            '失败数': total - success_count,
+            '成功率(%)': round(success_count / total * 100, 2) if total else 0,
+            '请求速率(次/秒)': round(total / duration, 2) if duration else 0,
+            '吞吐量(次/秒)': round(success_count / duration, 2) if duration else 0,
+            '平均响应时间(ms)': latency['平均(ms)'],
+            'P50(ms)': latency['P50(ms)'],
+            'P90(ms)': latency['P90(ms)'],
+            'P99(ms)': latency['P99(ms)'],
+            'P99.9(ms)': latency['P99.9(ms)'],
+            '最大响应时间(ms)': latency['最大(ms)']
+        }
+
+    def calculate_load_statistics(self, duration):
+        """
+        按设备、机房和整体计算负载测试统计（基于增量汇总统计和延迟直方图）
+
+        Args:
+            duration: 实际压测时长（秒）
+
+        Returns:
+            {'devices': [...], 'machine_rooms': [...], 'overall': [...]}
+        """
+        room_histograms = self.histograms.combined('machine_room')
+        empty = LatencyHistogram()
+
+        device_stats = []
+        by_room = {}
+        for ip, stats in self.device_stats.items():
+            row = {'设备名称': stats['device_name'], 'IP地址': ip, '机房': stats['machine_room']}
+            histogram = self.histograms.histograms.get((ip, self.endpoint), empty)
+            row.update(self.summarize_load_group(stats['total'], stats['success'], duration, histogram))
+            device_stats.append(row)
+
+            room = by_room.setdefault(stats['machine_room'], {'devices': 0, 'total': 0, 'success': 0})
+            room['devices'] += 1
+            room['total'] += stats['total']
+            room['success'] += stats['success']
+
+        room_stats = []
+        for room, counts in sorted(by_room.items()):
+            row = {'机房': room, '设备数': counts['devices']}
+            row.update(self.summarize_load_group(counts['total'], counts['success'], duration,
+                                                 room_histograms.get(room, empty)))
+            room_stats.append(row)
+
+        overall = {'范围': '全部设备', '设备数': len(self.device_stats)}
+        overall.update(self.summarize_load_group(self.result_count, self.success_count, duration,
+                                                 self.histograms.combined().get('全部', empty)))
+
+        return {'devices': device_stats, 'machine_rooms': room_stats, 'overall': [overall]}
+
+    def device_time_stats(self, device_ip):
+        """
+        设备响应时间统计：有成功请求时统计成功请求，否则统计所有有响应的请求
+
+        Returns:
+            (测试次数, 成功次数, 平均值, 最小值, 最大值, 标准差, 是否有响应)
+        """
+        stats = self.device_stats.get(device_ip)
+        if stats is None:
+            return 0, 0, 0, 0, 0, 0, False
+        times = stats['success_times'] if stats['success'] else stats['network_times']
+        return (stats['total'], stats['success']) + summarize_times(times) + (times['count'] > 0,)
+
+    def network_time_stats(self):
+        """合并所有设备有响应请求（含失败）的响应时间累计统计"""
+        merged = new_time_stats()
+        for stats in self.device_stats.values():
+            times = stats['network_times']
+            if not times['count']:
+                continue
+            merged['count'] += times['count']
+            merged['sum'] += times['sum']
+            merged['sumsq'] += times['sumsq']
+            merged['min'] = times['min'] if merged['min'] is None else min(merged['min'], times['min'])
+            merged['max'] = times['max'] if merged['max'] is None else max(merged['max'], times['max'])
+        return merged
+
+    def top_errors(self, limit):
+        """出现次数最多的错误信息列表 [(错误信息, 次数)]"""
+        errors = [(error, count) for error, count in self.error_counts.items() if error]
+        return sorted(errors, key=lambda item: -item[1])[:limit]
+
+    def store_device_rows(self):
+        """生成写入结果库的设备统计（成功请求的响应时间累计和延迟直方图）"""
+        rows = []
+        for ip, stats in self.device_stats.items():
+            times = stats['success_times']
+            rows.append({
+                'device_ip': ip,
+                'device_name': stats['device_name'],
+                'machine_room': stats['machine_room'],
+                'total': stats['total'],
+                'success': stats['success'],
+                'latency_count': times['count'],
+                'latency_sum': times['sum'],
+                'latency_sumsq': times['sumsq'],
+                'histogram': self.histograms.histograms.get((ip, self.endpoint), LatencyHistogram())
+            })
+        return rows
+
+    def save_to_store(self, store, rebuilt=False):
+        """
+        将本次测试的设备统计保存到结果库
+
+        Args:
+            store: PerformanceResultStore实例
+            rebuilt: 是否为 --from-results 从结果文件重建的运行；该运行已保存过时沿用原运行ID，不重复保存
+
+        Returns:
+            运行ID
+        """
+        load_config = self.load_config or {}
+        results_file = os.path.abspath(self.results_file) if self.results_file else None
+        if rebuilt:
+            existing = store.find_run(results_file, self.started_at)
+            if existing is not None:
+                self.run_id = existing
+                logging.info(f"该运行已在结果库中（运行ID {existing}），不重复保存")
+                return self.run_id
+        self.run_id = store.save_run({
+            'started_at': self.started_at,
+            'mode': 'load' if self.load_config else 'single',
+            'endpoint': self.endpoint,
+            'results_file': results_file,
+            'device_count': len(self.selected_devices),
+            'request_count': self.result_count,
+            'success_count': self.success_count,
+            'concurrency': load_config.get('concurrency'),
+            'target_rps': load_config.get('target_rps'),
+            'duration_s': load_config.get('actual_duration')
+        }, self.store_device_rows())
+        logging.info(f"测试结果已保存到结果库: {store.db_path}（运行ID {self.run_id}）")
+        return self.run_id
+
+    def compare_with_store(self, store, baseline_run=None, baseline_count=7):
+        """
+        与历史运行对比：指定运行，或同模式最近 baseline_count 次运行合并的滚动基线
+
+        Args:
+            store: PerformanceResultStore实例
+            baseline_run: 基线运行ID，None表示使用滚动基线
+            baseline_count: 滚动基线包含的运行次数
+
+        Returns:
+            对比报告行列表，没有可用基线时返回None
+        """
+        if baseline_run is not None:
+            baseline_ids = [baseline_run]
+            self.comparison_label = f"运行 {baseline_run}"
+        else:
+            mode = 'load' if self.load_config else 'single'
+            baseline_ids = store.baseline_run_ids(self.run_id, baseline_count, mode)
+            self.comparison_label = f"最近 {len(baseline_ids)} 次运行（{baseline_ids}）"
+        if not baseline_ids:
+            logging.info("结果库中没有可对比的历史运行")
+            return None
+
+        self.comparison_rows = compare_stats(store.load_device_stats(baseline_ids),
+                                             store.load_device_stats([self.run_id]))
+        return self.comparison_rows
+
+    def comparison_summary(self):
+        """对比结论汇总行（显著变慢的机房和设备）"""
+        if not self.comparison_rows:
+            return []
+        slower = [row for row in self.comparison_rows if row['结论'] == '显著变慢']
+        faster = [row for row in self.comparison_rows if row['结论'] == '显著变快']
+        lines = [f"- 对比基线: {self.comparison_label}",
+                 f"- 显著变慢: {len(slower)} 项，显著变快: {len(faster)} 项"]
+        for row in slower[:5]:
+            name = row['设备名称'] or row['机房']
+            lines.append(f"- {row['范围']} {name}: 均值 {row['基线均值(ms)']}ms -> {row['本次均值(ms)']}ms "
+                         f"({row['均值变化(%)']:+}%), P99 {row['基线P99(ms)']}ms -> {row['本次P99(ms)']}ms")
+        return lines
+
     def generate_simple_report(self):
         """生成简单的文本报告"""
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -312,33 +1257,69 @@ class ConnectionPerformanceTestFixed:
             f.write("="*50 + "\n")
             f.write(f"测试时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
             f.write(f"测试设备数: {len(self.selected_devices)}\n")
-            f.write(f"总测试次数: {len(self.test_results)}\n\n")
+            f.write(f"总测试次数: {self.result_count}\n")
+            if self.client_error_count:
+                f.write(f"客户端等待连接超时: {self.client_error_count}次（请求未发出，不计入测试次数）\n")
+            f.write(f"结果文件: {self.results_file}\n\n")
             
             f.write("测试设备信息:\n")
             f.write("-" * 50 + "\n")
             for device in self.selected_devices:
                 f.write(f"设备: {device['name']} ({device['ip']}) - {device['machineRoom']}\n")
             
+            if self.sampling_coverage:
+                f.write(f"最近{self.coverage_window_days}天设备覆盖率: {self.sampling_coverage['covered']}/"
+                        f"{self.sampling_coverage['total']} ({self.sampling_coverage['coverage_pct']}%)\n")
+            
             f.write("\n设备状态信息:\n")
             f.write("-" * 50 + "\n")
             for status in self.device_status:
-                f.write(f"{status['device_name']}: CPU {status['cpu_usage']}, "
-                       f"内存 {status['memory_usage']}, 在线用户 {status['online_users']}\n")
+                f.write(f"{status['device_name']} [{status['snapshot']}]: 上行 {status['send_mbps']}Mbps, "
+                       f"下行 {status['recv_mbps']}Mbps, 在线用户 {status['online_users']}, "
+                       f"会话 {status['sessions']}"
+                       f"{f'(已达Top{self.status_user_top}上限，实际更多)' if status.get('users_truncated') else ''}, "
+                       f"{status['collect_status']}\n")
             
             f.write("\n测试结果统计:\n")
             f.write("-" * 50 + "\n")
             for device in self.selected_devices:
-                device_results = [r for r in self.test_results if r['device_name'] == device['name']]
-                success_results = [r for r in device_results if r.get('success', False)]
-                
-                success_rate = len(success_results) / len(device_results) * 100 if device_results else 0
-                avg_time = statistics.mean([r['response_time_ms'] for r in success_results]) if success_results else 0
+                total, success, avg_time, _, _, _, _ = self.device_time_stats(device['ip'])
+                success_rate = success / total * 100 if total else 0
+                avg_time = avg_time if success else 0
                 
                 f.write(f"{device['name']}: 成功率 {success_rate:.1f}%, 平均响应时间 {avg_time:.2f}ms\n")
+
+            f.write("\n延迟分位数:\n")
+            f.write("-" * 50 + "\n")
+            for row in self.histograms.summary_rows():
+                scope = row['设备名称'] or row['机房'] or row['范围']
+                f.write(f"{scope}: 样本 {row['样本数']}, P50 {row['P50(ms)']}ms, P90 {row['P90(ms)']}ms, "
+                       f"P99 {row['P99(ms)']}ms, P99.9 {row['P99.9(ms)']}ms\n")
+
+            f.write("\n阶段耗时分析（均值）:\n")
+            f.write("-" * 50 + "\n")
+            for row in self.phase_breakdown_rows():
+                scope = row['设备名称'] or row['机房'] or row['范围']
+                phases = ", ".join(f"{name} {row[f'{name}均值(ms)']}ms({row[f'{name}占比(%)']}%)" for _, name in self.PHASES)
+                f.write(f"{scope}: {phases}; 主要耗时: {row['主要耗时阶段']}\n")
+
+            if self.load_stats:
+                f.write("\n负载测试统计（按机房）:\n")
+                f.write("-" * 50 + "\n")
+                for row in self.load_stats['overall'] + self.load_stats['machine_rooms']:
+                    f.write(f"{row.get('机房', row.get('范围'))}: 请求 {row['请求数']} 次, "
+                           f"吞吐量 {row['吞吐量(次/秒)']} 次/秒, 成功率 {row['成功率(%)']}%, "
+                           f"P50 {row['P50(ms)']}ms, P90 {row['P90(ms)']}ms, P99 {row['P99(ms)']}ms\n")
             
+            if self.comparison_rows:
+                f.write("\n与历史运行对比:\n")
+                f.write("-" * 50 + "\n")
+                for line in self.comparison_summary():
+                    f.write(line[2:] + "\n")
+
             f.write("\n详细测试数据:\n")
             f.write("-" * 50 + "\n")
-            for result in self.test_results:
+            for result in self.iter_results():
                 f.write(f"{result['device_name']} 测试{result['test_number']}: "
                        f"{result['response_time_ms']:.2f}ms - "
                        f"{'成功' if result.get('success', False) else '失败'}")
@@ -366,11 +1347,31 @@ class ConnectionPerformanceTestFixed:
                 '测试时间': [datetime.now().strftime('%Y-%m-%d %H:%M:%S')],
                 '测试设备数量': [len(self.selected_devices)],
                 '每设备测试次数': [self.test_count_per_device],
-                '总测试次数': [len(self.test_results)],
+                '总测试次数': [self.result_count],
+                '客户端等待连接超时': [self.client_error_count],
                 '测试接口': ['/v1/conntections'],
                 '测试IP': [self.test_ip],
-                '测试状态': ['完成']
+                '测试状态': ['完成'],
+                '结果文件': [self.results_file],
+                '结果库运行ID': [self.run_id or '未保存'],
+                '设备抽样': [f"分层({self.stratify})，种子 {self.sample_seed if self.sample_seed is not None else '随机'}"]
             }
+            if self.sampling_coverage:
+                overview_data[f'最近{self.coverage_window_days}天设备覆盖率'] = [
+                    f"{self.sampling_coverage['covered']}/{self.sampling_coverage['total']} "
+                    f"({self.sampling_coverage['coverage_pct']}%)"]
+            if self.result_count > self.excel_detail_limit:
+                overview_data['详细结果说明'] = [f'详细测试结果只包含前 {self.excel_detail_limit} 条，完整结果见结果文件']
+            if self.load_config:
+                overview_data['测试模式'] = ['负载测试']
+                overview_data['每设备测试次数'] = ['轮询分配']
+                overview_data['并发数'] = [self.load_config['concurrency']]
+                overview_data['请求后端'] = [self.load_config.get('backend', 'thread')]
+                if self.load_config.get('pool_size'):
+                    overview_data['每设备连接数'] = [self.load_config['pool_size']]
+                overview_data['目标速率(次/秒)'] = [self.load_config['target_rps'] or '不限速']
+                overview_data['爬坡时间(秒)'] = [self.load_config['ramp_up']]
+                overview_data['实际压测时长(秒)'] = [self.load_config['actual_duration']]
 
             # 设备信息
             device_info = []
@@ -392,16 +1393,23 @@ class ConnectionPerformanceTestFixed:
                     '设备名称': status['device_name'],
                     'IP地址': status['device_ip'],
                     '机房': status['machine_room'],
-                    'CPU使用率': status['cpu_usage'],
-                    '内存使用率': status['memory_usage'],
-                    '在线用户数': status['online_users'],
-                    '负载状态': '正常',
-                    '测试时间': status['timestamp']
+                    '状态快照': status['snapshot'],
+                    '上行(Mbps)': status['send_mbps'],
+                    '下行(Mbps)': status['recv_mbps'],
+                    f'在线用户数(Top{self.status_user_top})': status['online_users'],
+                    f'会话数(Top{self.status_user_top}用户)': status['sessions'],
+                    '用户排行已截断': '是' if status.get('users_truncated') else '否',
+                    'Top1用户流速(Mbps)': status['top_user_mbps'],
+                    '采集状态': status['collect_status'],
+                    '错误信息': status['error_message'],
+                    '采集时间': status['timestamp']
                 })
 
             # 详细测试结果
             test_results_data = []
-            for result in self.test_results:
+            for result in self.iter_results():
+                if len(test_results_data) >= self.excel_detail_limit:
+                    break
                 test_results_data.append({
                     '设备名称': result['device_name'],
                     'IP地址': result['device_ip'],
@@ -413,41 +1421,40 @@ class ConnectionPerformanceTestFixed:
                     '错误信息': result.get('error_message', ''),
                     '连接数': result.get('connection_count', 0),
                     '响应大小(bytes)': result.get('response_size_bytes', 0),
+                    **{f'{name}(ms)': result.get(key, '') for key, name in self.PHASES},
+                    '状态快照': result.get('status_snapshot', ''),
+                    '距快照(秒)': result.get('snapshot_offset_s', ''),
+                    '设备上行(Mbps)': result.get('device_send_mbps', ''),
+                    '设备下行(Mbps)': result.get('device_recv_mbps', ''),
+                    f'设备在线用户数(Top{self.status_user_top})': result.get('device_online_users', ''),
+                    f'设备会话数(Top{self.status_user_top}用户)': result.get('device_sessions', ''),
+                    '用户排行已截断': '是' if result.get('device_users_truncated') else '否',
                     '测试时间': result['timestamp']
                 })
 
             # 性能统计分析
             stats_data = []
             for device in self.selected_devices:
-                device_results = [r for r in self.test_results if r['device_name'] == device['name']]
-                success_results = [r for r in device_results if r.get('success', False)]
-
-                if success_results:
-                    response_times = [r['response_time_ms'] for r in success_results]
-                    avg_time = statistics.mean(response_times)
-                    min_time = min(response_times)
-                    max_time = max(response_times)
-                    std_dev = statistics.stdev(response_times) if len(response_times) > 1 else 0
-                else:
-                    response_times = [r['response_time_ms'] for r in device_results if r['response_time_ms'] > 0]
-                    avg_time = statistics.mean(response_times) if response_times else 0
-                    min_time = min(response_times) if response_times else 0
-                    max_time = max(response_times) if response_times else 0
-                    std_dev = statistics.stdev(response_times) if len(response_times) > 1 else 0
+                total, success, avg_time, min_time, max_time, std_dev, has_times = self.device_time_stats(device['ip'])
 
+                latency = self.histograms.histograms.get((device['ip'], self.endpoint), LatencyHistogram()).summary()
                 stats_data.append({
                     '设备名称': device['name'],
                     'IP地址': device['ip'],
                     '机房': device['machineRoom'],
-                    '测试次数': len(device_results),
-                    '成功次数': len(success_results),
-                    '失败次数': len(device_results) - len(success_results),
-                    '成功率(%)': round(len(success_results) / len(device_results) * 100, 2) if device_results else 0,
+                    '测试次数': total,
+                    '成功次数': success,
+                    '失败次数': total - success,
+                    '成功率(%)': round(success / total * 100, 2) if total else 0,
                     '平均响应时间(ms)': round(avg_time, 2),
                     '最小响应时间(ms)': round(min_time, 2),
                     '最大响应时间(ms)': round(max_time, 2),
                     '响应时间标准差(ms)': round(std_dev, 2),
-                    '网络连通性': '良好' if response_times else '异常'
+                    'P50(ms)': latency['P50(ms)'],
+                    'P90(ms)': latency['P90(ms)'],
+                    'P99(ms)': latency['P99(ms)'],
+                    'P99.9(ms)': latency['P99.9(ms)'],
+                    '网络连通性': '良好' if has_times else '异常'
                 })
 
             # 创建Excel文件
@@ -459,6 +1466,25 @@ class ConnectionPerformanceTestFixed:
                 pd.DataFrame(test_results_data).to_excel(writer, sheet_name='详细测试结果', index=False)
                 pd.DataFrame(stats_data).to_excel(writer, sheet_name='性能统计分析', index=False)
 
+                # 延迟分位数（HDR直方图）
+                pd.DataFrame(self.histograms.summary_rows()).to_excel(writer, sheet_name='延迟分位数', index=False)
+
+                # 请求阶段耗时分析
+                pd.DataFrame(self.phase_breakdown_rows()).to_excel(writer, sheet_name='阶段耗时分析', index=False)
+
+                # 延迟与设备负载关联分析
+                pd.DataFrame(self.status_correlation_rows()).to_excel(writer, sheet_name='负载关联分析', index=False)
+
+                # 与历史运行的性能对比
+                if self.comparison_rows:
+                    pd.DataFrame(self.comparison_rows).to_excel(writer, sheet_name='性能对比', index=False)
+
+                # 负载测试统计
+                if self.load_stats:
+                    pd.DataFrame(self.load_stats['overall'] + self.load_stats['machine_rooms']).to_excel(
+                        writer, sheet_name='负载测试-机房', index=False)
+                    pd.DataFrame(self.load_stats['devices']).to_excel(writer, sheet_name='负载测试-设备', index=False)
+
                 # 添加测试总结
                 summary_data = self.generate_test_summary()
                 pd.DataFrame({'测试总结': summary_data}).to_excel(writer, sheet_name='测试总结', index=False)
@@ -477,40 +1503,63 @@ class ConnectionPerformanceTestFixed:
         filename = f'IAM_Connection_Performance_Report_{timestamp}.csv'
 
         try:
-            # 准备CSV数据
-            csv_data = []
-            csv_data.append(['测试报告', 'IAM设备Connection接口性能测试'])
-            csv_data.append(['测试时间', datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
-            csv_data.append(['测试设备数量', len(self.selected_devices)])
-            csv_data.append(['总测试次数', len(self.test_results)])
-            csv_data.append([])  # 空行
-
-            # 设备信息
-            csv_data.append(['设备信息'])
-            csv_data.append(['设备名称', 'IP地址', '机房', '带宽等级', '代理端口'])
-            for device in self.selected_devices:
-                csv_data.append([
-                    device['name'], device['ip'], device['machineRoom'],
-                    device.get('bandwidth', 'N/A'), device.get('proxyPort', 'N/A')
-                ])
-            csv_data.append([])  # 空行
-
-            # 测试结果
-            csv_data.append(['详细测试结果'])
-            csv_data.append(['设备名称', 'IP地址', '机房', '测试次数', '响应时间(ms)', '状态码', '测试结果', '错误信息', '测试时间'])
-            for result in self.test_results:
-                csv_data.append([
-                    result['device_name'], result['device_ip'], result['machine_room'],
-                    result['test_number'], result['response_time_ms'], result['status_code'],
-                    '成功' if result.get('success', False) else '失败',
-                    result.get('error_message', ''), result['timestamp']
-                ])
-
-            # 写入CSV文件
             import csv
             with open(filename, 'w', newline='', encoding='utf-8-sig') as csvfile:
                 writer = csv.writer(csvfile)
-                writer.writerows(csv_data)
+                writer.writerow(['测试报告', 'IAM设备Connection接口性能测试'])
+                writer.writerow(['测试时间', datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
+                writer.writerow(['测试设备数量', len(self.selected_devices)])
+                writer.writerow(['总测试次数', self.result_count])
+                writer.writerow(['客户端等待连接超时', self.client_error_count])
+                writer.writerow(['结果文件', self.results_file])
+                writer.writerow([])  # 空行
+
+                # 设备信息
+                writer.writerow(['设备信息'])
+                writer.writerow(['设备名称', 'IP地址', '机房', '带宽等级', '代理端口'])
+                for device in self.selected_devices:
+                    writer.writerow([
+                        device['name'], device['ip'], device['machineRoom'],
+                        device.get('bandwidth', 'N/A'), device.get('proxyPort', 'N/A')
+                    ])
+                writer.writerow([])  # 空行
+
+                # 测试结果（从结果文件逐行写入）
+                writer.writerow(['详细测试结果'])
+                writer.writerow(['设备名称', 'IP地址', '机房', '测试次数', '响应时间(ms)', '状态码', '测试结果', '错误信息']
+                                + [f'{name}(ms)' for _, name in self.PHASES] + ['测试时间'])
+                for result in self.iter_results():
+                    writer.writerow([
+                        result['device_name'], result['device_ip'], result['machine_room'],
+                        result['test_number'], result['response_time_ms'], result['status_code'],
+                        '成功' if result.get('success', False) else '失败',
+                        result.get('error_message', '')
+                    ] + [result.get(key, '') for key, _ in self.PHASES] + [result['timestamp']])
+
+                # 延迟分位数（HDR直方图）和请求阶段耗时
+                for title, rows in [('延迟分位数', self.histograms.summary_rows()),
+                                    ('阶段耗时分析', self.phase_breakdown_rows()),
+                                    ('负载关联分析', self.status_correlation_rows()),
+                                    ('性能对比', self.comparison_rows or [])]:
+                    if rows:
+                        writer.writerow([])  # 空行
+                        writer.writerow([title])
+                        headers = list(rows[0].keys())
+                        writer.writerow(headers)
+                        for row in rows:
+                            writer.writerow([row.get(h, '') for h in headers])
+
+                # 负载测试统计
+                if self.load_stats:
+                    for title, rows in [('负载测试统计（按机房）', self.load_stats['overall'] + self.load_stats['machine_rooms']),
+                                        ('负载测试统计（按设备）', self.load_stats['devices'])]:
+                        writer.writerow([])  # 空行
+                        writer.writerow([title])
+                        if rows:
+                            headers = list(rows[-1].keys())
+                            writer.writerow(headers)
+                            for row in rows:
+                                writer.writerow([row.get(h, '') for h in headers])
 
             logging.info(f"CSV报告已生成: {filename}")
             return filename
@@ -526,54 +1575,88 @@ class ConnectionPerformanceTestFixed:
             "",
             f"测试时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
             f"测试设备数: {len(self.selected_devices)}",
-            f"总测试次数: {len(self.test_results)}",
+            f"总测试次数: {self.result_count}",
+            f"客户端等待连接超时: {self.client_error_count}次（不计入测试次数）",
+            f"结果文件: {self.results_file}",
             "",
             "主要发现:",
         ]
 
         # 统计成功失败情况
-        success_count = sum(1 for r in self.test_results if r.get('success', False))
-        failure_count = len(self.test_results) - success_count
+        success_count = self.success_count
+        failure_count = self.result_count - success_count
 
         summary.extend([
             f"- 成功测试: {success_count}次",
             f"- 失败测试: {failure_count}次",
-            f"- 成功率: {success_count/len(self.test_results)*100:.1f}%" if self.test_results else "- 成功率: 0%"
+            f"- 成功率: {success_count/self.result_count*100:.1f}%" if self.result_count else "- 成功率: 0%"
         ])
 
-        # 响应时间分析
+        # 响应时间分析（分位数来自延迟直方图，避免尾延迟被平均值掩盖）
         if success_count > 0:
-            response_times = [r['response_time_ms'] for r in self.test_results if r.get('success', False)]
+            latency = self.histograms.combined()['全部'].summary()
             summary.extend([
                 "",
                 "响应时间分析:",
-                f"- 平均响应时间: {statistics.mean(response_times):.2f}ms",
-                f"- 最快响应: {min(response_times):.2f}ms",
-                f"- 最慢响应: {max(response_times):.2f}ms"
+                f"- 平均响应时间: {latency['平均(ms)']:.2f}ms",
+                f"- 最快响应: {latency['最小(ms)']:.2f}ms",
+                f"- 最慢响应: {latency['最大(ms)']:.2f}ms",
+                f"- 分位数: P50 {latency['P50(ms)']:.2f}ms, P90 {latency['P90(ms)']:.2f}ms, "
+                f"P99 {latency['P99(ms)']:.2f}ms, P99.9 {latency['P99.9(ms)']:.2f}ms"
             ])
+            for room, histogram in sorted(self.histograms.combined('machine_room').items()):
+                room_latency = histogram.summary()
+                summary.append(f"- {room}: P50 {room_latency['P50(ms)']:.2f}ms, P99 {room_latency['P99(ms)']:.2f}ms, "
+                               f"P99.9 {room_latency['P99.9(ms)']:.2f}ms")
         else:
             # 即使失败也分析网络响应时间
-            response_times = [r['response_time_ms'] for r in self.test_results if r['response_time_ms'] > 0]
-            if response_times:
+            network_times = self.network_time_stats()
+            if network_times['count']:
+                avg_time, min_time, max_time, _ = summarize_times(network_times)
                 summary.extend([
                     "",
                     "网络响应时间分析:",
-                    f"- 平均网络响应时间: {statistics.mean(response_times):.2f}ms",
-                    f"- 最快网络响应: {min(response_times):.2f}ms",
-                    f"- 最慢网络响应: {max(response_times):.2f}ms"
+                    f"- 平均网络响应时间: {avg_time:.2f}ms",
+                    f"- 最快网络响应: {min_time:.2f}ms",
+                    f"- 最慢网络响应: {max_time:.2f}ms"
                 ])
 
-        # 错误分析
-        error_messages = [r.get('error_message', '') for r in self.test_results if not r.get('success', False)]
-        if error_messages:
-            unique_errors = list(set(error_messages))
+        # 阶段耗时分析
+        phase_rows = [row for row in self.phase_breakdown_rows() if row['范围'] == '全部']
+        if phase_rows:
+            row = phase_rows[0]
+            summary.extend([
+                "",
+                "阶段耗时分析:",
+                "- " + ", ".join(f"{name} {row[f'{name}均值(ms)']}ms ({row[f'{name}占比(%)']}%)" for _, name in self.PHASES),
+                f"- 主要耗时阶段: {row['主要耗时阶段']}"
+            ])
+
+        # 负载测试分析
+        if self.load_stats:
+            overall = self.load_stats['overall'][0]
+            summary.extend([
+                "",
+                "负载测试分析:",
+                f"- 并发数: {self.load_config['concurrency']}, 目标速率: {self.load_config['target_rps'] or '不限速'} 次/秒",
+                f"- 实际吞吐量: {overall['吞吐量(次/秒)']} 次/秒",
+                f"- 延迟分位数: P50 {overall['P50(ms)']}ms, P90 {overall['P90(ms)']}ms, P99 {overall['P99(ms)']}ms",
+            ])
+            for room in self.load_stats['machine_rooms']:
+                summary.append(f"- {room['机房']}: 吞吐量 {room['吞吐量(次/秒)']} 次/秒, P99 {room['P99(ms)']}ms")
+
+        # 与历史运行对比
+        if self.comparison_rows:
+            summary.extend(["", "与历史运行对比:"] + self.comparison_summary())
+
+        # 错误分析（按出现次数排序）
+        if self.error_counts:
             summary.extend([
                 "",
                 "错误分析:",
             ])
-            for error in unique_errors[:3]:  # 只显示前3种错误
-                if error:
-                    summary.append(f"- {error[:100]}")
+            for error, count in self.top_errors(3):  # 只显示前3种错误
+                summary.append(f"- {error[:100]} ({count}次)")
 
         summary.extend([
             "",
@@ -585,17 +1668,279 @@ class ConnectionPerformanceTestFixed:
 
         return summary
 
+def merge_histogram_files(filenames):
+    """
+    合并多个延迟直方图文件，输出分位数并保存合并结果
+
+    Args:
+        filenames: 直方图JSON文件列表
+    """
+    merged = HistogramSet()
+    for filename in filenames:
+        merged.merge(HistogramSet.load(filename))
+        print(f"已加载: {filename}")
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    merged_file = merged.save(f"latency_histograms_merged_{timestamp}.json")
+
+    rows = merged.summary_rows()
+    import csv
+    csv_file = f"latency_percentiles_merged_{timestamp}.csv"
+    with open(csv_file, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()) if rows else ['范围'])
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print("\n" + "=" * 60)
+    print(f"合并 {len(filenames)} 个直方图文件")
+    print("=" * 60)
+    for row in rows:
+        if row['范围'] == '设备':
+            continue
+        scope = row['机房'] or row['范围']
+        print(f"{scope}: 样本 {row['样本数']}, P50 {row['P50(ms)']}ms, P90 {row['P90(ms)']}ms, "
+              f"P99 {row['P99(ms)']}ms, P99.9 {row['P99.9(ms)']}ms")
+    print(f"📈 合并直方图: {merged_file}")
+    print(f"📊 分位数CSV: {csv_file}")
+
+
+def compare_store_runs(store_path, baseline_run, current_run, baseline_count=7):
+    """
+    对比结果库中的两次运行（baseline_run 为 None 时使用 current_run 之前的滚动基线），输出对比报告
+
+    Args:
+        store_path: 结果库路径
+        baseline_run: 基线运行ID，None表示滚动基线
+        current_run: 当前运行ID
+        baseline_count: 滚动基线包含的运行次数
+    """
+    store = PerformanceResultStore(store_path)
+    try:
+        current = store.get_run(current_run)
+        if baseline_run is None:
+            baseline_ids = store.baseline_run_ids(current_run, baseline_count, current['mode'])
+        else:
+            baseline = store.get_run(baseline_run)
+            if baseline['results_file'] and (baseline['results_file'], baseline['started_at']) == \
+                    (current['results_file'], current['started_at']):
+                print(f"❌ 运行 {baseline_run} 和 {current_run} 是同一次测试的重复保存，对比没有意义")
+                return
+            baseline_ids = [baseline_run]
+        if not baseline_ids:
+            print(f"❌ 运行 {current_run} 之前没有可对比的运行")
+            return
+        rows = compare_stats(store.load_device_stats(baseline_ids), store.load_device_stats([current_run]))
+    finally:
+        store.close()
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    if PANDAS_AVAILABLE and OPENPYXL_AVAILABLE:
+        filename = f"connection_performance_comparison_{timestamp}.xlsx"
+        pd.DataFrame(rows).to_excel(filename, sheet_name='性能对比', index=False)
+    else:
+        import csv
+        filename = f"connection_performance_comparison_{timestamp}.csv"
+        headers = []
+        for row in rows:
+            headers.extend(key for key in row if key not in headers)
+        with open(filename, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.DictWriter(f, fieldnames=headers)
+            writer.writeheader()
+            writer.writerows(rows)
+
+    print("\n" + "=" * 60)
+    print(f"运行 {current_run}（{current['started_at']}）对比基线运行 {baseline_ids}")
+    print("=" * 60)
+    for row in rows:
+        if row['范围'] == '机房' or row['结论'] in ('显著变慢', '显著变快'):
+            name = row['设备名称'] or row['机房']
+            if '本次均值(ms)' in row:
+                print(f"{row['范围']} {name}: 均值 {row['基线均值(ms)']}ms -> {row['本次均值(ms)']}ms "
+                      f"({row['均值变化(%)']:+}%), P99 {row['基线P99(ms)']}ms -> {row['本次P99(ms)']}ms, "
+                      f"p={row['p值']}, {row['结论']}")
+            else:
+                print(f"{row['范围']} {name}: {row['结论']}")
+    print(f"📊 对比报告: {filename}")
+
+
+def list_store_runs(store_path, limit=20):
+    """列出结果库中最近的运行"""
+    store = PerformanceResultStore(store_path)
+    try:
+        runs = store.list_runs(limit)
+    finally:
+        store.close()
+    print(f"结果库: {store_path}")
+    for run in runs:
+        success_rate = run['success_count'] / run['request_count'] * 100 if run['request_count'] else 0
+        print(f"  运行 {run['run_id']}: {run['started_at']} {run['mode']}, {run['device_count']} 台设备, "
+              f"{run['request_count']} 次请求, 成功率 {success_rate:.1f}%")
+
+
+def run_keyword_lookup(test, args):
+    """
+    批量关键字查询：将关键字文件中的IP/关键字分发到所有在线设备，输出 关键字->设备->连接 索引
+
+    Args:
+        test: ConnectionPerformanceTestFixed实例（提供设备清单、端口和超时配置）
+        args: 命令行参数
+    """
+    keywords = load_keywords(args.keywords, args.filter)
+    devices = test.load_device_list()
+    if not keywords or not devices:
+        logging.error("关键字文件为空或没有可用的在线设备，批量查询终止")
+        return
+
+    lookup = ConnectionLookup(devices, test.api_port, test.endpoint, test.timeout, args.concurrency,
+                              args.pool_size, args.cache_ttl, None if args.cache_ttl == 0 else args.lookup_cache)
+    index = lookup.lookup(keywords)
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    index_file = f"connection_index_{timestamp}.json"
+    with open(index_file, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+
+    summary_rows = index_rows(index)
+    detail_rows = connection_rows(index)
+    if PANDAS_AVAILABLE and OPENPYXL_AVAILABLE:
+        report_file = f"connection_lookup_{timestamp}.xlsx"
+        with pd.ExcelWriter(report_file, engine='openpyxl') as writer:
+            pd.DataFrame(summary_rows).to_excel(writer, sheet_name='查询结果', index=False)
+            pd.DataFrame(detail_rows or [{'关键字': ''}]).to_excel(writer, sheet_name='连接明细', index=False)
+            pd.DataFrame(index['errors'] or [{'keyword': ''}]).to_excel(writer, sheet_name='查询失败', index=False)
+    else:
+        import csv
+        report_file = f"connection_lookup_{timestamp}.csv"
+        with open(report_file, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.DictWriter(f, fieldnames=['关键字', '过滤方式', '设备名称', 'IP地址', '机房', '连接数'])
+            writer.writeheader()
+            writer.writerows(summary_rows)
+
+    found = [entry for entry in index['keywords'].values() if entry['devices']]
+    stats = index['stats']
+    print("\n" + "=" * 60)
+    print(f"批量查询完成: {len(keywords)} 个关键字 × {len(devices)} 台设备")
+    print("=" * 60)
+    print(f"🔎 有连接的关键字: {len(found)}/{len(keywords)}")
+    for entry in sorted(found, key=lambda e: -e['connection_count'])[:10]:
+        rooms = sorted(set(device['machine_room'] for device in entry['devices'].values()))
+        print(f"  {entry['keyword']}: {entry['device_count']} 台设备, {entry['connection_count']} 个连接 ({', '.join(rooms)})")
+    print(f"📨 请求 {stats['requests']} 次, 缓存命中 {stats['cache_hits']} 次, 去重 {stats['deduplicated']} 次, "
+          f"失败 {stats['errors']} 次, 耗时 {stats['elapsed_s']} 秒")
+    print(f"🗂️  索引文件: {index_file}")
+    print(f"📊 查询报告: {report_file}")
+
+
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="IAM设备Connection接口性能测试")
+    parser.add_argument('--mode', choices=['single', 'load', 'lookup'], default='single',
+                        help="single: 分层抽样设备逐次测试; load: 所有在线设备并发负载测试; "
+                             "lookup: 按关键字文件批量查询所有在线设备的连接")
+    parser.add_argument('--concurrency', type=int, default=50, help="负载模式并发数（线程数或协程数）")
+    parser.add_argument('--backend', choices=['thread', 'async'], default='thread',
+                        help="负载模式请求后端: thread 阻塞式（每次新建连接），async 异步（每台设备keep-alive连接池）")
+    parser.add_argument('--pool-size', type=int, default=8, help="async后端每台设备的最大连接数")
+    parser.add_argument('--rps', type=float, default=None, help="负载模式目标总请求速率（次/秒），默认不限速")
+    parser.add_argument('--ramp-up', type=float, default=0, help="负载模式爬坡时间（秒）")
+    parser.add_argument('--duration', type=float, default=60, help="负载模式持续时间（秒）")
+    parser.add_argument('--max-devices', type=int, default=None, help="负载模式最多压测的设备数")
+    parser.add_argument('--sample-size', type=int, default=3, help="single模式分层抽样的设备数")
+    parser.add_argument('--coverage-runs', type=int, default=None,
+                        help="一个覆盖周期内的运行次数（如每天4次×7天=28），自动增大样本数以保证周期内覆盖全部设备")
+    parser.add_argument('--seed', type=int, default=None, help="抽样随机种子（相同种子和抽样状态下结果确定）")
+    parser.add_argument('--stratify', choices=list(STRATIFY_KEYS), default='machine_room_bandwidth', help="分层方式")
+    parser.add_argument('--sampling-state', default=DEFAULT_STATE_PATH, help="抽样状态文件（记录各设备最近测试时间）")
+    parser.add_argument('--no-rotation', action='store_true', help="不按测试历史轮换，也不更新抽样状态")
+    parser.add_argument('--keywords', default=None, help="lookup模式关键字文件（每行一个IP/关键字，或 过滤方式,关键字）")
+    parser.add_argument('--filter', default='byip', help="lookup模式默认过滤方式")
+    parser.add_argument('--cache-ttl', type=float, default=300, help="lookup模式查询结果缓存有效期（秒），0表示不缓存")
+    parser.add_argument('--lookup-cache', default=DEFAULT_CACHE_PATH, help="lookup模式查询缓存文件")
+    parser.add_argument('--timeout', type=float, default=30, help="单次请求超时时间（秒）")
+    parser.add_argument('--port', type=int, default=9999, help="设备接口端口")
+    parser.add_argument('--shared-secret', default="1", help="设备状态接口认证共享密钥")
+    parser.add_argument('--status-interval', type=float, default=10, help="测试期间设备状态快照间隔（秒）")
+    parser.add_argument('--results-file', default=None,
+                        help="结果文件路径（JSON Lines，追加写入），默认 connection_test_results_<时间戳>.jsonl")
+    parser.add_argument('--response-sample-rate', type=float, default=0.0,
+                        help="结果文件中保留响应体的比例（0-1），默认全部丢弃")
+    parser.add_argument('--from-results', default=None, metavar='FILE',
+                        help="不执行测试，从已有结果文件重新生成报告（适用于测试中途中断）")
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH, help="历史结果库路径（SQLite）")
+    parser.add_argument('--no-store', action='store_true', help="不保存到结果库，也不与历史运行对比")
+    parser.add_argument('--baseline-run', type=int, default=None,
+                        help="与指定运行ID对比，默认与同模式最近N次运行合并的滚动基线对比")
+    parser.add_argument('--baseline-runs', type=int, default=7, help="滚动基线包含的运行次数")
+    parser.add_argument('--compare', nargs=2, type=int, default=None, metavar=('BASELINE_RUN', 'CURRENT_RUN'),
+                        help="不执行测试，对比结果库中的两次运行")
+    parser.add_argument('--compare-baseline', type=int, default=None, metavar='RUN',
+                        help="不执行测试，将结果库中的指定运行与其滚动基线对比")
+    parser.add_argument('--list-runs', action='store_true', help="列出结果库中最近的运行")
+    parser.add_argument('--merge-histograms', nargs='+', default=None, metavar='FILE',
+                        help="合并多次运行/多个进程保存的延迟直方图文件并输出分位数")
+    args = parser.parse_args()
+
+    if args.merge_histograms:
+        merge_histogram_files(args.merge_histograms)
+        return
+    if args.list_runs:
+        list_store_runs(args.store)
+        return
+    if args.compare or args.compare_baseline:
+        baseline_run, current_run = args.compare if args.compare else (None, args.compare_baseline)
+        compare_store_runs(args.store, baseline_run, current_run, args.baseline_runs)
+        return
+
     try:
         test = ConnectionPerformanceTestFixed()
-        
-        if not test.selected_devices:
-            logging.error("没有可用的测试设备，测试终止")
+        test.sample_seed = args.seed
+        test.stratify = args.stratify
+        test.sampling_state_file = None if args.no_rotation else args.sampling_state
+        test.sample_size = args.sample_size
+        if args.coverage_runs:
+            test.sample_size = sample_size_for_coverage(len(test.load_device_list()), args.coverage_runs, args.sample_size)
+        if args.mode == 'single' and not args.from_results:
+            test.selected_devices = test.select_test_devices()
+        test.timeout = args.timeout
+        test.api_port = args.port
+        test.shared_secret = args.shared_secret
+        test.status_interval = args.status_interval
+        test.results_file = args.results_file
+        test.response_sample_rate = args.response_sample_rate
+
+        if args.mode == 'lookup':
+            if not args.keywords:
+                parser.error("lookup模式需要指定 --keywords")
+            run_keyword_lookup(test, args)
             return
-        
-        # 执行性能测试
-        test.run_performance_test()
+
+        if args.from_results:
+            test.load_results_file(args.from_results)
+            if not test.result_count:
+                logging.error("结果文件中没有测试结果")
+                return
+        elif args.mode == 'load':
+            test.run_load_test(args.concurrency, args.rps, args.ramp_up, args.duration, args.max_devices,
+                               args.backend, args.pool_size)
+            if not test.result_count:
+                logging.error("负载测试没有产生任何结果")
+                return
+        else:
+            if not test.selected_devices:
+                logging.error("没有可用的测试设备，测试终止")
+                return
+
+            # 执行性能测试
+            test.run_performance_test()
+
+        # 保存到历史结果库并与基线对比
+        if not args.no_store:
+            store = PerformanceResultStore(args.store)
+            try:
+                test.save_to_store(store, rebuilt=bool(args.from_results))
+                test.compare_with_store(store, args.baseline_run, args.baseline_runs)
+            finally:
+                store.close()
 
         # 生成报告
         print("\n正在生成测试报告...")
@@ -606,11 +1951,18 @@ def main():
         # 生成简单文本报告
         text_report = test.generate_simple_report()
 
+        # 保存延迟直方图，供跨运行合并
+        histogram_file = test.histograms.save(
+            f"latency_histograms_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+
         print("\n" + "="*60)
         print("IAM Connection接口性能测试完成")
         print("="*60)
-        print(f"测试设备: {[d['name'] for d in test.selected_devices]}")
-        print(f"总测试次数: {len(test.test_results)}")
+        if test.load_stats:
+            print(f"测试设备: {len(test.selected_devices)} 台在线设备（负载测试）")
+        else:
+            print(f"测试设备: {[d['name'] for d in test.selected_devices]}")
+        print(f"总测试次数: {test.result_count}")
 
         # 显示生成的报告文件
         if excel_report:
@@ -621,45 +1973,71 @@ def main():
 
         if text_report:
             print(f"📄 文本报告: {text_report}")
+        print(f"📈 延迟直方图: {histogram_file}")
+        print(f"🗂️  结果文件: {test.results_file}")
+        if test.sampling_coverage:
+            print(f"🧭 最近{test.coverage_window_days}天设备覆盖率: {test.sampling_coverage['covered']}/"
+                  f"{test.sampling_coverage['total']} ({test.sampling_coverage['coverage_pct']}%)")
+        if test.run_id:
+            print(f"🗄️  结果库: {args.store}（运行ID {test.run_id}）")
 
         print("="*60)
 
         # 输出简要统计
-        success_count = sum(1 for r in test.test_results if r.get('success', False))
-        failure_count = len(test.test_results) - success_count
+        success_count = test.success_count
+        failure_count = test.result_count - success_count
 
-        print(f"✅ 成功测试: {success_count}/{len(test.test_results)}")
-        print(f"❌ 失败测试: {failure_count}/{len(test.test_results)}")
-        print(f"📊 成功率: {success_count/len(test.test_results)*100:.1f}%")
+        print(f"✅ 成功测试: {success_count}/{test.result_count}")
+        print(f"❌ 失败测试: {failure_count}/{test.result_count}")
+        print(f"📊 成功率: {success_count/test.result_count*100:.1f}%")
+        if test.client_error_count:
+            print(f"⏳ 客户端等待连接超时: {test.client_error_count}次（未计入设备失败和延迟）")
 
         # 响应时间统计
         if success_count > 0:
-            response_times = [r['response_time_ms'] for r in test.test_results if r.get('success', False)]
-            avg_time = statistics.mean(response_times)
-            min_time = min(response_times)
-            max_time = max(response_times)
-            print(f"⏱️  平均响应时间: {avg_time:.2f}ms")
-            print(f"⚡ 最快响应: {min_time:.2f}ms")
-            print(f"🐌 最慢响应: {max_time:.2f}ms")
+            latency = test.histograms.combined()['全部'].summary()
+            print(f"⏱️  平均响应时间: {latency['平均(ms)']:.2f}ms")
+            print(f"⚡ 最快响应: {latency['最小(ms)']:.2f}ms")
+            print(f"🐌 最慢响应: {latency['最大(ms)']:.2f}ms")
+            print(f"📐 分位数: P50 {latency['P50(ms)']:.2f}ms, P90 {latency['P90(ms)']:.2f}ms, "
+                  f"P99 {latency['P99(ms)']:.2f}ms, P99.9 {latency['P99.9(ms)']:.2f}ms")
         else:
             # 即使失败也显示网络响应时间
-            response_times = [r['response_time_ms'] for r in test.test_results if r['response_time_ms'] > 0]
-            if response_times:
-                avg_time = statistics.mean(response_times)
-                min_time = min(response_times)
-                max_time = max(response_times)
+            network_times = test.network_time_stats()
+            if network_times['count']:
+                avg_time, min_time, max_time, _ = summarize_times(network_times)
                 print(f"🌐 平均网络响应时间: {avg_time:.2f}ms")
                 print(f"⚡ 最快网络响应: {min_time:.2f}ms")
                 print(f"🐌 最慢网络响应: {max_time:.2f}ms")
 
+        # 阶段耗时
+        phase_rows = [row for row in test.phase_breakdown_rows() if row['范围'] == '全部']
+        if phase_rows:
+            row = phase_rows[0]
+            print("🧩 阶段耗时: " + ", ".join(f"{name} {row[f'{name}均值(ms)']}ms" for _, name in test.PHASES))
+            print(f"   主要耗时阶段: {row['主要耗时阶段']}")
+
+        # 负载测试统计
+        if test.load_stats:
+            print(f"\n🚀 负载测试（{test.load_config.get('backend', 'thread')}后端，并发 {test.load_config['concurrency']}，"
+                  f"目标速率 {test.load_config['target_rps'] or '不限速'} 次/秒）:")
+            for row in test.load_stats['overall'] + test.load_stats['machine_rooms']:
+                print(f"  {row.get('机房', row.get('范围'))}: 吞吐量 {row['吞吐量(次/秒)']} 次/秒, "
+                      f"P50 {row['P50(ms)']}ms, P90 {row['P90(ms)']}ms, P99 {row['P99(ms)']}ms")
+
+        # 与历史运行对比
+        if test.comparison_rows:
+            print(f"\n📉 与历史运行对比:")
+            for line in test.comparison_summary():
+                print(f"  {line[2:]}")
+
         # 错误分析
         if failure_count > 0:
-            error_messages = [r.get('error_message', '') for r in test.test_results if not r.get('success', False)]
-            unique_errors = list(set([e for e in error_messages if e]))
-            if unique_errors:
+            top_errors = test.top_errors(3)
+            if top_errors:
                 print(f"\n🔍 主要错误类型:")
-                for i, error in enumerate(unique_errors[:3], 1):
-                    print(f"  {i}. {error[:80]}{'...' if len(error) > 80 else ''}")
+                for i, (error, count) in enumerate(top_errors, 1):
+                    print(f"  {i}. {error[:80]}{'...' if len(error) > 80 else ''} ({count}次)")
 
         # 依赖检查提示
         if not PANDAS_AVAILABLE:
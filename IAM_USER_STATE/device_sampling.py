@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试设备分层抽样
+按机房和带宽等级对在线设备分层，按层大小比例分配样本（每层至少1台），
+层内优先选择最久未测试的设备，使多次运行轮流覆盖全部设备。
+设备的测试记录保存在状态文件中，相同状态和种子下抽样结果确定
+"""
+
+import os
+import json
+import math
+import random
+from datetime import datetime, timedelta
+
+# 默认抽样状态文件（脚本所在目录）
+DEFAULT_STATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'device_sampling_state.json')
+
+# 分层方式 -> 分层键函数
+STRATIFY_KEYS = {
+    'machine_room_bandwidth': lambda device: (device['machineRoom'], str(device.get('bandwidth', 'N/A'))),
+    'machine_room': lambda device: (device['machineRoom'],),
+    'bandwidth': lambda device: (str(device.get('bandwidth', 'N/A')),),
+}
+
+
+class DeviceSampler:
+    """分层轮换设备抽样器"""
+
+    def __init__(self, devices, state_file=DEFAULT_STATE_PATH, seed=None, stratify='machine_room_bandwidth'):
+        """
+        初始化抽样器
+
+        Args:
+            devices: 设备清单（load_device_list 的返回值）
+            state_file: 抽样状态文件路径，None表示不记录测试历史（不轮换）
+            seed: 随机种子，None表示每次随机
+            stratify: 分层方式，machine_room_bandwidth / machine_room / bandwidth
+        """
+        if stratify not in STRATIFY_KEYS:
+            raise ValueError(f"不支持的分层方式: {stratify}，可选: {list(STRATIFY_KEYS)}")
+        self.devices = devices
+        self.state_file = state_file
+        self.seed = seed
+        self.stratify = stratify
+        self.state = self.load_state()
+
+    def load_state(self):
+        """读取抽样状态（各设备最近一次被测试的运行序号和时间）"""
+        if self.state_file and os.path.exists(self.state_file):
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {'run_count': 0, 'devices': {}}
+
+    def save_state(self):
+        """保存抽样状态（先写临时文件再替换，避免中断时损坏）"""
+        if not self.state_file:
+            return
+        temp_file = self.state_file + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(temp_file, self.state_file)
+
+    def strata(self):
+        """
+        按分层方式划分设备
+
+        Returns:
+            {分层键: 设备列表}
+        """
+        key_func = STRATIFY_KEYS[self.stratify]
+        groups = {}
+        for device in self.devices:
+            groups.setdefault(key_func(device), []).append(device)
+        return groups
+
+    def allocate(self, strata, sample_size):
+        """
+        为各层分配样本数：样本数不少于层数时每层至少1台，其余按层大小比例分配（最大余数法）
+
+        Args:
+            strata: {分层键: 设备列表}
+            sample_size: 样本总数
+
+        Returns:
+            {分层键: 样本数}
+        """
+        total = sum(len(devices) for devices in strata.values())
+        sample_size = min(sample_size, total)
+        quotas = {key: sample_size * len(devices) / total for key, devices in strata.items()}
+        allocation = {key: 0 for key in strata}
+
+        if sample_size < len(strata):
+            # 样本数少于层数：优先选择最久未覆盖的层
+            for key in sorted(strata, key=lambda k: self.stratum_staleness(strata[k]))[:sample_size]:
+                allocation[key] = 1
+            return allocation
+
+        for key in strata:
+            allocation[key] = 1
+        for _ in range(sample_size - len(strata)):
+            candidates = [key for key in strata if allocation[key] < len(strata[key])]
+            key = max(candidates, key=lambda k: (quotas[k] - allocation[k], len(strata[k])))
+            allocation[key] += 1
+        return allocation
+
+    def last_run(self, device):
+        """设备最近一次被测试的运行序号，从未测试返回 -1"""
+        return self.state['devices'].get(device['ip'], {}).get('last_run', -1)
+
+    def stratum_staleness(self, devices):
+        """层内最久未测试设备的运行序号（越小越需要覆盖）"""
+        return min(self.last_run(device) for device in devices)
+
+    def sample(self, sample_size, rotate=True):
+        """
+        分层抽样
+
+        Args:
+            sample_size: 样本总数
+            rotate: 是否优先选择最久未测试的设备
+
+        Returns:
+            抽中的设备列表（按机房排序）
+        """
+        rng = random.Random(self.seed)
+        strata = self.strata()
+        if not strata or sample_size <= 0:
+            return []
+
+        # 每层设备先按种子打乱，再按最近测试运行序号排序，实现确定性的轮换
+        ordered = {}
+        for key in sorted(strata):
+            devices = sorted(strata[key], key=lambda device: device['ip'])
+            rng.shuffle(devices)
+            if rotate:
+                devices.sort(key=self.last_run)
+            ordered[key] = devices
+
+        selected = []
+        for key, count in self.allocate(ordered, sample_size).items():
+            selected.extend(ordered[key][:count])
+        return sorted(selected, key=lambda device: (device['machineRoom'], device['name']))
+
+    def record_run(self, devices):
+        """
+        记录本次被测试的设备并保存状态
+
+        Args:
+            devices: 本次测试的设备列表
+        """
+        run_index = self.state['run_count']
+        self.state['run_count'] = run_index + 1
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for device in devices:
+            record = self.state['devices'].setdefault(device['ip'], {'count': 0})
+            record.update({'name': device['name'], 'last_run': run_index, 'last_tested': now})
+            record['count'] += 1
+        self.save_state()
+
+    def coverage(self, window_days=7):
+        """
+        统计最近 window_days 天内的设备覆盖情况
+
+        Returns:
+            {'total', 'covered', 'coverage_pct', 'uncovered': [未覆盖设备名称]}
+        """
+        since = (datetime.now() - timedelta(days=window_days)).strftime('%Y-%m-%d %H:%M:%S')
+        uncovered = [device for device in self.devices
+                     if self.state['devices'].get(device['ip'], {}).get('last_tested', '') < since]
+        total = len(self.devices)
+        return {
+            'total': total,
+            'covered': total - len(uncovered),
+            'coverage_pct': round((total - len(uncovered)) / total * 100, 1) if total else 0,
+            'uncovered': [device['name'] for device in uncovered]
+        }
+
+
+def sample_size_for_coverage(device_count, runs_per_cycle, minimum=3):
+    """
+    保证 runs_per_cycle 次运行内覆盖全部设备所需的每次样本数
+
+    Args:
+        device_count: 设备总数
+        runs_per_cycle: 一个覆盖周期内的运行次数（如每天4次×7天=28）
+        minimum: 最小样本数
+    """
+    return max(minimum, math.ceil(device_count / max(1, runs_per_cycle)))
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+高精度延迟直方图（HDR风格）
+以微秒为单位按对数-线性分桶记录延迟，相对误差不超过 1/2^(sub_bucket_bits-1)
+（默认 sub_bucket_bits=11，即3位有效数字），内存占用与样本数无关。
+直方图可以跨线程、跨进程、跨多次运行合并，并以JSON文件保存
+"""
+
+import json
+import math
+import threading
+from datetime import datetime
+
+
+class LatencyHistogram:
+    """HDR风格延迟直方图"""
+
+    def __init__(self, sub_bucket_bits=11):
+        """
+        初始化直方图
+
+        Args:
+            sub_bucket_bits: 每个数量级内的线性分桶位数，11位对应3位有效数字
+        """
+        self.sub_bucket_bits = sub_bucket_bits
+        self.half_count = 1 << (sub_bucket_bits - 1)
+        self.counts = {}  # 桶序号 -> 样本数（稀疏存储）
+        self.total_count = 0
+        self.total_us = 0
+        self.min_us = None
+        self.max_us = None
+        self.lock = threading.Lock()
+
+    def bucket_index(self, value_us):
+        """计算微秒值所在的桶序号"""
+        shift = value_us.bit_length() - self.sub_bucket_bits
+        if shift <= 0:
+            return value_us
+        return (shift + 1) * self.half_count + (value_us >> shift) - self.half_count
+
+    def bucket_upper_us(self, index):
+        """桶内的最大等价值（微秒）"""
+        if index < 2 * self.half_count:
+            return index
+        shift = index // self.half_count - 1
+        sub_bucket = index - (shift + 1) * self.half_count + self.half_count
+        return ((sub_bucket + 1) << shift) - 1
+
+    def record(self, value_ms, count=1):
+        """
+        记录延迟样本
+
+        Args:
+            value_ms: 延迟（毫秒）
+            count: 样本数
+        """
+        value_us = max(0, int(round(value_ms * 1000)))
+        index = self.bucket_index(value_us)
+        with self.lock:
+            self.counts[index] = self.counts.get(index, 0) + count
+            self.total_count += count
+            self.total_us += value_us * count
+            self.min_us = value_us if self.min_us is None else min(self.min_us, value_us)
+            self.max_us = value_us if self.max_us is None else max(self.max_us, value_us)
+
+    def merge(self, other):
+        """
+        合并另一个直方图（分桶精度需一致）
+
+        Args:
+            other: LatencyHistogram实例
+
+        Returns:
+            self
+        """
+        if other.sub_bucket_bits != self.sub_bucket_bits:
+            raise ValueError(f"直方图精度不一致: {self.sub_bucket_bits} != {other.sub_bucket_bits}")
+        with self.lock:
+            for index, count in other.counts.items():
+                self.counts[index] = self.counts.get(index, 0) + count
+            self.total_count += other.total_count
+            self.total_us += other.total_us
+            if other.min_us is not None:
+                self.min_us = other.min_us if self.min_us is None else min(self.min_us, other.min_us)
+                self.max_us = other.max_us if self.max_us is None else max(self.max_us, other.max_us)
+        return self
+
+    def percentile(self, p):
+        """
+        计算百分位数
+
+        Args:
+            p: 百分位（0-100），如 99.9
+
+        Returns:
+            延迟（毫秒），无样本时返回0
+        """
+        if self.total_count == 0:
+            return 0
+        target = max(1, math.ceil(p / 100 * self.total_count))
+        cumulative = 0
+        for index in sorted(self.counts):
+            cumulative += self.counts[index]
+            if cumulative >= target:
+                return min(self.bucket_upper_us(index), self.max_us) / 1000
+        return self.max_us / 1000
+
+    def mean(self):
+        """平均延迟（毫秒）"""
+        return self.total_us / self.total_count / 1000 if self.total_count else 0
+
+    def summary(self):
+        """
+        输出常用分位数
+
+        Returns:
+            包含样本数、平均值、最小/最大值和P50/P90/P99/P99.9的字典（毫秒）
+        """
+        return {
+            '样本数': self.total_count,
+            '平均(ms)': round(self.mean(), 2),
+            '最小(ms)': round(self.min_us / 1000, 2) if self.min_us is not None else 0,
+            'P50(ms)': round(self.percentile(50), 2),
+            'P90(ms)': round(self.percentile(90), 2),
+            'P99(ms)': round(self.percentile(99), 2),
+            'P99.9(ms)': round(self.percentile(99.9), 2),
+            '最大(ms)': round(self.max_us / 1000, 2) if self.max_us is not None else 0
+        }
+
+    def to_dict(self):
+        """序列化为字典"""
+        return {
+            'unit': 'us',
+            'sub_bucket_bits': self.sub_bucket_bits,
+            'total_count': self.total_count,
+            'total_us': self.total_us,
+            'min_us': self.min_us,
+            'max_us': self.max_us,
+            'counts': {str(index): count for index, count in self.counts.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """从字典反序列化"""
+        histogram = cls(data.get('sub_bucket_bits', 11))
+        histogram.counts = {int(index): count for index, count in data['counts'].items()}
+        histogram.total_count = data['total_count']
+        histogram.total_us = data['total_us']
+        histogram.min_us = data['min_us']
+        histogram.max_us = data['max_us']
+        return histogram
+
+
+class HistogramSet:
+    """按 (设备IP, 接口) 分组的直方图集合"""
+
+    def __init__(self):
+        """初始化直方图集合"""
+        self.histograms = {}  # (设备IP, 接口) -> LatencyHistogram
+        self.labels = {}      # 设备IP -> {'device_name', 'machine_room'}
+        self.lock = threading.Lock()
+
+    def get(self, device_ip, endpoint, device_name=None, machine_room=None):
+        """获取（不存在时创建）设备和接口对应的直方图"""
+        key = (device_ip, endpoint)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = LatencyHistogram()
+            if device_name is not None:
+                self.labels[device_ip] = {'device_name': device_name, 'machine_room': machine_room}
+            return self.histograms[key]
+
+    def record(self, device_ip, endpoint, value_ms, device_name=None, machine_room=None):
+        """记录一个延迟样本"""
+        self.get(device_ip, endpoint, device_name, machine_room).record(value_ms)
+
+    def merge(self, other):
+        """合并另一个直方图集合"""
+        for (device_ip, endpoint), histogram in other.histograms.items():
+            label = other.labels.get(device_ip, {})
+            self.get(device_ip, endpoint, label.get('device_name'), label.get('machine_room')).merge(histogram)
+        return self
+
+    def combined(self, group_by=None):
+        """
+        按维度合并直方图
+
+        Args:
+            group_by: None 合并全部，'machine_room' 按机房，'endpoint' 按接口
+
+        Returns:
+            {分组键: LatencyHistogram}
+        """
+        groups = {}
+        for (device_ip, endpoint), histogram in self.histograms.items():
+            if group_by == 'machine_room':
+                key = self.labels.get(device_ip, {}).get('machine_room', 'Unknown')
+            elif group_by == 'endpoint':
+                key = endpoint
+            else:
+                key = '全部'
+            groups.setdefault(key, LatencyHistogram(histogram.sub_bucket_bits)).merge(histogram)
+        return groups
+
+    def summary_rows(self):
+        """
+        生成报告行：每个设备×接口一行，外加按机房和全部汇总的行
+
+        Returns:
+            报告行列表
+        """
+        rows = []
+        for scope, groups in [('全部', self.combined()), ('机房', self.combined('machine_room'))]:
+            for key, histogram in sorted(groups.items()):
+                row = {'范围': scope, '设备名称': '', 'IP地址': '', '机房': key if scope == '机房' else '', '接口': ''}
+                row.update(histogram.summary())
+                rows.append(row)
+        for (device_ip, endpoint), histogram in sorted(self.histograms.items()):
+            label = self.labels.get(device_ip, {})
+            row = {
+                '范围': '设备',
+                '设备名称': label.get('device_name', ''),
+                'IP地址': device_ip,
+                '机房': label.get('machine_room', ''),
+                '接口': endpoint
+            }
+            row.update(histogram.summary())
+            rows.append(row)
+        return rows
+
+    def save(self, filename):
+        """保存为JSON文件，便于跨运行、跨进程合并"""
+        data = {
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'histograms': [
+                {
+                    'device_ip': device_ip,
+                    'endpoint': endpoint,
+                    'device_name': self.labels.get(device_ip, {}).get('device_name'),
+                    'machine_room': self.labels.get(device_ip, {}).get('machine_room'),
+                    'histogram': histogram.to_dict()
+                }
+                for (device_ip, endpoint), histogram in self.histograms.items()
+            ]
+        }
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        return filename
+
+    @classmethod
+    def load(cls, filename):
+        """从JSON文件加载"""
+        with open(filename, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        histogram_set = cls()
+        for item in data['histograms']:
+            histogram_set.get(item['device_ip'], item['endpoint'], item.get('device_name'),
+                              item.get('machine_room')).merge(LatencyHistogram.from_dict(item['histogram']))
+        return histogram_set
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Connection接口性能测试结果库（SQLite）
+每次测试按设备保存请求计数、响应时间累计（总和、平方和）和延迟直方图，
+支持两次运行对比或当前运行与滚动基线（最近N次运行合并）对比，
+按设备和机房输出延迟变化，并用Welch t检验标记显著变化
+"""
+
+import os
+import json
+import math
+import sqlite3
+from datetime import datetime
+
+from latency_histogram import LatencyHistogram
+
+# 默认结果库路径（脚本所在目录）
+DEFAULT_STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'connection_performance_results.db')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    endpoint TEXT,
+    results_file TEXT,
+    device_count INTEGER,
+    request_count INTEGER,
+    success_count INTEGER,
+    concurrency INTEGER,
+    target_rps REAL,
+    duration_s REAL
+);
+CREATE TABLE IF NOT EXISTS device_stats (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    device_ip TEXT NOT NULL,
+    device_name TEXT,
+    machine_room TEXT,
+    total INTEGER,
+    success INTEGER,
+    latency_count INTEGER,
+    latency_sum REAL,
+    latency_sumsq REAL,
+    histogram TEXT,
+    PRIMARY KEY (run_id, device_ip)
+);
+"""
+
+
+def regularized_incomplete_beta(a, b, x):
+    """正则化不完全Beta函数 I_x(a, b)（连分式展开），用于计算t分布尾概率"""
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+    if x > (a + 1) / (a + b + 2):
+        return 1.0 - regularized_incomplete_beta(b, a, 1 - x)
+
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+                     + a * math.log(x) + b * math.log(1 - x)) / a
+    # Lentz算法
+    tiny = 1e-300
+    f, c, d = 1.0, 1.0, 0.0
+    for i in range(200):
+        m = i // 2
+        if i == 0:
+            numerator = 1.0
+        elif i % 2 == 0:
+            numerator = m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m))
+        else:
+            numerator = -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))
+        d = 1.0 + numerator * d
+        d = tiny if abs(d) < tiny else d
+        d = 1.0 / d
+        c = 1.0 + numerator / c
+        c = tiny if abs(c) < tiny else c
+        f *= c * d
+        if abs(1.0 - c * d) < 1e-12:
+            break
+    return front * (f - 1.0)
+
+
+def welch_t_test(n1, mean1, var1, n2, mean2, var2):
+    """
+    Welch t检验（两组方差不相等）
+
+    Args:
+        n1, mean1, var1: 基线样本数、均值、方差
+        n2, mean2, var2: 当前样本数、均值、方差
+
+    Returns:
+        (t值, 双侧p值)，样本不足时返回 (None, None)
+    """
+    if n1 < 2 or n2 < 2:
+        return None, None
+    se2 = var1 / n1 + var2 / n2
+    if se2 <= 0:
+        return (0.0, 1.0) if mean1 == mean2 else (math.copysign(float('inf'), mean2 - mean1), 0.0)
+    t = (mean2 - mean1) / math.sqrt(se2)
+    # Welch-Satterthwaite自由度
+    df = se2 ** 2 / ((var1 / n1) ** 2 / (n1 - 1) + (var2 / n2) ** 2 / (n2 - 1)) if var1 + var2 > 0 else n1 + n2 - 2
+    p = regularized_incomplete_beta(df / 2, 0.5, df / (df + t * t))
+    return t, p
+
+
+class PerformanceResultStore:
+    """性能测试结果库"""
+
+    def __init__(self, db_path=DEFAULT_STORE_PATH):
+        """
+        打开（不存在时创建）结果库
+
+        Args:
+            db_path: SQLite文件路径
+        """
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        """关闭结果库"""
+        self.connection.close()
+
+    def save_run(self, run_info, device_rows):
+        """
+        保存一次测试运行
+
+        Args:
+            run_info: 运行信息（started_at、mode、endpoint、results_file、device_count、request_count、
+                      success_count、concurrency、target_rps、duration_s）
+            device_rows: 设备统计列表（device_ip、device_name、machine_room、total、success、
+                         latency_count、latency_sum、latency_sumsq、histogram(LatencyHistogram)）
+
+        Returns:
+            运行ID
+        """
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (started_at, mode, endpoint, results_file, device_count, request_count, "
+                "success_count, concurrency, target_rps, duration_s) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_info.get('started_at') or datetime.now().strftime('%Y-%m-%d %H:%M:%S'), run_info['mode'],
+                 run_info.get('endpoint'), run_info.get('results_file'), run_info.get('device_count'),
+                 run_info.get('request_count'), run_info.get('success_count'), run_info.get('concurrency'),
+                 run_info.get('target_rps'), run_info.get('duration_s')))
+            run_id = cursor.lastrowid
+            self.connection.executemany(
+                "INSERT INTO device_stats (run_id, device_ip, device_name, machine_room, total, success, "
+                "latency_count, latency_sum, latency_sumsq, histogram) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(run_id, row['device_ip'], row['device_name'], row['machine_room'], row['total'], row['success'],
+                  row['latency_count'], row['latency_sum'], row['latency_sumsq'],
+                  json.dumps(row['histogram'].to_dict())) for row in device_rows])
+        return run_id
+
+    def list_runs(self, limit=20):
+        """最近的运行记录（按运行ID倒序）"""
+        rows = self.connection.execute("SELECT * FROM runs ORDER BY run_id DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_run(self, run_id):
+        """获取运行记录，不存在时抛出 ValueError"""
+        row = self.connection.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"结果库中不存在运行 {run_id}")
+        return dict(row)
+
+    def find_run(self, results_file, started_at):
+        """
+        按结果文件和开始时间查找已保存的运行（结果文件为追加写入，同一文件可能包含多次运行）
+
+        Returns:
+            运行ID，未保存过（或结果文件为空）时返回None
+        """
+        if not results_file:
+            return None
+        row = self.connection.execute(
+            "SELECT run_id FROM runs WHERE results_file = ? AND started_at = ? ORDER BY run_id LIMIT 1",
+            (results_file, started_at)).fetchone()
+        return row['run_id'] if row else None
+
+    def baseline_run_ids(self, run_id, count=7, mode=None):
+        """
+        滚动基线：指定运行之前最近的 count 次运行（可限定测试模式）
+        结果文件和开始时间都相同的运行是同一次测试的重复保存：与指定运行重复的不计入基线，其余重复的只算一次
+
+        Returns:
+            运行ID列表
+        """
+        current = self.get_run(run_id)
+        current_key = (current['results_file'], current['started_at'])
+        sql = "SELECT run_id, results_file, started_at FROM runs WHERE run_id < ?"
+        params = [run_id]
+        if mode:
+            sql += " AND mode = ?"
+            params.append(mode)
+        sql += " ORDER BY run_id DESC"
+
+        run_ids, seen = [], set()
+        for row in self.connection.execute(sql, params):
+            key = (row['results_file'], row['started_at'])
+            if row['results_file']:
+                if key == current_key or key in seen:
+                    continue
+                seen.add(key)
+            run_ids.append(row['run_id'])
+            if len(run_ids) >= count:
+                break
+        return run_ids
+
+    def load_device_stats(self, run_ids):
+        """
+        读取并合并多次运行的设备统计（计数、总和、平方和相加，直方图合并）
+
+        Args:
+            run_ids: 运行ID列表
+
+        Returns:
+            {设备IP: 合并后的设备统计}
+        """
+        if not run_ids:
+            return {}
+        placeholders = ','.join('?' * len(run_ids))
+        rows = self.connection.execute(
+            f"SELECT * FROM device_stats WHERE run_id IN ({placeholders})", list(run_ids)).fetchall()
+
+        merged = {}
+        for row in rows:
+            stats = merged.get(row['device_ip'])
+            if stats is None:
+                stats = merged[row['device_ip']] = {
+                    'device_ip': row['device_ip'],
+                    'device_name': row['device_name'],
+                    'machine_room': row['machine_room'],
+                    'total': 0, 'success': 0,
+                    'latency_count': 0, 'latency_sum': 0.0, 'latency_sumsq': 0.0,
+                    'histogram': LatencyHistogram()
+                }
+            for key in ('total', 'success', 'latency_count', 'latency_sum', 'latency_sumsq'):
+                stats[key] += row[key] or 0
+            stats['histogram'].merge(LatencyHistogram.from_dict(json.loads(row['histogram'])))
+        return merged
+
+
+def merge_by_room(device_stats):
+    """将设备统计按机房合并"""
+    rooms = {}
+    for stats in device_stats.values():
+        room = rooms.get(stats['machine_room'])
+        if room is None:
+            room = rooms[stats['machine_room']] = {
+                'device_ip': '', 'device_name': '', 'machine_room': stats['machine_room'],
+                'total': 0, 'success': 0, 'latency_count': 0, 'latency_sum': 0.0, 'latency_sumsq': 0.0,
+                'histogram': LatencyHistogram()
+            }
+        for key in ('total', 'success', 'latency_count', 'latency_sum', 'latency_sumsq'):
+            room[key] += stats[key]
+        room['histogram'].merge(stats['histogram'])
+    return rooms
+
+
+def mean_and_variance(stats):
+    """由计数、总和、平方和计算均值和样本方差"""
+    n = stats['latency_count']
+    if n == 0:
+        return 0, 0
+    mean = stats['latency_sum'] / n
+    variance = (stats['latency_sumsq'] - n * mean * mean) / (n - 1) if n > 1 else 0
+    return mean, max(variance, 0)
+
+
+def compare_stats(baseline, current, alpha=0.01, min_change_pct=10):
+    """
+    按设备和机房对比基线与当前运行的延迟
+
+    同时满足 p < alpha 且均值变化超过 min_change_pct% 才标记为显著变化，
+    避免大样本下微小但统计显著的波动被误报
+
+    Args:
+        baseline: 基线设备统计 {设备IP: 统计}
+        current: 当前设备统计 {设备IP: 统计}
+        alpha: 显著性水平
+        min_change_pct: 最小均值变化百分比
+
+    Returns:
+        对比报告行列表（机房行在前，设备行在后）
+    """
+    rows = []
+    for scope, base_groups, current_groups in [('机房', merge_by_room(baseline), merge_by_room(current)),
+                                               ('设备', baseline, current)]:
+        for key in sorted(set(base_groups) | set(current_groups)):
+            base = base_groups.get(key)
+            cur = current_groups.get(key)
+            label = cur or base
+            row = {
+                '范围': scope,
+                '设备名称': label['device_name'],
+                'IP地址': label['device_ip'],
+                '机房': label['machine_room']
+            }
+            if base is None or cur is None:
+                row['结论'] = '基线无数据' if base is None else '本次无数据'
+                rows.append(row)
+                continue
+
+            base_mean, base_var = mean_and_variance(base)
+            cur_mean, cur_var = mean_and_variance(cur)
+            base_p99 = base['histogram'].percentile(99)
+            cur_p99 = cur['histogram'].percentile(99)
+            t, p = welch_t_test(base['latency_count'], base_mean, base_var,
+                                cur['latency_count'], cur_mean, cur_var)
+            change_pct = (cur_mean - base_mean) / base_mean * 100 if base_mean else 0
+
+            if p is None:
+                conclusion = '样本不足'
+            elif p < alpha and abs(change_pct) >= min_change_pct:
+                conclusion = '显著变慢' if change_pct > 0 else '显著变快'
+            else:
+                conclusion = '无显著变化'
+
+            row.update({
+                '基线样本数': base['latency_count'],
+                '本次样本数': cur['latency_count'],
+                '基线成功率(%)': round(base['success'] / base['total'] * 100, 2) if base['total'] else 0,
+                '本次成功率(%)': round(cur['success'] / cur['total'] * 100, 2) if cur['total'] else 0,
+                '基线均值(ms)': round(base_mean, 2),
+                '本次均值(ms)': round(cur_mean, 2),
+                '均值变化(%)': round(change_pct, 1),
+                '基线P50(ms)': round(base['histogram'].percentile(50), 2),
+                '本次P50(ms)': round(cur['histogram'].percentile(50), 2),
+                '基线P99(ms)': round(base_p99, 2),
+                '本次P99(ms)': round(cur_p99, 2),
+                'P99变化(%)': round((cur_p99 - base_p99) / base_p99 * 100, 1) if base_p99 else 0,
+                't值': round(t, 2) if t is not None and math.isfinite(t) else t,
+                'p值': round(p, 4) if p is not None else None,
+                '结论': conclusion
+            })
+            rows.append(row)
+    return rows
@@ -9,6 +9,7 @@ import os
 
 # 输入文件配置
 INPUT_FILE_PATH = os.path.join(os.path.dirname(__file__), "input", "IAM配置.xlsx")
+DEVICE_INVENTORY_FILE_PATH = os.path.join(os.path.dirname(__file__), "input", "所有局点NF")  # AC设备列表（含带宽等级）
 
 # 输出文件配置
 OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "output")
@@ -46,6 +47,27 @@ DEVICE_API_PAYLOAD = {
     "interface": ""   # 空表示所有WAN口
 }
 
+# 带宽使用率API配置
+BANDWIDTH_USAGE_API_ENDPOINT = "/v1/status/bandwidth-usage"  # 获取带宽使用率(%)
+
+# 连接查询API配置（设备接口路径即为 conntections）
+CONNECTION_API_ENDPOINT = "/v1/conntections"
+CONNECTION_API_PAYLOAD = {
+    "data": {
+        "filter": "byip",
+        "keyword": ""  # 查询的IP关键字
+    }
+}
+
+# 采集端点配置（端点定义见 endpoint_registry.py，此处按名称启用）
+# 可选: user_rank, throughput, bandwidth_usage, connections
+ENABLED_ENDPOINTS = ["user_rank", "throughput"]
+
+# 并发采集配置
+FETCH_MAX_WORKERS = 32         # 并发请求线程数
+FETCH_POOL_CONNECTIONS = 1000  # 连接池缓存的设备（主机）数量
+FETCH_POOL_MAXSIZE = 4         # 每台设备保持的最大连接数
+
 # API认证配置
 # 注意：请根据实际环境修改共享密钥
 SHARED_SECRET = "1"  # 共享密钥，请修改为实际值
@@ -55,11 +77,22 @@ RANDOM_LENGTH = 16  # random字符串长度
 REQUEST_TIMEOUT = 30  # 请求超时时间（秒）
 MAX_RETRIES = 3      # 最大重试次数
 
+# 响应录制配置（录制真实设备响应，供tests/mock_device_farm.py回放）
+RECORD_API_RESPONSES = False  # 是否将API原始响应保存到磁盘
+RECORDINGS_DIR = os.path.join(os.path.dirname(__file__), "recordings")
+
 # 数据处理配置
 TOP_N_USERS_PER_DEVICE = 50  # 每台设备输出的用户数量（可配置）
 INCLUDE_BANDWIDTH_INFO = True  # 是否包含带宽信息
 GROUP_BY_STATION = True       # 是否按局点分组到不同sheet
 
+# 带宽利用率配置
+BANDWIDTH_CLASS_MAPPING = {   # 设备列表中的带宽等级 -> 端口容量（Mb/s）
+    1: 10000,   # 10G
+    2: 25000    # 25G
+}
+HOT_DEVICE_UTILIZATION_THRESHOLD = 80.0  # 热点设备带宽利用率阈值（%）
+
 # 流速单位配置
 FLOW_RATE_UNIT = "B/s"   # API返回的流速单位，默认为bytes/s
 OUTPUT_UNIT = "Mb/s"     # 输出显示单位：Mb/s（兆比特每秒）
@@ -84,6 +117,7 @@ DB_PASSWORD = "123456"
 DB_NAME = "packets_statistics"
 DB_USER_TABLE = "nf_user_flow_statistics_v2"  # 用户级别数据表（新表）
 DB_DEVICE_TABLE = "nf_device_flow_statistics"  # 设备级别数据表
+DB_HOT_DEVICE_TABLE = "nf_device_hot_statistics"  # 热点设备（带宽利用率超阈值）数据表
 
 # 数据库类型配置
 DB_TYPE = "doris"  # 可选值: "mysql", "doris"
@@ -96,6 +130,12 @@ MACHINE_ROOM_MAPPING = {
     'Oran': 'C1'
 }
 
+# 分片采集配置（shard_collector.py）
+SHARD_COUNT = 4                  # 分片数量（按机房分片时默认每个机房一个分片）
+SHARD_STRATEGY = "machine_room"  # 分片方式: "machine_room" 按机房, "ip_hash" 按IP一致性哈希
+SHARD_HASH_VIRTUAL_NODES = 160   # 一致性哈希每个分片的虚拟节点数
+SHARD_OUTPUT_DIR = os.path.join(OUTPUT_DIR, "shards")  # 多主机分片结果目录（按批次时间分子目录）
+
 # 确保所有必要目录存在
 for directory in [OUTPUT_DIR, LOGS_DIR]:
     if not os.path.exists(directory):
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+采集端点注册表
+每个端点声明接口路径、请求体、解析函数和结果汇聚方式（sink），
+由 FetchEngine 统一并发调度，共享认证、连接池和重试逻辑
+
+新增状态接口只需注册一个端点并在 config.ENABLED_ENDPOINTS 中启用，
+不会增加逐台设备的串行等待时间：
+
+    registry.register(
+        name='bandwidth_usage',
+        endpoint=config.BANDWIDTH_USAGE_API_ENDPOINT,
+        payload={},
+        parser=parse_bandwidth_usage,
+        sink='append'
+    )
+"""
+
+import logging
+from typing import List, Dict, Any, Optional, Callable
+
+import config
+
+# sink 取值：
+#   'extend' - 解析结果为列表，合并到该端点的结果列表中
+#   'append' - 解析结果为单条记录，追加到该端点的结果列表中
+#   callable - 自定义汇聚函数 sink(results, ip_address, parsed)，results 为该端点的结果列表
+SINK_MODES = ('extend', 'append')
+
+
+def parse_user_rank(processor, ip_address: str, data: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+    """解析用户流速排行响应"""
+    return processor.parse_user_api_response(ip_address, data)
+
+
+def parse_throughput(processor, ip_address: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """解析设备吞吐量响应"""
+    return processor.parse_device_api_response(ip_address, data)
+
+
+def parse_bandwidth_usage(processor, ip_address: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    解析带宽使用率响应
+
+    Args:
+        processor: UserFlowStatsProcessor实例
+        ip_address: 设备IP地址
+        data: 响应JSON，data字段为带宽使用率(%)
+
+    Returns:
+        带宽使用率记录，格式异常时返回None
+    """
+    if isinstance(data.get('data'), (int, float)):
+        device_info = processor.device_info_map.get(ip_address, {})
+        return {
+            'device_ip': ip_address,
+            'machine_room': device_info.get('machine_room', 'Unknown'),
+            'bandwidth_usage': float(data['data'])
+        }
+    processor.logger.warning(f"带宽使用率API响应格式异常，IP: {ip_address}, 响应: {data}")
+    return None
+
+
+def parse_connections(processor, ip_address: str, data: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+    """
+    解析连接查询响应
+
+    Args:
+        processor: UserFlowStatsProcessor实例
+        ip_address: 设备IP地址
+        data: 响应JSON，data字段为连接列表
+
+    Returns:
+        连接记录列表（附带来源设备），格式异常时返回None
+    """
+    if isinstance(data.get('data'), list):
+        for connection in data['data']:
+            if isinstance(connection, dict):
+                connection['source_ip'] = ip_address
+                connection['station_name'] = processor.station_names.get(ip_address, ip_address)
+        return data['data']
+    if data.get('code') == 0:
+        return []
+    processor.logger.warning(f"连接查询API响应格式异常，IP: {ip_address}, 响应: {data}")
+    return None
+
+
+class EndpointRegistry:
+    """采集端点注册表"""
+
+    def __init__(self):
+        """初始化注册表"""
+        self.logger = logging.getLogger(__name__)
+        self.endpoints = {}  # 端点名称 -> 端点定义，保持注册顺序
+
+    def register(self, name: str, endpoint: str, payload: Dict[str, Any], parser: Callable,
+                 sink: Any = 'extend', headers: Optional[Dict[str, str]] = None,
+                 label: Optional[str] = None):
+        """
+        注册采集端点
+
+        Args:
+            name: 端点名称，用于 config.ENABLED_ENDPOINTS 和结果字典的键
+            endpoint: API端点路径
+            payload: 请求体（只包含业务参数，认证参数由引擎统一添加）
+            parser: 解析函数 parser(processor, ip_address, data)，返回None表示解析失败
+            sink: 结果汇聚方式，'extend'、'append' 或自定义函数
+            headers: 请求头，默认使用JSON请求头
+            label: 日志中使用的接口名称，默认使用端点名称
+        """
+        if sink not in SINK_MODES and not callable(sink):
+            raise ValueError(f"不支持的sink类型: {sink}")
+        if name in self.endpoints:
+            self.logger.warning(f"采集端点 {name} 已注册，将被覆盖")
+
+        self.endpoints[name] = {
+            'name': name,
+            'endpoint': endpoint,
+            'payload': payload,
+            'parser': parser,
+            'sink': sink,
+            'headers': headers or {"Content-Type": "application/json", "Accept-Language": "zh-CN"},
+            'label': label or name
+        }
+
+    def unregister(self, name: str):
+        """注销采集端点"""
+        self.endpoints.pop(name, None)
+
+    def get(self, name: str) -> Dict[str, Any]:
+        """获取端点定义"""
+        if name not in self.endpoints:
+            raise KeyError(f"未注册的采集端点: {name}，已注册: {list(self.endpoints)}")
+        return self.endpoints[name]
+
+    def resolve(self, names: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        按名称获取需要采集的端点定义
+
+        Args:
+            names: 端点名称列表，默认使用 config.ENABLED_ENDPOINTS
+
+        Returns:
+            端点定义列表
+        """
+        if names is None:
+            names = config.ENABLED_ENDPOINTS
+        return [self.get(name) for name in names]
+
+
+def create_default_registry() -> EndpointRegistry:
+    """
+    创建包含内置端点的注册表
+
+    Returns:
+        EndpointRegistry实例
+    """
+    registry = EndpointRegistry()
+    registry.register(
+        name='user_rank',
+        endpoint=config.USER_API_ENDPOINT,
+        payload=config.USER_API_PAYLOAD,
+        parser=parse_user_rank,
+        sink='extend',
+        headers=config.USER_API_HEADERS,
+        label="用户API"
+    )
+    registry.register(
+        name='throughput',
+        endpoint=config.DEVICE_API_ENDPOINT,
+        payload=config.DEVICE_API_PAYLOAD,
+        parser=parse_throughput,
+        sink='append',
+        headers=config.DEVICE_API_HEADERS,
+        label="设备API"
+    )
+    registry.register(
+        name='bandwidth_usage',
+        endpoint=config.BANDWIDTH_USAGE_API_ENDPOINT,
+        payload={},
+        parser=parse_bandwidth_usage,
+        sink='append',
+        label="带宽使用率API"
+    )
+    registry.register(
+        name='connections',
+        endpoint=config.CONNECTION_API_ENDPOINT,
+        payload=config.CONNECTION_API_PAYLOAD,
+        parser=parse_connections,
+        sink='extend',
+        label="连接查询API"
+    )
+    return registry
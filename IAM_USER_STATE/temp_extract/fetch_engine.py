@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并发采集引擎
+对所有设备 × 所有启用端点的请求统一并发调度，
+认证、连接池和重试复用 UserFlowStatsProcessor.request_api_json
+"""
+
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Optional
+
+import config
+from endpoint_registry import EndpointRegistry, create_default_registry
+
+
+class FetchEngine:
+    """并发采集引擎"""
+
+    def __init__(self, processor, registry: Optional[EndpointRegistry] = None, max_workers: Optional[int] = None):
+        """
+        初始化采集引擎
+
+        Args:
+            processor: UserFlowStatsProcessor实例（提供认证、会话和解析方法）
+            registry: 端点注册表，默认使用内置端点
+            max_workers: 并发线程数，默认使用 config.FETCH_MAX_WORKERS
+        """
+        self.logger = logging.getLogger(__name__)
+        self.processor = processor
+        self.registry = registry or create_default_registry()
+        self.max_workers = max_workers or config.FETCH_MAX_WORKERS
+
+    def fetch_all(self, ip_list: List[str], endpoint_names: Optional[List[str]] = None) -> Dict[str, Dict[str, Optional[Dict[str, Any]]]]:
+        """
+        并发请求所有设备的所有启用端点
+
+        Args:
+            ip_list: 设备IP列表
+            endpoint_names: 端点名称列表，默认使用 config.ENABLED_ENDPOINTS
+
+        Returns:
+            {端点名称: {设备IP: 响应JSON或None}}，设备顺序与ip_list一致
+        """
+        endpoints = self.registry.resolve(endpoint_names)
+        raw = {ep['name']: {ip: None for ip in ip_list} for ep in endpoints}
+        total = len(ip_list) * len(endpoints)
+        if total == 0:
+            return raw
+
+        self.logger.info(f"开始并发采集: {len(ip_list)} 台设备 × {len(endpoints)} 个端点，并发数 {self.max_workers}")
+        start_time = time.time()
+        failed = 0
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, total)) as executor:
+            futures = {}
+            for ip_address in ip_list:
+                for ep in endpoints:
+                    future = executor.submit(self.processor.request_api_json, ip_address, ep['endpoint'],
+                                             ep['headers'], ep['payload'], ep['label'])
+                    futures[future] = (ep['name'], ip_address)
+
+            for future in as_completed(futures):
+                name, ip_address = futures[future]
+                try:
+                    raw[name][ip_address] = future.result()
+                except Exception as e:
+                    self.logger.error(f"采集任务异常，端点: {name}, IP: {ip_address}, 错误: {str(e)}")
+                if raw[name][ip_address] is None:
+                    failed += 1
+
+        self.logger.info(f"并发采集完成: {total} 个请求，失败 {failed} 个，耗时 {time.time() - start_time:.2f} 秒")
+        return raw
+
+    def parse_all(self, raw: Dict[str, Dict[str, Optional[Dict[str, Any]]]]) -> Dict[str, List[Any]]:
+        """
+        按端点声明的解析函数和sink汇聚响应
+
+        Args:
+            raw: fetch_all 的返回值
+
+        Returns:
+            {端点名称: 结果列表}
+        """
+        results = {}
+        for name, responses in raw.items():
+            ep = self.registry.get(name)
+            sink = ep['sink']
+            results[name] = []
+            for ip_address, data in responses.items():
+                if data is None:
+                    continue
+                try:
+                    parsed = ep['parser'](self.processor, ip_address, data)
+                except Exception as e:
+                    self.logger.error(f"{ep['label']}响应解析异常，IP: {ip_address}, 错误: {str(e)}")
+                    continue
+                if parsed is None:
+                    continue
+                if sink == 'extend':
+                    results[name].extend(parsed)
+                elif sink == 'append':
+                    results[name].append(parsed)
+                else:
+                    sink(results[name], ip_address, parsed)
+        return results
+
+    def collect(self, ip_list: List[str], endpoint_names: Optional[List[str]] = None) -> Dict[str, List[Any]]:
+        """
+        采集并解析所有设备的所有启用端点
+
+        Args:
+            ip_list: 设备IP列表
+            endpoint_names: 端点名称列表，默认使用 config.ENABLED_ENDPOINTS
+
+        Returns:
+            {端点名称: 结果列表}
+        """
+        return self.parse_all(self.fetch_all(ip_list, endpoint_names))
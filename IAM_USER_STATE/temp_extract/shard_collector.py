@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分片采集脚本
+将设备清单按机房或IP一致性哈希划分为多个分片，每个分片在独立进程（或独立主机）中
+完成采集、解析和设备内TopN，由协调器按同一批次时间合并后统一输出
+
+使用方法:
+    # 单机多进程：按机房分4个分片并行采集，合并后输出
+    python shard_collector.py --shards 4 --strategy machine_room
+
+    # 多主机：各主机分别运行一个分片（批次时间需一致），结果写入共享目录
+    python shard_collector.py --shards 4 --strategy ip_hash --shard-index 0 --batch-time "2024-01-01 10:00:00"
+
+    # 协调器：合并该批次所有分片结果并输出
+    python shard_collector.py --merge output/shards/20240101100000
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import bisect
+import hashlib
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any
+
+import config
+from user_flow_stats import UserFlowStatsProcessor
+
+
+class ConsistentHashRing:
+    """IP一致性哈希环（增减分片时只迁移少量设备）"""
+
+    def __init__(self, shard_count: int, virtual_nodes: int = config.SHARD_HASH_VIRTUAL_NODES):
+        """
+        初始化哈希环
+
+        Args:
+            shard_count: 分片数量
+            virtual_nodes: 每个分片的虚拟节点数
+        """
+        self.ring = []
+        for shard_index in range(shard_count):
+            for node in range(virtual_nodes):
+                self.ring.append((self.hash_key(f"shard-{shard_index}#{node}"), shard_index))
+        self.ring.sort()
+        self.keys = [key for key, _ in self.ring]
+
+    @staticmethod
+    def hash_key(key: str) -> int:
+        """计算键的哈希值（进程和主机之间保持一致）"""
+        return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+    def get_shard(self, ip_address: str) -> int:
+        """获取IP所属分片"""
+        position = bisect.bisect(self.keys, self.hash_key(ip_address)) % len(self.keys)
+        return self.ring[position][1]
+
+
+def partition_devices(processor: UserFlowStatsProcessor, config_data: List[Dict[str, str]],
+                      shard_count: int, strategy: str) -> List[List[Dict[str, str]]]:
+    """
+    将设备配置划分为多个分片
+
+    Args:
+        processor: 已读取配置的UserFlowStatsProcessor实例（用于机房代号映射）
+        config_data: 设备配置信息列表
+        shard_count: 分片数量
+        strategy: "machine_room" 按机房（同一机房的设备在同一分片）或 "ip_hash" 按IP一致性哈希
+
+    Returns:
+        各分片的设备配置列表
+    """
+    shards = [[] for _ in range(shard_count)]
+
+    if strategy == 'machine_room':
+        rooms = sorted(set(processor.map_machine_room_name(item.get('machine_room', 'Unknown')) for item in config_data))
+        room_shard = {room: i % shard_count for i, room in enumerate(rooms)}
+        for item in config_data:
+            room = processor.map_machine_room_name(item.get('machine_room', 'Unknown'))
+            shards[room_shard[room]].append(item)
+    elif strategy == 'ip_hash':
+        ring = ConsistentHashRing(shard_count)
+        for item in config_data:
+            shards[ring.get_shard(item['ip_address'])].append(item)
+    else:
+        raise ValueError(f"不支持的分片方式: {strategy}")
+
+    return shards
+
+
+def collect_shard(shard_index: int, shard_count: int, strategy: str, batch_time: str) -> Dict[str, Any]:
+    """
+    采集单个分片（在工作进程或独立主机中运行）
+
+    Args:
+        shard_index: 分片序号
+        shard_count: 分片数量
+        strategy: 分片方式
+        batch_time: 协调器指定的批次时间
+
+    Returns:
+        分片结果：设备内TopN用户、设备流速、其他端点结果及统计信息
+    """
+    start_time = time.time()
+    processor = UserFlowStatsProcessor()
+    processor.batch_time = batch_time
+
+    config_data = processor.read_excel_config(config.INPUT_FILE_PATH)
+    shard_config = partition_devices(processor, config_data, shard_count, strategy)[shard_index]
+    processor.logger.info(f"分片 {shard_index + 1}/{shard_count} 负责 {len(shard_config)} 台设备")
+
+    if config.INCLUDE_BANDWIDTH_INFO:
+        processor.load_capacity_index(config.DEVICE_INVENTORY_FILE_PATH)
+
+    all_user_data, all_device_data = processor.collect_device_data(shard_config) if shard_config else ([], [])
+
+    # 在分片内完成设备内TopN，只把TopN结果交给协调器
+    top_users = []
+    if all_user_data:
+        machine_room_data = processor.process_user_data_by_device(all_user_data, shard_config)
+        for users in (machine_room_data or {}).values():
+            top_users.extend(users)
+
+    endpoint_results = {name: results for name, results in processor.endpoint_results.items()
+                        if name not in ('user_rank', 'throughput')}
+
+    return {
+        'shard_index': shard_index,
+        'shard_count': shard_count,
+        'strategy': strategy,
+        'batch_time': batch_time,
+        'device_ips': [item['ip_address'] for item in shard_config],
+        'fetched_user_count': len(all_user_data),
+        'user_data': top_users,
+        'device_data': all_device_data,
+        'endpoint_results': endpoint_results,
+        'elapsed_seconds': round(time.time() - start_time, 2)
+    }
+
+
+def to_json_value(value: Any) -> Any:
+    """将numpy/pandas标量转换为JSON可序列化的值"""
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def save_shard_result(result: Dict[str, Any], output_dir: str = config.SHARD_OUTPUT_DIR) -> str:
+    """
+    保存分片结果到批次目录
+
+    Args:
+        result: collect_shard的返回值
+        output_dir: 分片结果根目录
+
+    Returns:
+        分片结果文件路径
+    """
+    batch_dir = os.path.join(output_dir, result['batch_time'].replace('-', '').replace(':', '').replace(' ', ''))
+    os.makedirs(batch_dir, exist_ok=True)
+    output_path = os.path.join(batch_dir, f"shard_{result['shard_index']}_of_{result['shard_count']}.json")
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, default=to_json_value)
+    return output_path
+
+
+def load_shard_results(batch_dir: str) -> List[Dict[str, Any]]:
+    """读取批次目录下的所有分片结果"""
+    results = []
+    for path in sorted(glob.glob(os.path.join(batch_dir, 'shard_*_of_*.json'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            results.append(json.load(f))
+    return results
+
+
+class ShardCoordinator:
+    """分片采集协调器"""
+
+    def __init__(self, shard_count: int = config.SHARD_COUNT, strategy: str = config.SHARD_STRATEGY):
+        """
+        初始化协调器
+
+        Args:
+            shard_count: 分片数量
+            strategy: 分片方式
+        """
+        self.shard_count = shard_count
+        self.strategy = strategy
+        self.processor = UserFlowStatsProcessor()
+        self.logger = logging.getLogger(__name__)
+
+    def run_local(self) -> List[Dict[str, Any]]:
+        """
+        在本机以多进程方式并行采集所有分片
+
+        Returns:
+            各分片结果列表
+        """
+        batch_time = self.processor.batch_time
+        self.logger.info(f"开始分片采集: {self.shard_count} 个分片，分片方式 {self.strategy}，批次时间 {batch_time}")
+
+        results = []
+        with ProcessPoolExecutor(max_workers=self.shard_count) as executor:
+            futures = [executor.submit(collect_shard, i, self.shard_count, self.strategy, batch_time)
+                       for i in range(self.shard_count)]
+            for i, future in enumerate(futures):
+                try:
+                    result = future.result()
+                    results.append(result)
+                    self.logger.info(f"分片 {i + 1}/{self.shard_count} 完成: {len(result['device_ips'])} 台设备，"
+                                     f"耗时 {result['elapsed_seconds']} 秒")
+                except Exception as e:
+                    # 单个分片失败不影响其他分片的结果输出
+                    self.logger.error(f"分片 {i + 1}/{self.shard_count} 采集失败: {str(e)}")
+
+        return results
+
+    def merge_and_publish(self, shard_results: List[Dict[str, Any]]):
+        """
+        合并同一批次的分片结果并输出
+
+        Args:
+            shard_results: 各分片结果列表
+        """
+        if not shard_results:
+            raise ValueError("没有可合并的分片结果")
+
+        batch_times = set(result['batch_time'] for result in shard_results)
+        if len(batch_times) > 1:
+            raise ValueError(f"分片结果的批次时间不一致: {sorted(batch_times)}")
+
+        shard_count = shard_results[0]['shard_count']
+        received = sorted(result['shard_index'] for result in shard_results)
+        missing = sorted(set(range(shard_count)) - set(received))
+        if missing:
+            self.logger.warning(f"缺少分片 {missing}，将只输出已完成分片的数据")
+            print(f"⚠️  缺少分片 {missing}，将只输出已完成分片的数据")
+
+        self.processor.batch_time = batch_times.pop()
+
+        all_user_data = []
+        all_device_data = []
+        endpoint_results = {}
+        fetched_user_count = 0
+        for result in sorted(shard_results, key=lambda r: r['shard_index']):
+            all_user_data.extend(result['user_data'])
+            all_device_data.extend(result['device_data'])
+            fetched_user_count += result['fetched_user_count']
+            for name, items in result['endpoint_results'].items():
+                endpoint_results.setdefault(name, []).extend(items)
+
+        self.logger.info(f"分片合并完成，批次 {self.processor.batch_time}：{len(shard_results)} 个分片，"
+                         f"{len(all_device_data)} 条设备数据，{len(all_user_data)} 条TopN用户数据")
+
+        config_data = self.processor.read_excel_config(config.INPUT_FILE_PATH)
+        if config.INCLUDE_BANDWIDTH_INFO:
+            self.processor.load_capacity_index(config.DEVICE_INVENTORY_FILE_PATH)
+        self.processor.endpoint_results = endpoint_results
+        self.processor.publish_results(config_data, all_user_data, all_device_data, fetched_user_count)
+
+        print(f"\n🧩 分片统计:")
+        for result in sorted(shard_results, key=lambda r: r['shard_index']):
+            print(f"   分片 {result['shard_index'] + 1}/{shard_count}: {len(result['device_ips'])} 台设备, "
+                  f"{len(result['device_data'])} 条设备数据, 耗时 {result['elapsed_seconds']} 秒")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="NF设备分片采集")
+    parser.add_argument('--shards', type=int, default=config.SHARD_COUNT, help="分片数量")
+    parser.add_argument('--strategy', choices=['machine_room', 'ip_hash'], default=config.SHARD_STRATEGY,
+                        help="分片方式")
+    parser.add_argument('--shard-index', type=int, default=None,
+                        help="只运行指定分片（多主机模式），结果写入 SHARD_OUTPUT_DIR")
+    parser.add_argument('--batch-time', default=None, help="批次时间（多主机模式下各分片需一致）")
+    parser.add_argument('--merge', default=None, metavar='BATCH_DIR', help="合并批次目录下的分片结果并输出")
+    args = parser.parse_args()
+
+    try:
+        if args.merge:
+            coordinator = ShardCoordinator()
+            coordinator.merge_and_publish(load_shard_results(args.merge))
+        elif args.shard_index is not None:
+            if not 0 <= args.shard_index < args.shards:
+                raise ValueError(f"分片序号超出范围: {args.shard_index}（共 {args.shards} 个分片）")
+            batch_time = args.batch_time or UserFlowStatsProcessor().batch_time
+            result = collect_shard(args.shard_index, args.shards, args.strategy, batch_time)
+            output_path = save_shard_result(result)
+            print(f"✅ 分片 {args.shard_index + 1}/{args.shards} 完成，{len(result['device_ips'])} 台设备")
+            print(f"📁 分片结果: {output_path}")
+        else:
+            coordinator = ShardCoordinator(args.shards, args.strategy)
+            coordinator.merge_and_publish(coordinator.run_local())
+    except KeyboardInterrupt:
+        print("\n⚠️  程序被用户中断")
+    except Exception as e:
+        print(f"\n❌ 分片采集失败: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
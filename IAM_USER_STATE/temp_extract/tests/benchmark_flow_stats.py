@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用户流速统计流程基准测试
+使用模拟设备集群（tests/mock_device_farm.py）按指定规模驱动 UserFlowStatsProcessor，
+分阶段测量 fetch、parse、top_n、utilization、excel、doris 的墙钟时间、CPU时间和峰值RSS，
+结果写入JSON文件，便于不同版本之间对比
+
+模拟设备集群运行在独立子进程中，不计入本进程的CPU时间
+
+使用方法:
+    # 500台设备 × 每台200个用户 × Top50
+    python tests/benchmark_flow_stats.py --devices 500 --users 200 --top-n 50
+
+    # 与基线结果对比，任一阶段墙钟时间变慢超过10%时返回非0退出码
+    python tests/benchmark_flow_stats.py --devices 500 --compare output/benchmarks/baseline.json --threshold 10
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import platform
+import argparse
+import resource
+import statistics
+import multiprocessing
+from datetime import datetime
+from typing import Dict, Any, List
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from fetch_engine import FetchEngine
+
+BENCHMARK_DIR = os.path.join(config.OUTPUT_DIR, "benchmarks")
+STAGES = ['fetch', 'parse', 'top_n', 'utilization', 'excel', 'doris']
+
+
+def serve_farm(device_count: int, users_per_device: int, port: int, latency_ms: tuple,
+               config_path: str, inventory_path: str, ready):
+    """在子进程中运行模拟设备集群"""
+    from tests.mock_device_farm import MockDeviceFarm
+
+    farm = MockDeviceFarm(
+        device_count=device_count,
+        port=port,
+        latency_ms=latency_ms,
+        users_per_device=users_per_device,
+        recordings_dir=os.path.join(BENCHMARK_DIR, "no_recordings"),  # 基准测试固定使用合成数据
+        seed=0
+    )
+    farm.write_inventory(config_path, inventory_path)
+    farm.start()
+    ready.set()
+    while True:
+        time.sleep(1)
+
+
+def wait_for_port(port: int, timeout: float = 30) -> bool:
+    """等待模拟设备集群端口就绪"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.100.0.1', port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def peak_rss_mb() -> float:
+    """当前进程的峰值RSS（MB）"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class StageTimer:
+    """阶段计时器：记录墙钟时间、CPU时间和峰值RSS"""
+
+    def __init__(self, name: str, results: Dict[str, Dict[str, Any]]):
+        self.name = name
+        self.results = results
+        self.items = 0
+
+    def __enter__(self):
+        self.rss_before = peak_rss_mb()
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        peak = peak_rss_mb()
+        self.results[self.name] = {
+            'wall_s': round(time.perf_counter() - self.wall_start, 4),
+            'cpu_s': round(time.process_time() - self.cpu_start, 4),
+            'peak_rss_mb': round(peak, 1),
+            'rss_growth_mb': round(peak - self.rss_before, 1),
+            'items': self.items
+        }
+
+
+def run_once(processor, config_data: List[Dict[str, str]], with_doris: bool) -> Dict[str, Dict[str, Any]]:
+    """
+    执行一次完整流程并分阶段计时
+
+    Args:
+        processor: UserFlowStatsProcessor实例
+        config_data: 设备配置信息列表
+        with_doris: 是否执行Doris写入阶段
+
+    Returns:
+        各阶段测量结果
+    """
+    results = {}
+
+    engine = FetchEngine(processor)
+    ip_list = [item['ip_address'] for item in config_data]
+
+    with StageTimer('fetch', results) as stage:
+        raw_responses = engine.fetch_all(ip_list)
+        stage.items = sum(len(responses) for responses in raw_responses.values())
+
+    with StageTimer('parse', results) as stage:
+        endpoint_results = engine.parse_all(raw_responses)
+        all_user_data = endpoint_results.get('user_rank', [])
+        all_device_data = endpoint_results.get('throughput', [])
+        stage.items = sum(len(items) for items in endpoint_results.values())
+
+    with StageTimer('top_n', results) as stage:
+        machine_room_data = processor.process_user_data_by_device(all_user_data, config_data)
+        stage.items = sum(len(users) for users in machine_room_data.values())
+
+    with StageTimer('utilization', results) as stage:
+        room_utilization = processor.calculate_bandwidth_utilization(all_device_data)
+        stage.items = len(all_device_data)
+
+    with StageTimer('excel', results) as stage:
+        output_path = os.path.join(BENCHMARK_DIR, "benchmark_output.xlsx")
+        processor.create_output_excel(machine_room_data, all_device_data, output_path, room_utilization)
+        stage.items = sum(len(users) for users in machine_room_data.values()) + len(all_device_data)
+        os.remove(output_path)
+
+    if with_doris:
+        with StageTimer('doris', results) as stage:
+            all_users = [user for users in machine_room_data.values() for user in users]
+            processor.save_user_data_to_database(all_users)
+            processor.save_device_data_to_database(all_device_data)
+            stage.items = len(all_users) + len(all_device_data)
+    else:
+        results['doris'] = {'skipped': True}
+
+    return results
+
+
+def summarize_runs(runs: List[Dict[str, Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    """多次运行取各阶段中位数（峰值RSS取最大值）"""
+    summary = {}
+    for stage in STAGES:
+        samples = [run[stage] for run in runs if stage in run and not run[stage].get('skipped')]
+        if not samples:
+            summary[stage] = {'skipped': True}
+            continue
+        summary[stage] = {
+            'wall_s': round(statistics.median(s['wall_s'] for s in samples), 4),
+            'cpu_s': round(statistics.median(s['cpu_s'] for s in samples), 4),
+            'peak_rss_mb': max(s['peak_rss_mb'] for s in samples),
+            'rss_growth_mb': max(s['rss_growth_mb'] for s in samples),
+            'items': samples[0]['items']
+        }
+    return summary
+
+
+def compare_results(current: Dict[str, Any], baseline_path: str, threshold: float) -> bool:
+    """
+    与基线结果对比并打印各阶段变化
+
+    Args:
+        current: 本次结果
+        baseline_path: 基线结果JSON路径
+        threshold: 判定为性能退化的墙钟时间增幅（%）
+
+    Returns:
+        是否存在性能退化
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    scale_keys = ('devices', 'users_per_device', 'top_n', 'latency_ms')
+    if any(baseline.get('params', {}).get(k) != current['params'].get(k) for k in scale_keys):
+        print(f"⚠️  基线参数与本次不同，对比结果仅供参考: {baseline.get('params')}")
+
+    regressed = False
+    print(f"\n📊 与基线对比: {baseline_path}")
+    print(f"   {'阶段':<12}{'基线(s)':>10}{'本次(s)':>10}{'变化':>10}")
+    for stage in STAGES:
+        base = baseline['stages'].get(stage, {})
+        cur = current['stages'].get(stage, {})
+        if base.get('skipped') or cur.get('skipped') or not base:
+            continue
+        change = (cur['wall_s'] - base['wall_s']) / base['wall_s'] * 100 if base['wall_s'] else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  ❌ 退化'
+            regressed = True
+        print(f"   {stage:<12}{base['wall_s']:>10.3f}{cur['wall_s']:>10.3f}{change:>9.1f}%{flag}")
+    return regressed
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="用户流速统计流程基准测试")
+    parser.add_argument('--devices', type=int, default=100, help="模拟设备数量")
+    parser.add_argument('--users', type=int, default=config.TOP_N_USERS_PER_DEVICE, help="每台设备返回的用户数")
+    parser.add_argument('--top-n', type=int, default=config.TOP_N_USERS_PER_DEVICE, help="每台设备输出的TopN用户数")
+    parser.add_argument('--latency-ms', type=float, nargs=2, default=[0, 0], metavar=('MIN', 'MAX'),
+                        help="模拟设备响应延迟范围（毫秒）")
+    parser.add_argument('--workers', type=int, default=config.FETCH_MAX_WORKERS, help="并发采集线程数")
+    parser.add_argument('--repeat', type=int, default=1, help="重复次数（取中位数）")
+    parser.add_argument('--port', type=int, default=19999, help="模拟设备集群端口")
+    parser.add_argument('--with-doris', action='store_true', help="包含Doris写入阶段（会写入配置的数据库）")
+    parser.add_argument('--output', default=None, help="结果JSON路径")
+    parser.add_argument('--compare', default=None, help="基线结果JSON路径")
+    parser.add_argument('--threshold', type=float, default=10.0, help="性能退化判定阈值（%%）")
+    args = parser.parse_args()
+
+    os.makedirs(BENCHMARK_DIR, exist_ok=True)
+    config_path = os.path.join(BENCHMARK_DIR, "benchmark_IAM配置.xlsx")
+    inventory_path = os.path.join(BENCHMARK_DIR, "benchmark_所有局点NF")
+
+    # 启动模拟设备集群子进程
+    ready = multiprocessing.Event()
+    farm_process = multiprocessing.Process(
+        target=serve_farm,
+        args=(args.devices, args.users, args.port, tuple(args.latency_ms), config_path, inventory_path, ready),
+        daemon=True
+    )
+    farm_process.start()
+    if not ready.wait(60) or not wait_for_port(args.port):
+        print("❌ 模拟设备集群启动失败")
+        farm_process.terminate()
+        sys.exit(1)
+
+    # 基准测试配置：关闭逐条INFO日志，避免日志I/O干扰测量
+    config.API_PORT = args.port
+    config.LOG_LEVEL = "WARNING"
+    config.RECORD_API_RESPONSES = False
+    config.TOP_N_USERS_PER_DEVICE = args.top_n
+    config.FETCH_MAX_WORKERS = args.workers
+    config.USER_API_PAYLOAD = {'filter': dict(config.USER_API_PAYLOAD['filter'], top=args.users)}
+
+    from user_flow_stats import UserFlowStatsProcessor
+
+    try:
+        runs = []
+        for i in range(args.repeat):
+            processor = UserFlowStatsProcessor()
+            config_data = processor.read_excel_config(config_path)
+            processor.load_capacity_index(inventory_path)
+            run = run_once(processor, config_data, args.with_doris)
+            runs.append(run)
+            print(f"✅ 第 {i + 1}/{args.repeat} 次运行完成: "
+                  + ", ".join(f"{k}={v['wall_s']:.3f}s" for k, v in run.items() if not v.get('skipped')))
+    finally:
+        farm_process.terminate()
+        farm_process.join()
+
+    result = {
+        'benchmark': 'user_flow_stats',
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'params': {
+            'devices': args.devices,
+            'users_per_device': args.users,
+            'top_n': args.top_n,
+            'latency_ms': list(args.latency_ms),
+            'workers': args.workers,
+            'repeat': args.repeat
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'stages': summarize_runs(runs),
+        'runs': runs
+    }
+
+    output_path = args.output or os.path.join(
+        BENCHMARK_DIR,
+        f"flow_stats_d{args.devices}_u{args.users}_t{args.top_n}_{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
+    )
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    print(f"\n📏 规模: {args.devices} 台设备 × {args.users} 用户/设备 × Top{args.top_n}")
+    for stage in STAGES:
+        data = result['stages'][stage]
+        if data.get('skipped'):
+            print(f"   {stage:<12} 跳过")
+        else:
+            print(f"   {stage:<12} 墙钟 {data['wall_s']:.3f}s  CPU {data['cpu_s']:.3f}s  "
+                  f"峰值RSS {data['peak_rss_mb']:.1f}MB  条数 {data['items']}")
+    print(f"📁 结果文件: {output_path}")
+
+    if args.compare and compare_results(result, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
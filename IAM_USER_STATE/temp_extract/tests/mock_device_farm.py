@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地模拟设备集群（Mock Device Farm）
+在单台Linux机器上模拟N台NF设备的状态API，用于在没有真实设备的情况下
+对 call_user_api / call_device_api 及整个统计流程进行压测
+
+原理：Linux回环网卡会响应整个127.0.0.0/8网段，因此只需监听0.0.0.0:9999，
+按请求的目的地址（127.100.x.y）区分模拟设备，无需为每台设备单独起服务
+
+响应来源：
+1. 优先回放 config.RECORDINGS_DIR 下录制的真实响应（RECORD_API_RESPONSES=True 时生成）
+2. 没有录制数据时按接口文档格式生成模拟数据
+
+使用方法:
+    # 启动1000台模拟设备，并生成对应的IAM配置和设备列表
+    python tests/mock_device_farm.py --devices 1000 --latency-ms 20 200 --error-rate 0.01
+
+    # 启动模拟设备后直接运行完整统计流程（不写数据库）
+    python tests/mock_device_farm.py --devices 1000 --run-pipeline
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from typing import List, Dict, Any, Optional
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+
+# 设备接口文档中的失败返回
+DEVICE_ERROR_RESPONSE = {
+    "code": 1,
+    "message": "Unknow error, fail to acquire data!"
+}
+
+
+def simulated_device_ips(device_count: int) -> List[str]:
+    """
+    生成模拟设备IP列表（127.100.0.0/16 回环地址段）
+
+    Args:
+        device_count: 模拟设备数量
+
+    Returns:
+        设备IP列表
+    """
+    return [f"127.{100 + i // 62500}.{(i // 250) % 250}.{i % 250 + 1}" for i in range(device_count)]
+
+
+class MockDeviceFarm:
+    """模拟设备集群"""
+
+    def __init__(self, device_count: int, host: str = "0.0.0.0", port: int = config.API_PORT,
+                 latency_ms: tuple = (0, 0), error_rate: float = 0.0, timeout_rate: float = 0.0,
+                 timeout_seconds: float = config.REQUEST_TIMEOUT + 1, check_auth: bool = True,
+                 users_per_device: int = config.TOP_N_USERS_PER_DEVICE,
+                 recordings_dir: str = config.RECORDINGS_DIR, seed: Optional[int] = None):
+        """
+        初始化模拟设备集群
+
+        Args:
+            device_count: 模拟设备数量
+            host: 监听地址
+            port: 监听端口（与config.API_PORT一致时流程无需改动）
+            latency_ms: 响应延迟范围（毫秒），(最小, 最大)
+            error_rate: 返回错误响应的概率
+            timeout_rate: 模拟超时（挂起timeout_seconds后才响应）的概率
+            timeout_seconds: 模拟超时的挂起时长（秒）
+            check_auth: 是否校验random/md5认证参数
+            users_per_device: 没有录制数据时每台设备生成的用户数
+            recordings_dir: 录制响应目录
+            seed: 随机种子
+        """
+        self.device_ips = simulated_device_ips(device_count)
+        self.device_index = {ip: i for i, ip in enumerate(self.device_ips)}
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_seconds = timeout_seconds
+        self.check_auth = check_auth
+        self.users_per_device = users_per_device
+        self.random = random.Random(seed)
+        self.recordings = self.load_recordings(recordings_dir)
+
+        self.used_randoms = {}  # 每台设备已使用的random值，用于检测重放
+        self.stats = {'requests': 0, 'ok': 0, 'auth_failed': 0, 'errors': 0, 'timeouts': 0, 'unknown_device': 0}
+        self.lock = threading.Lock()
+        self.server = None
+        self.thread = None
+
+    def load_recordings(self, recordings_dir: str) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        加载录制的真实响应
+
+        Args:
+            recordings_dir: 录制目录，结构为 <接口名>/<设备IP>.json，<接口名>/.endpoint 保存原始接口路径
+
+        Returns:
+            接口路径到响应列表的字典
+        """
+        recordings = {}
+        for endpoint_dir in glob.glob(os.path.join(recordings_dir, '*')):
+            if not os.path.isdir(endpoint_dir):
+                continue
+            endpoint = self.recorded_endpoint(endpoint_dir)
+            responses = []
+            for file_path in sorted(glob.glob(os.path.join(endpoint_dir, '*.json'))):
+                try:
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        responses.append(json.load(f))
+                except Exception as e:
+                    print(f"⚠️  跳过无法解析的录制文件 {file_path}: {e}")
+            if responses:
+                recordings[endpoint] = responses
+                print(f"📼 加载 {endpoint} 录制响应 {len(responses)} 条")
+        return recordings
+
+    @staticmethod
+    def recorded_endpoint(endpoint_dir: str) -> str:
+        """
+        录制目录对应的接口路径：优先读取录制时保存的 .endpoint 文件；
+        旧版录制没有该文件时由目录名还原（接口路径本身含'_'时会还原错误）
+        """
+        endpoint_file = os.path.join(endpoint_dir, '.endpoint')
+        if os.path.exists(endpoint_file):
+            with open(endpoint_file, 'r', encoding='utf-8') as f:
+                endpoint = f.read().strip()
+            if endpoint:
+                return '/' + endpoint.lstrip('/')
+        endpoint = '/' + os.path.basename(endpoint_dir).replace('_', '/')
+        print(f"⚠️  录制目录 {endpoint_dir} 缺少 .endpoint 文件，按目录名还原为 {endpoint}")
+        return endpoint
+
+    def verify_auth(self, device_ip: str, query: Dict[str, List[str]]) -> Optional[int]:
+        """
+        校验random/md5认证参数
+
+        Args:
+            device_ip: 模拟设备IP
+            query: URL查询参数
+
+        Returns:
+            校验失败时返回HTTP状态码，通过时返回None
+        """
+        random_str = query.get('random', [''])[0]
+        md5_value = query.get('md5', [''])[0]
+        if not random_str or not md5_value:
+            return 401
+
+        expected = hashlib.md5((config.SHARED_SECRET + random_str).encode('utf-8')).hexdigest()
+        if md5_value != expected:
+            return 401
+
+        # 同一设备上random不允许重复使用
+        with self.lock:
+            used = self.used_randoms.setdefault(device_ip, set())
+            if random_str in used:
+                return 403
+            used.add(random_str)
+        return None
+
+    def build_response(self, device_ip: str, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        构建模拟设备的响应数据
+
+        Args:
+            device_ip: 模拟设备IP
+            path: 请求路径
+            payload: 请求体
+
+        Returns:
+            响应JSON
+        """
+        index = self.device_index[device_ip]
+
+        # 优先回放录制数据
+        if path in self.recordings:
+            responses = self.recordings[path]
+            return responses[index % len(responses)]
+
+        if path == config.USER_API_ENDPOINT:
+            top = int(payload.get('filter', {}).get('top', self.users_per_device))
+            users = []
+            for rank in range(min(top, self.users_per_device)):
+                up = self.random.randint(1000, 2000000) // (rank + 1)
+                down = self.random.randint(1000, 8000000) // (rank + 1)
+                users.append({
+                    'id': rank + 1,
+                    'name': f"user{index}_{rank}",
+                    'group': '/default',
+                    'ip': f"10.{index // 250 % 250}.{index % 250}.{rank + 1}",
+                    'up': up,
+                    'down': down,
+                    'total': up + down,
+                    'session': self.random.randint(1, 500),
+                    'status': True
+                })
+            return {'code': 0, 'message': 'Successfully', 'data': users}
+
+        if path == config.DEVICE_API_ENDPOINT:
+            return {
+                'code': 0,
+                'message': 'Successfully',
+                'data': {
+                    'send': self.random.randint(10 ** 7, 6 * 10 ** 8),
+                    'recv': self.random.randint(10 ** 8, 12 * 10 ** 8),
+                    'unit': payload.get('unit', 'bytes')
+                }
+            }
+
+        # 其他接口返回空数据
+        return {'code': 0, 'message': 'Successfully', 'data': []}
+
+    def create_handler(self):
+        """创建绑定到当前集群的请求处理类"""
+        farm = self
+
+        class DeviceRequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # 支持keep-alive，便于客户端连接复用
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status: int, body: Dict[str, Any]):
+                content = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def handle_request(self):
+                device_ip = self.connection.getsockname()[0]
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+
+                with farm.lock:
+                    farm.stats['requests'] += 1
+
+                if device_ip not in farm.device_index:
+                    with farm.lock:
+                        farm.stats['unknown_device'] += 1
+                    self.send_json(404, DEVICE_ERROR_RESPONSE)
+                    return
+
+                parsed = urlparse(self.path)
+                query = parse_qs(parsed.query)
+
+                if farm.check_auth:
+                    auth_status = farm.verify_auth(device_ip, query)
+                    if auth_status:
+                        with farm.lock:
+                            farm.stats['auth_failed'] += 1
+                        self.send_json(auth_status, {'code': 1, 'message': 'Authentication failed'})
+                        return
+
+                # 延迟、超时和错误注入
+                low, high = farm.latency_ms
+                if high > 0:
+                    time.sleep(farm.random.uniform(low, high) / 1000)
+
+                if farm.timeout_rate and farm.random.random() < farm.timeout_rate:
+                    with farm.lock:
+                        farm.stats['timeouts'] += 1
+                    time.sleep(farm.timeout_seconds)
+
+                if farm.error_rate and farm.random.random() < farm.error_rate:
+                    with farm.lock:
+                        farm.stats['errors'] += 1
+                    self.send_json(500, DEVICE_ERROR_RESPONSE)
+                    return
+
+                try:
+                    payload = json.loads(body.decode('utf-8')) if body else {}
+                except (ValueError, UnicodeDecodeError):
+                    payload = {}
+
+                self.send_json(200, farm.build_response(device_ip, parsed.path, payload))
+                with farm.lock:
+                    farm.stats['ok'] += 1
+
+            do_POST = handle_request
+            do_GET = handle_request
+
+        return DeviceRequestHandler
+
+    def start(self):
+        """在后台线程中启动模拟设备集群"""
+        handler = self.create_handler()
+        ThreadingHTTPServer.request_queue_size = 4096
+        self.server = ThreadingHTTPServer((self.host, self.port), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        print(f"🚀 模拟设备集群已启动: {len(self.device_ips)} 台设备，监听 {self.host}:{self.port}")
+
+    def stop(self):
+        """停止模拟设备集群"""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        print(f"🛑 模拟设备集群已停止，请求统计: {self.stats}")
+
+    def write_inventory(self, config_path: str, inventory_path: str):
+        """
+        生成与模拟设备对应的IAM配置Excel和AC设备列表
+
+        Args:
+            config_path: IAM配置Excel输出路径（设备类型、局点名称、设备IP、机房）
+            inventory_path: AC设备列表输出路径（与所有局点NF格式相同）
+        """
+        import pandas as pd
+
+        machine_rooms = list(config.MACHINE_ROOM_MAPPING.keys())
+        rows = []
+        devices = []
+        for i, device_ip in enumerate(self.device_ips):
+            machine_room = machine_rooms[i % len(machine_rooms)]
+            bandwidth = 1 if i % 2 == 0 else 2
+            device_name = f"{machine_room}-MOCK-{i + 1}"
+            rows.append({
+                '设备类型': '10G' if bandwidth == 1 else '25G',
+                '局点名称': device_name,
+                '设备IP': device_ip,
+                '机房': machine_room
+            })
+            devices.append({
+                'id': i + 1,
+                'deviceName': device_name,
+                'deviceIp': device_ip,
+                'machineRoomName': machine_room,
+                'deviceStatus': 1,
+                'bandwidth': bandwidth,
+                'proxyPort': self.port
+            })
+
+        pd.DataFrame(rows).to_excel(config_path, index=False, engine='openpyxl')
+        with open(inventory_path, 'w', encoding='utf-8') as f:
+            page = {'code': 1, 'msg': '响应成功', 'data': {'total': len(devices), 'list': devices}}
+            f.write(json.dumps(page, ensure_ascii=False) + '\n')
+
+        print(f"📄 已生成IAM配置: {config_path}")
+        print(f"📄 已生成设备列表: {inventory_path}")
+
+
+def run_pipeline(farm: MockDeviceFarm, config_path: str, inventory_path: str):
+    """
+    使用模拟设备运行完整统计流程（不写数据库）
+
+    Args:
+        farm: 已启动的模拟设备集群
+        config_path: 模拟设备IAM配置路径
+        inventory_path: 模拟设备列表路径
+    """
+    from user_flow_stats import UserFlowStatsProcessor
+
+    config.API_PORT = farm.port
+    config.INPUT_FILE_PATH = config_path
+    config.DEVICE_INVENTORY_FILE_PATH = inventory_path
+    config.OUTPUT_TO_DATABASE = False
+    config.RECORD_API_RESPONSES = False
+
+    start_time = time.time()
+    UserFlowStatsProcessor().run()
+    elapsed = time.time() - start_time
+    print(f"\n⏱️  {len(farm.device_ips)} 台模拟设备完整流程耗时: {elapsed:.2f}秒")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="NF设备状态API模拟集群")
+    parser.add_argument('--devices', type=int, default=100, help="模拟设备数量")
+    parser.add_argument('--port', type=int, default=config.API_PORT, help="监听端口")
+    parser.add_argument('--latency-ms', type=float, nargs=2, default=[0, 0], metavar=('MIN', 'MAX'),
+                        help="响应延迟范围（毫秒）")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="错误响应概率")
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help="模拟超时概率")
+    parser.add_argument('--timeout-seconds', type=float, default=config.REQUEST_TIMEOUT + 1, help="模拟超时挂起时长（秒）")
+    parser.add_argument('--no-auth', action='store_true', help="不校验random/md5认证参数")
+    parser.add_argument('--seed', type=int, default=None, help="随机种子")
+    parser.add_argument('--run-pipeline', action='store_true', help="启动后运行完整统计流程")
+    args = parser.parse_args()
+
+    farm = MockDeviceFarm(
+        device_count=args.devices,
+        port=args.port,
+        latency_ms=tuple(args.latency_ms),
+        error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate,
+        timeout_seconds=args.timeout_seconds,
+        check_auth=not args.no_auth,
+        seed=args.seed
+    )
+
+    config_path = os.path.join(config.OUTPUT_DIR, "mock_IAM配置.xlsx")
+    inventory_path = os.path.join(config.OUTPUT_DIR, "mock_所有局点NF")
+    farm.write_inventory(config_path, inventory_path)
+    farm.start()
+
+    try:
+        if args.run_pipeline:
+            run_pipeline(farm, config_path, inventory_path)
+        else:
+            print("按 Ctrl+C 停止...")
+            while True:
+                time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        farm.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -13,10 +13,12 @@ import json
 import logging
 import hashlib
 import random
+import re
 import string
+import threading
 import time
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
 # 尝试导入依赖包，如果失败则给出提示
 try:
@@ -33,6 +35,7 @@ except ImportError:
 
 try:
     import openpyxl
+    from openpyxl.styles import PatternFill
 except ImportError:
     print("❌ 缺少 openpyxl 包，请运行: pip install openpyxl")
     sys.exit(1)
@@ -47,6 +50,7 @@ except ImportError:
 
 import config
 from doris_connector import DorisConnector
+from fetch_engine import FetchEngine
 
 
 class UserFlowStatsProcessor:
@@ -60,7 +64,11 @@ class UserFlowStatsProcessor:
         self.all_device_data = []  # 存储设备级别流速数据
         self.station_names = {}  # 存储局点名称映射
         self.device_info_map = {}  # 存储设备信息映射
+        self.capacity_index = {}  # 存储设备IP到端口容量(Mb/s)的索引
         self.used_randoms = set()  # 存储已使用的random值，防止重复
+        self.random_lock = threading.Lock()  # 并发采集时保护used_randoms
+        self.session = self.create_http_session()  # 所有端点共享的HTTP连接池
+        self.endpoint_results = {}  # 存储本轮各采集端点的解析结果
         # 生成批次时间（整分钟）
         self.batch_time = self.generate_batch_time()
         
@@ -92,6 +100,24 @@ class UserFlowStatsProcessor:
         self.logger.info(f"生成批次时间: {batch_time_str}")
         return batch_time_str
 
+    def create_http_session(self) -> requests.Session:
+        """
+        创建共享连接池的HTTP会话
+
+        Returns:
+            requests.Session实例
+        """
+        session = requests.Session()
+        # 重试由request_api_json统一处理，连接池只负责复用连接
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=config.FETCH_POOL_CONNECTIONS,
+            pool_maxsize=config.FETCH_POOL_MAXSIZE,
+            max_retries=0
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
     def generate_random_string(self) -> str:
         """
         生成唯一的随机字符串用于API认证
@@ -111,15 +137,17 @@ class UserFlowStatsProcessor:
             random_str = timestamp + random_chars
 
             # 确保不重复
-            if random_str not in self.used_randoms:
-                self.used_randoms.add(random_str)
-                self.logger.debug(f"生成random字符串: {random_str}")
-                return random_str
+            with self.random_lock:
+                if random_str not in self.used_randoms:
+                    self.used_randoms.add(random_str)
+                    self.logger.debug(f"生成random字符串: {random_str}")
+                    return random_str
 
         # 如果尝试多次仍然重复，使用UUID确保唯一性
         import uuid
         random_str = str(uuid.uuid4()).replace('-', '')[:config.RANDOM_LENGTH]
-        self.used_randoms.add(random_str)
+        with self.random_lock:
+            self.used_randoms.add(random_str)
         self.logger.debug(f"使用UUID生成random字符串: {random_str}")
         return random_str
 
@@ -199,6 +227,32 @@ class UserFlowStatsProcessor:
             self.logger.warning(f"流速单位转换失败: {str(e)}")
             return 0.0
 
+    def record_api_response(self, endpoint: str, ip_address: str, data: Dict[str, Any]):
+        """
+        录制API原始响应到磁盘（recordings/<接口名>/<设备IP>.json），
+        目录名中的'/'被替换为'_'，原始接口路径另存于目录下的 .endpoint 文件
+
+        Args:
+            endpoint: API端点路径
+            ip_address: 设备IP地址
+            data: 解析后的原始响应JSON
+        """
+        if not config.RECORD_API_RESPONSES:
+            return
+
+        try:
+            endpoint_dir = os.path.join(config.RECORDINGS_DIR, endpoint.strip('/').replace('/', '_'))
+            os.makedirs(endpoint_dir, exist_ok=True)
+            endpoint_file = os.path.join(endpoint_dir, '.endpoint')
+            if not os.path.exists(endpoint_file):
+                with open(endpoint_file, 'w', encoding='utf-8') as f:
+                    f.write(endpoint)
+            with open(os.path.join(endpoint_dir, f"{ip_address}.json"), 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            self.logger.debug(f"已录制 {ip_address} 的 {endpoint} 响应")
+        except Exception as e:
+            self.logger.warning(f"录制API响应失败，IP: {ip_address}, 错误: {str(e)}")
+
     def save_user_data_to_database(self, data: List[Dict[str, Any]]) -> bool:
         """
         将用户级别数据保存到Doris数据库
@@ -385,6 +439,103 @@ class UserFlowStatsProcessor:
             self.logger.error(f"设备数据库保存失败: {str(e)}")
             return False
 
+    def save_hot_device_data_to_database(self, data: List[Dict[str, Any]]) -> bool:
+        """
+        将热点设备（带宽利用率超过阈值）数据保存到Doris数据库
+
+        Args:
+            data: 热点设备数据列表
+
+        Returns:
+            是否保存成功
+        """
+        if not DB_AVAILABLE:
+            self.logger.warning("数据库功能不可用，跳过热点设备数据库保存")
+            return False
+
+        try:
+            self.logger.info("开始连接Doris数据库保存热点设备数据...")
+
+            # 使用Doris连接器
+            with DorisConnector(self.logger) as connector:
+                if not connector.test_connection():
+                    self.logger.error("Doris数据库连接失败")
+                    return False
+
+                # 创建热点设备表（如果不存在）- Doris版本
+                create_table_sql = f"""
+                CREATE TABLE IF NOT EXISTS `{config.DB_HOT_DEVICE_TABLE}` (
+                    `id` BIGINT NOT NULL AUTO_INCREMENT COMMENT '自增主键',
+                    `machine_room` VARCHAR(100) NOT NULL COMMENT '机房',
+                    `device_ip` VARCHAR(45) NOT NULL COMMENT '设备IP',
+                    `device_type` VARCHAR(10) NOT NULL COMMENT '设备类型',
+                    `record_time` DATETIME DEFAULT CURRENT_TIMESTAMP COMMENT '记录时间',
+                    `capacity_mbps` DECIMAL(12,3) NOT NULL DEFAULT "0" COMMENT '端口容量Mbps',
+                    `up_flow_rate` DECIMAL(12,3) NOT NULL DEFAULT "0" COMMENT '上行Mbps',
+                    `down_flow_rate` DECIMAL(12,3) NOT NULL DEFAULT "0" COMMENT '下行Mbps',
+                    `up_utilization` DECIMAL(6,2) NOT NULL DEFAULT "0" COMMENT '上行利用率%',
+                    `down_utilization` DECIMAL(6,2) NOT NULL DEFAULT "0" COMMENT '下行利用率%',
+                    `utilization` DECIMAL(6,2) NOT NULL DEFAULT "0" COMMENT '带宽利用率%',
+                    `created_at` DATETIME DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+                    `updated_at` DATETIME DEFAULT CURRENT_TIMESTAMP COMMENT '更新时间'
+                ) ENGINE=OLAP
+                DUPLICATE KEY(`id`, `machine_room`, `device_ip`, `device_type`, `record_time`)
+                COMMENT 'NF热点设备带宽利用率统计表'
+                DISTRIBUTED BY HASH(`device_ip`) BUCKETS 8
+                PROPERTIES (
+                    "replication_allocation" = "tag.location.default: 1",
+                    "storage_format" = "V2",
+                    "light_schema_change" = "true",
+                    "disable_auto_compaction" = "false",
+                    "enable_single_replica_compaction" = "false"
+                )
+                """
+
+                if not connector.create_table_if_not_exists(config.DB_HOT_DEVICE_TABLE, create_table_sql):
+                    return False
+
+                # 准备批量插入数据
+                columns = [
+                    'machine_room', 'device_ip', 'device_type', 'capacity_mbps',
+                    'up_flow_rate', 'down_flow_rate', 'up_utilization', 'down_utilization',
+                    'utilization', 'record_time'
+                ]
+
+                batch_data = []
+                for record in data:
+                    try:
+                        values = (
+                            record.get('machine_room', 'Unknown'),  # 机房
+                            record.get('device_ip', ''),           # 设备IP
+                            record.get('device_type', 'Unknown'),  # 设备类型
+                            record.get('capacity_mbps', 0),        # 端口容量Mbps
+                            record.get('up_mbps', 0),              # 上行Mbps
+                            record.get('down_mbps', 0),            # 下行Mbps
+                            record.get('up_utilization', 0),       # 上行利用率%
+                            record.get('down_utilization', 0),     # 下行利用率%
+                            record.get('utilization', 0),          # 带宽利用率%
+                            self.batch_time                        # 批次时间
+                        )
+                        batch_data.append(values)
+
+                    except Exception as e:
+                        self.logger.warning(f"准备热点设备记录失败: {str(e)}")
+                        continue
+
+                # 批量插入数据
+                success, insert_count = connector.batch_insert(config.DB_HOT_DEVICE_TABLE, columns, batch_data)
+
+                if success:
+                    self.logger.info(f"成功保存 {insert_count} 条热点设备记录到Doris数据库")
+                    return True
+                else:
+                    self.logger.error("批量插入热点设备数据失败")
+                    return False
+
+        except Exception as e:
+            self.logger.error(f"热点设备数据库保存失败: {str(e)}")
+            return False
+
     def convert_flow_rate_unit(self, bytes_per_second: float) -> Dict[str, Any]:
         """
         转换流速单位从B/s到更易读的单位
@@ -501,92 +652,289 @@ class UserFlowStatsProcessor:
             self.logger.error(f"读取Excel配置文件失败: {str(e)}")
             raise
     
-    def call_user_api(self, ip_address: str) -> Optional[List[Dict[str, Any]]]:
+    def parse_capacity_from_device_type(self, device_type: str) -> Optional[float]:
         """
-        调用API获取用户流量数据
+        从设备类型（如"10G"、"25G"）解析端口容量
+
+        Args:
+            device_type: 设备类型字符串
+
+        Returns:
+            端口容量（Mb/s），无法解析时返回None
+        """
+        match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*G', str(device_type), re.IGNORECASE)
+        if match:
+            return float(match.group(1)) * 1000
+        return None
+
+    def load_capacity_index(self, inventory_path: str) -> Dict[str, float]:
+        """
+        加载设备IP到端口容量的索引（随设备清单加载一次）
+
+        优先使用AC设备列表中的带宽等级，设备列表中缺失的设备
+        再根据配置文件中的设备类型（如"10G"）推算
+
+        Args:
+            inventory_path: AC设备列表文件路径（每行一页JSON）
+
+        Returns:
+            设备IP到端口容量(Mb/s)的字典
+        """
+        capacity_index = {}
+
+        if os.path.exists(inventory_path):
+            try:
+                with open(inventory_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        page = json.loads(line)
+                        for device in page.get('data', {}).get('list', []):
+                            device_ip = device.get('deviceIp')
+                            capacity = config.BANDWIDTH_CLASS_MAPPING.get(device.get('bandwidth'))
+                            if device_ip and capacity:
+                                capacity_index[device_ip] = float(capacity)
+                self.logger.info(f"从设备列表加载 {len(capacity_index)} 台设备的带宽等级")
+            except Exception as e:
+                self.logger.warning(f"读取设备列表失败，仅使用设备类型推算容量: {str(e)}")
+        else:
+            self.logger.warning(f"设备列表文件不存在: {inventory_path}，仅使用设备类型推算容量")
+
+        # 设备列表中缺失的设备按设备类型推算
+        for device_ip, device_info in self.device_info_map.items():
+            if device_ip not in capacity_index:
+                capacity = self.parse_capacity_from_device_type(device_info.get('device_type', ''))
+                if capacity:
+                    capacity_index[device_ip] = capacity
+
+        missing = [ip for ip in self.device_info_map if ip not in capacity_index]
+        if missing:
+            self.logger.warning(f"{len(missing)} 台设备缺少端口容量信息，不计算带宽利用率")
+
+        self.capacity_index = capacity_index
+        return capacity_index
+
+    def calculate_bandwidth_utilization(self, device_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        计算设备和机房的带宽利用率（向量化计算，不额外调用API）
+
+        设备记录会被原地补充以下字段：capacity_mbps、up_utilization、
+        down_utilization、utilization（上下行较大者）、is_hot
+
+        Args:
+            device_data: 设备级别流速数据列表
+
+        Returns:
+            按机房汇总的带宽利用率列表
+        """
+        if not device_data:
+            return []
+
+        df = pd.DataFrame(device_data)
+
+        # 未开启单位转换时由原始B/s计算Mb/s
+        for direction in ('up', 'down'):
+            if f'{direction}_mbps' not in df.columns:
+                df[f'{direction}_mbps'] = pd.to_numeric(df[f'{direction}_bytes'], errors='coerce') * 8 / 1000000
+
+        df['capacity_mbps'] = df['device_ip'].map(self.capacity_index)
+        capacity = df['capacity_mbps'].where(df['capacity_mbps'] > 0)
+        df['up_utilization'] = (df['up_mbps'] / capacity * 100).round(2)
+        df['down_utilization'] = (df['down_mbps'] / capacity * 100).round(2)
+        df['utilization'] = df[['up_utilization', 'down_utilization']].max(axis=1)
+        df['is_hot'] = df['utilization'] >= config.HOT_DEVICE_UTILIZATION_THRESHOLD
+
+        # 回写到设备记录
+        result_columns = ['capacity_mbps', 'up_utilization', 'down_utilization', 'utilization', 'is_hot']
+        enriched = df[result_columns].astype(object).where(df[result_columns].notna(), None)
+        for record, values in zip(device_data, enriched.to_dict('records')):
+            record.update(values)
+            record['is_hot'] = bool(values['is_hot'])
+
+        # 按机房汇总（只统计有容量信息的设备）
+        known = df[df['capacity_mbps'] > 0]
+        room_utilization = []
+        for machine_room, room_df in known.groupby('machine_room'):
+            total_capacity = float(room_df['capacity_mbps'].sum())
+            up_total = float(room_df['up_mbps'].sum())
+            down_total = float(room_df['down_mbps'].sum())
+            up_utilization = round(up_total / total_capacity * 100, 2)
+            down_utilization = round(down_total / total_capacity * 100, 2)
+            room_utilization.append({
+                'machine_room': machine_room,
+                'device_count': len(room_df),
+                'capacity_mbps': round(total_capacity, 3),
+                'up_mbps': round(up_total, 3),
+                'down_mbps': round(down_total, 3),
+                'up_utilization': up_utilization,
+                'down_utilization': down_utilization,
+                'utilization': max(up_utilization, down_utilization),
+                'hot_device_count': int(room_df['is_hot'].sum())
+            })
+
+        hot_count = int(df['is_hot'].sum())
+        self.logger.info(f"带宽利用率计算完成，{len(room_utilization)}个机房，"
+                         f"热点设备(>={config.HOT_DEVICE_UTILIZATION_THRESHOLD}%) {hot_count} 台")
+        return room_utilization
+
+    def request_api_json(self, ip_address: str, endpoint: str, headers: Dict[str, str],
+                         payload: Dict[str, Any], api_label: str) -> Optional[Dict[str, Any]]:
+        """
+        向设备发送带认证参数的API请求并返回响应JSON（含重试）
 
         Args:
             ip_address: 设备IP地址
+            endpoint: API端点路径
+            headers: 请求头
+            payload: 请求体（只包含业务参数）
+            api_label: 日志中使用的接口名称，如"用户API"、"设备API"
 
         Returns:
-            用户数据列表，失败时返回None
+            响应JSON字典，失败时返回None
         """
         for attempt in range(config.MAX_RETRIES):
             try:
-                self.logger.debug(f"向 {ip_address} 发送用户API请求 (尝试 {attempt + 1}/{config.MAX_RETRIES})")
+                self.logger.debug(f"向 {ip_address} 发送{api_label}请求 (尝试 {attempt + 1}/{config.MAX_RETRIES})")
 
                 # 获取认证参数
                 auth_params = self.get_auth_params()
 
                 # 构建URL，将认证参数放在查询参数中
-                url = f"http://{ip_address}:{config.API_PORT}{config.USER_API_ENDPOINT}?_method=GET&random={auth_params['random']}&md5={auth_params['md5']}"
+                url = f"http://{ip_address}:{config.API_PORT}{endpoint}?_method=GET&random={auth_params['random']}&md5={auth_params['md5']}"
 
-                # 构建请求体，只包含业务参数
-                request_payload = config.USER_API_PAYLOAD
+                self.logger.debug(f"{api_label}请求URL: {url}")
+                self.logger.debug(f"{api_label}请求体: {json.dumps(payload, ensure_ascii=False)}")
 
-                self.logger.debug(f"请求URL: {url}")
-                self.logger.debug(f"请求体: {json.dumps(request_payload, ensure_ascii=False)}")
-
-                response = requests.post(
+                response = self.session.post(
                     url,
-                    headers=config.USER_API_HEADERS,
-                    json=request_payload,
+                    headers=headers,
+                    json=payload,
                     timeout=config.REQUEST_TIMEOUT
                 )
-                
+
                 if response.status_code == 200:
                     try:
                         data = response.json()
-                        if 'data' in data and isinstance(data['data'], list):
-                            user_data = data['data']
-                            self.logger.info(f"从 {ip_address} 获取到 {len(user_data)} 条用户数据")
-
-                            # 为每条数据添加来源信息并转换流速单位
-                            for user in user_data:
-                                user['source_ip'] = ip_address
-                                user['station_name'] = self.station_names.get(ip_address, ip_address)
-
-                                # 转换流速单位从B/s到Mb/s
-                                if config.CONVERT_TO_MBPS:
-                                    if 'up' in user:
-                                        user['up_mbps'] = self.convert_bytes_to_mbps(float(user.get('up', 0)))
-                                    if 'down' in user:
-                                        user['down_mbps'] = self.convert_bytes_to_mbps(float(user.get('down', 0)))
-                                    if 'total' in user:
-                                        user['total_mbps'] = self.convert_bytes_to_mbps(float(user.get('total', 0)))
-
-                            return user_data
-                        else:
-                            self.logger.warning(f"API响应格式异常，IP: {ip_address}, 响应: {data}")
-                            return None
+                        self.record_api_response(endpoint, ip_address, data)
+                        return data
                     except json.JSONDecodeError:
-                        self.logger.warning(f"API响应JSON解析失败，IP: {ip_address}")
+                        self.logger.warning(f"{api_label}响应JSON解析失败，IP: {ip_address}")
                         return None
                 elif response.status_code == 401:
-                    self.logger.error(f"API认证失败，IP: {ip_address}, 请检查共享密钥配置")
+                    self.logger.error(f"{api_label}认证失败，IP: {ip_address}, 请检查共享密钥配置")
                     return None
                 elif response.status_code == 403:
-                    self.logger.error(f"API访问被拒绝，IP: {ip_address}, 可能是认证参数错误")
+                    self.logger.error(f"{api_label}访问被拒绝，IP: {ip_address}, 可能是认证参数错误")
                     return None
                 else:
-                    self.logger.warning(f"API请求失败，IP: {ip_address}, 状态码: {response.status_code}")
+                    self.logger.warning(f"{api_label}请求失败，IP: {ip_address}, 状态码: {response.status_code}")
                     try:
                         error_data = response.json()
                         self.logger.warning(f"错误详情: {error_data}")
                     except:
                         self.logger.warning(f"响应内容: {response.text[:200]}")
-                    
+
             except requests.exceptions.Timeout:
-                self.logger.warning(f"API请求超时，IP: {ip_address} (尝试 {attempt + 1}/{config.MAX_RETRIES})")
+                self.logger.warning(f"{api_label}请求超时，IP: {ip_address} (尝试 {attempt + 1}/{config.MAX_RETRIES})")
             except requests.exceptions.ConnectionError:
-                self.logger.warning(f"连接失败，IP: {ip_address} (尝试 {attempt + 1}/{config.MAX_RETRIES})")
+                self.logger.warning(f"{api_label}连接失败，IP: {ip_address} (尝试 {attempt + 1}/{config.MAX_RETRIES})")
             except Exception as e:
-                self.logger.error(f"API请求异常，IP: {ip_address}, 错误: {str(e)}")
+                self.logger.error(f"{api_label}请求异常，IP: {ip_address}, 错误: {str(e)}")
                 break
-        
-        self.logger.error(f"用户API请求最终失败，IP: {ip_address}")
+
+        self.logger.error(f"{api_label}请求最终失败，IP: {ip_address}")
         return None
 
+    def parse_user_api_response(self, ip_address: str, data: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """
+        解析用户流速排行响应
+
+        Args:
+            ip_address: 设备IP地址
+            data: 用户API响应JSON
+
+        Returns:
+            用户数据列表，格式异常时返回None
+        """
+        if 'data' in data and isinstance(data['data'], list):
+            user_data = data['data']
+            self.logger.info(f"从 {ip_address} 获取到 {len(user_data)} 条用户数据")
+
+            # 为每条数据添加来源信息并转换流速单位
+            for user in user_data:
+                user['source_ip'] = ip_address
+                user['station_name'] = self.station_names.get(ip_address, ip_address)
+
+                # 转换流速单位从B/s到Mb/s
+                if config.CONVERT_TO_MBPS:
+                    if 'up' in user:
+                        user['up_mbps'] = self.convert_bytes_to_mbps(float(user.get('up', 0)))
+                    if 'down' in user:
+                        user['down_mbps'] = self.convert_bytes_to_mbps(float(user.get('down', 0)))
+                    if 'total' in user:
+                        user['total_mbps'] = self.convert_bytes_to_mbps(float(user.get('total', 0)))
+
+            return user_data
+
+        self.logger.warning(f"API响应格式异常，IP: {ip_address}, 响应: {data}")
+        return None
+
+    def parse_device_api_response(self, ip_address: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        解析设备吞吐量响应
+
+        Args:
+            ip_address: 设备IP地址
+            data: 设备API响应JSON
+
+        Returns:
+            设备流速记录，格式异常时返回None
+        """
+        if 'data' in data and isinstance(data['data'], dict):
+            device_data = data['data']
+            self.logger.info(f"从 {ip_address} 获取到设备流速数据")
+
+            # 获取设备信息
+            device_info = self.device_info_map.get(ip_address, {})
+
+            # 构建设备流速记录
+            device_record = {
+                'device_ip': ip_address,
+                'machine_room': device_info.get('machine_room', 'Unknown'),
+                'device_type': device_info.get('device_type', 'Unknown'),
+                'up_bytes': device_data.get('send', 0),  # 上行流速 B/s
+                'down_bytes': device_data.get('recv', 0),  # 下行流速 B/s
+                'unit': device_data.get('unit', 'bytes')
+            }
+
+            # 转换流速单位从B/s到Mb/s
+            if config.CONVERT_TO_MBPS:
+                device_record['up_mbps'] = self.convert_bytes_to_mbps(float(device_record['up_bytes']))
+                device_record['down_mbps'] = self.convert_bytes_to_mbps(float(device_record['down_bytes']))
+                device_record['total_mbps'] = device_record['up_mbps'] + device_record['down_mbps']
+
+            return device_record
+
+        self.logger.warning(f"设备API响应格式异常，IP: {ip_address}, 响应: {data}")
+        return None
+
+    def call_user_api(self, ip_address: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        调用API获取用户流量数据
+
+        Args:
+            ip_address: 设备IP地址
+
+        Returns:
+            用户数据列表，失败时返回None
+        """
+        data = self.request_api_json(ip_address, config.USER_API_ENDPOINT, config.USER_API_HEADERS,
+                                     config.USER_API_PAYLOAD, "用户API")
+        if data is None:
+            return None
+        return self.parse_user_api_response(ip_address, data)
+
     def call_device_api(self, ip_address: str) -> Optional[Dict[str, Any]]:
         """
         调用API获取设备级别流速数据
@@ -597,86 +945,67 @@ class UserFlowStatsProcessor:
         Returns:
             设备流速数据字典，失败时返回None
         """
-        for attempt in range(config.MAX_RETRIES):
-            try:
-                self.logger.debug(f"向 {ip_address} 发送设备API请求 (尝试 {attempt + 1}/{config.MAX_RETRIES})")
+        data = self.request_api_json(ip_address, config.DEVICE_API_ENDPOINT, config.DEVICE_API_HEADERS,
+                                     config.DEVICE_API_PAYLOAD, "设备API")
+        if data is None:
+            return None
+        return self.parse_device_api_response(ip_address, data)
 
-                # 获取认证参数
-                auth_params = self.get_auth_params()
+    def collect_device_data(self, config_data: List[Dict[str, str]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        并发采集所有设备的所有启用端点（见 config.ENABLED_ENDPOINTS）
 
-                # 构建URL，将认证参数放在查询参数中
-                url = f"http://{ip_address}:{config.API_PORT}{config.DEVICE_API_ENDPOINT}?_method=GET&random={auth_params['random']}&md5={auth_params['md5']}"
+        Args:
+            config_data: 设备配置信息列表
 
-                # 构建请求体，只包含业务参数
-                request_payload = config.DEVICE_API_PAYLOAD
+        Returns:
+            (用户数据列表, 设备数据列表)，其他端点的结果保存在 self.endpoint_results
+        """
+        ip_list = [config_item['ip_address'] for config_item in config_data]
 
-                self.logger.debug(f"设备API请求URL: {url}")
-                self.logger.debug(f"设备API请求体: {json.dumps(request_payload, ensure_ascii=False)}")
+        engine = FetchEngine(self)
+        self.endpoint_results = engine.collect(ip_list)
 
-                response = requests.post(
-                    url,
-                    headers=config.DEVICE_API_HEADERS,
-                    json=request_payload,
-                    timeout=config.REQUEST_TIMEOUT
-                )
+        all_user_data = self.endpoint_results.get('user_rank', [])
+        all_device_data = self.endpoint_results.get('throughput', [])
 
-                if response.status_code == 200:
-                    try:
-                        data = response.json()
-                        if 'data' in data and isinstance(data['data'], dict):
-                            device_data = data['data']
-                            self.logger.info(f"从 {ip_address} 获取到设备流速数据")
-
-                            # 获取设备信息
-                            device_info = self.device_info_map.get(ip_address, {})
-
-                            # 构建设备流速记录
-                            device_record = {
-                                'device_ip': ip_address,
-                                'machine_room': device_info.get('machine_room', 'Unknown'),
-                                'device_type': device_info.get('device_type', 'Unknown'),
-                                'up_bytes': device_data.get('send', 0),  # 上行流速 B/s
-                                'down_bytes': device_data.get('recv', 0),  # 下行流速 B/s
-                                'unit': device_data.get('unit', 'bytes')
-                            }
-
-                            # 转换流速单位从B/s到Mb/s
-                            if config.CONVERT_TO_MBPS:
-                                device_record['up_mbps'] = self.convert_bytes_to_mbps(float(device_record['up_bytes']))
-                                device_record['down_mbps'] = self.convert_bytes_to_mbps(float(device_record['down_bytes']))
-                                device_record['total_mbps'] = device_record['up_mbps'] + device_record['down_mbps']
-
-                            return device_record
-                        else:
-                            self.logger.warning(f"设备API响应格式异常，IP: {ip_address}, 响应: {data}")
-                            return None
-                    except json.JSONDecodeError:
-                        self.logger.warning(f"设备API响应JSON解析失败，IP: {ip_address}")
-                        return None
-                elif response.status_code == 401:
-                    self.logger.error(f"设备API认证失败，IP: {ip_address}, 请检查共享密钥配置")
-                    return None
-                elif response.status_code == 403:
-                    self.logger.error(f"设备API访问被拒绝，IP: {ip_address}, 可能是认证参数错误")
-                    return None
-                else:
-                    self.logger.warning(f"设备API请求失败，IP: {ip_address}, 状态码: {response.status_code}")
-                    try:
-                        error_data = response.json()
-                        self.logger.warning(f"错误详情: {error_data}")
-                    except:
-                        self.logger.warning(f"响应内容: {response.text[:200]}")
+        # 记录未返回数据的设备
+        user_ips = set(user.get('source_ip') for user in all_user_data)
+        device_ips = set(device.get('device_ip') for device in all_device_data)
+        for config_item in config_data:
+            station_name = config_item['station_name']
+            ip_address = config_item['ip_address']
+            if 'user_rank' in self.endpoint_results and ip_address not in user_ips:
+                self.logger.warning(f"从 {station_name} 未获取到用户数据")
+            if 'throughput' in self.endpoint_results and ip_address not in device_ips:
+                self.logger.warning(f"从 {station_name} 未获取到设备数据")
 
-            except requests.exceptions.Timeout:
-                self.logger.warning(f"设备API请求超时，IP: {ip_address} (尝试 {attempt + 1}/{config.MAX_RETRIES})")
-            except requests.exceptions.ConnectionError:
-                self.logger.warning(f"设备API连接失败，IP: {ip_address} (尝试 {attempt + 1}/{config.MAX_RETRIES})")
-            except Exception as e:
-                self.logger.error(f"设备API请求异常，IP: {ip_address}, 错误: {str(e)}")
-                break
+        return all_user_data, all_device_data
 
-        self.logger.error(f"设备API请求最终失败，IP: {ip_address}")
-        return None
+    def save_endpoint_results(self, timestamp: str) -> List[str]:
+        """
+        将内置用户/设备端点以外的采集结果保存为JSON文件
+
+        Args:
+            timestamp: 文件名时间戳
+
+        Returns:
+            保存的文件路径列表
+        """
+        saved_paths = []
+        for name, results in self.endpoint_results.items():
+            if name in ('user_rank', 'throughput'):
+                continue
+            output_path = os.path.join(config.OUTPUT_DIR, f"endpoint_{name}_{timestamp}.json")
+            try:
+                with open(output_path, 'w', encoding='utf-8') as f:
+                    json.dump({'batch_time': self.batch_time, 'endpoint': name, 'data': results},
+                              f, ensure_ascii=False, indent=2)
+                saved_paths.append(output_path)
+                self.logger.info(f"端点 {name} 采集结果已保存: {output_path} ({len(results)} 条)")
+            except Exception as e:
+                self.logger.error(f"保存端点 {name} 采集结果失败: {str(e)}")
+        return saved_paths
 
     def process_user_data_by_device(self, all_data: List[Dict[str, Any]], config_data: List[Dict[str, str]]) -> Dict[str, List[Dict[str, Any]]]:
         """
@@ -777,14 +1106,17 @@ class UserFlowStatsProcessor:
             self.logger.error(f"处理用户数据失败: {str(e)}")
             raise
 
-    def create_output_excel(self, machine_room_data: Dict[str, List[Dict[str, Any]]], device_data: List[Dict[str, Any]], output_path: str):
+    def create_output_excel(self, machine_room_data: Dict[str, List[Dict[str, Any]]], device_data: List[Dict[str, Any]], output_path: str,
+                            room_utilization: Optional[List[Dict[str, Any]]] = None):
         """
-        创建输出Excel文件，包含5个sheet页：流速（设备级别）、A2、A3、B1、C1（用户级别）
+        创建输出Excel文件，包含5个sheet页：流速（设备级别）、A2、A3、B1、C1（用户级别），
+        有带宽利用率数据时追加"机房利用率"sheet页
 
         Args:
             machine_room_data: 按机房分组的用户数据字典
             device_data: 设备级别流速数据列表
             output_path: 输出文件路径
+            room_utilization: 按机房汇总的带宽利用率列表
         """
         try:
             self.logger.info(f"开始创建Excel文件: {output_path}")
@@ -803,6 +1135,10 @@ class UserFlowStatsProcessor:
                 # 2. 创建用户级别sheet页（A2、A3、B1、C1）
                 self.create_user_flow_sheets(writer, machine_room_data)
 
+                # 3. 创建机房带宽利用率sheet页
+                if room_utilization:
+                    self.create_room_utilization_sheet(writer, room_utilization)
+
             self.logger.info(f"Excel文件创建成功: {output_path}")
 
         except Exception as e:
@@ -834,7 +1170,12 @@ class UserFlowStatsProcessor:
                 'device_type': '设备类型',
                 'up_mbps': '上行Mbps',
                 'down_mbps': '下行Mbps',
-                'total_mbps': '总流速Mbps'
+                'total_mbps': '总流速Mbps',
+                'capacity_mbps': '端口容量Mbps',
+                'up_utilization': '上行利用率%',
+                'down_utilization': '下行利用率%',
+                'utilization': '带宽利用率%',
+                'is_hot': '热点设备'
             }
 
             # 按指定顺序
@@ -846,6 +1187,14 @@ class UserFlowStatsProcessor:
                 'down_mbps',      # 下行Mbps
                 'total_mbps'      # 总流速Mbps
             ]
+            if config.INCLUDE_BANDWIDTH_INFO:
+                device_desired_order.extend([
+                    'capacity_mbps',     # 端口容量Mbps
+                    'up_utilization',    # 上行利用率%
+                    'down_utilization',  # 下行利用率%
+                    'utilization',       # 带宽利用率%
+                    'is_hot'             # 热点设备
+                ])
 
             # 选择输出列
             output_columns = []
@@ -865,6 +1214,9 @@ class UserFlowStatsProcessor:
                     output_df[col] = pd.to_numeric(output_df[col], errors='coerce')
                     output_df[col] = output_df[col].round(3)
 
+            if '热点设备' in output_df.columns:
+                output_df['热点设备'] = output_df['热点设备'].map({True: '是', False: '否'})
+
             # 写入工作表
             output_df.to_excel(
                 writer,
@@ -877,12 +1229,62 @@ class UserFlowStatsProcessor:
             worksheet = writer.sheets['流速']
             self.format_worksheet(worksheet)
 
+            # 高亮热点设备行
+            if '热点设备' in output_df.columns:
+                hot_fill = PatternFill(start_color='FFC7CE', end_color='FFC7CE', fill_type='solid')
+                for row_index, is_hot in enumerate(output_df['热点设备'], start=2):
+                    if is_hot == '是':
+                        for cell in worksheet[row_index]:
+                            cell.fill = hot_fill
+
             self.logger.info(f"设备流速sheet页创建成功，包含 {len(output_df)} 条记录")
 
         except Exception as e:
             self.logger.error(f"创建设备流速sheet页失败: {str(e)}")
             raise
 
+    def create_room_utilization_sheet(self, writer, room_utilization: List[Dict[str, Any]]):
+        """
+        创建机房带宽利用率sheet页
+
+        Args:
+            writer: Excel writer对象
+            room_utilization: 按机房汇总的带宽利用率列表
+        """
+        try:
+            self.logger.info("创建机房带宽利用率sheet页")
+
+            room_column_mapping = {
+                'machine_room': '机房',
+                'device_count': '设备数',
+                'capacity_mbps': '总容量Mbps',
+                'up_mbps': '上行Mbps',
+                'down_mbps': '下行Mbps',
+                'up_utilization': '上行利用率%',
+                'down_utilization': '下行利用率%',
+                'utilization': '带宽利用率%',
+                'hot_device_count': '热点设备数'
+            }
+
+            output_df = pd.DataFrame(room_utilization)[list(room_column_mapping.keys())]
+            output_df.columns = list(room_column_mapping.values())
+
+            output_df.to_excel(
+                writer,
+                sheet_name='机房利用率',
+                index=False,
+                startrow=0
+            )
+
+            worksheet = writer.sheets['机房利用率']
+            self.format_worksheet(worksheet)
+
+            self.logger.info(f"机房带宽利用率sheet页创建成功，包含 {len(output_df)} 个机房")
+
+        except Exception as e:
+            self.logger.error(f"创建机房带宽利用率sheet页失败: {str(e)}")
+            raise
+
     def create_user_flow_sheets(self, writer, machine_room_data: Dict[str, List[Dict[str, Any]]]):
         """
         创建用户级别流速sheet页（A2、A3、B1、C1）
@@ -1014,127 +1416,157 @@ class UserFlowStatsProcessor:
             if not config_data:
                 raise ValueError("没有读取到有效的配置数据")
 
+            # 随设备清单一次性加载端口容量索引
+            if config.INCLUDE_BANDWIDTH_INFO:
+                self.load_capacity_index(config.DEVICE_INVENTORY_FILE_PATH)
+
             # 2. 调用API获取数据
             self.logger.info("开始调用API获取用户和设备流量数据...")
-            all_user_data = []
-            all_device_data = []
-
-            for i, config_item in enumerate(config_data, 1):
-                station_name = config_item['station_name']
-                ip_address = config_item['ip_address']
-
-                self.logger.info(f"处理第 {i}/{len(config_data)} 个设备: {station_name} ({ip_address})")
-
-                # 获取用户级别数据
-                user_data = self.call_user_api(ip_address)
-                if user_data:
-                    all_user_data.extend(user_data)
-                    self.logger.info(f"从 {station_name} 获取到 {len(user_data)} 条用户数据")
-                else:
-                    self.logger.warning(f"从 {station_name} 未获取到用户数据")
-
-                # 获取设备级别数据
-                device_data = self.call_device_api(ip_address)
-                if device_data:
-                    all_device_data.append(device_data)
-                    self.logger.info(f"从 {station_name} 获取到设备流速数据")
-                else:
-                    self.logger.warning(f"从 {station_name} 未获取到设备数据")
+            all_user_data, all_device_data = self.collect_device_data(config_data)
 
             self.logger.info(f"API调用完成，总计获取 {len(all_user_data)} 条用户数据，{len(all_device_data)} 条设备数据")
 
-            # 3. 处理数据
-            if not all_user_data and not all_device_data:
-                self.logger.warning("没有获取到任何数据，程序结束")
-                return
-
-            # 处理用户数据
-            machine_room_grouped_data = {}
-            if all_user_data:
-                machine_room_grouped_data = self.process_user_data_by_device(all_user_data, config_data)
+            self.publish_results(config_data, all_user_data, all_device_data)
 
-            # 4. 生成输出
-            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-
-            # 4.1 输出到Excel（如果启用）
-            if config.OUTPUT_TO_EXCEL:
-                output_filename = config.OUTPUT_FILENAME_TEMPLATE.format(
-                    top_n=config.TOP_N_USERS_PER_DEVICE,
-                    timestamp=timestamp
-                )
-                output_path = os.path.join(config.OUTPUT_DIR, output_filename)
-                self.create_output_excel(machine_room_grouped_data, all_device_data, output_path)
-                self.logger.info(f"Excel文件保存完成: {output_path}")
-
-            # 4.2 输出到数据库（如果启用）
-            if config.OUTPUT_TO_DATABASE:
-                # 保存用户数据
-                if machine_room_grouped_data:
-                    all_users = []
-                    for machine_room_users in machine_room_grouped_data.values():
-                        all_users.extend(machine_room_users)
-
-                    if self.save_user_data_to_database(all_users):
-                        self.logger.info("用户数据库保存完成")
-                    else:
-                        self.logger.warning("用户数据库保存失败")
+        except Exception as e:
+            self.logger.error(f"程序运行失败: {str(e)}")
+            print(f"\n❌ 程序运行失败: {str(e)}")
+            raise
 
-                # 保存设备数据
-                if all_device_data:
-                    if self.save_device_data_to_database(all_device_data):
-                        self.logger.info("设备数据库保存完成")
-                    else:
-                        self.logger.warning("设备数据库保存失败")
+    def publish_results(self, config_data: List[Dict[str, str]], all_user_data: List[Dict[str, Any]],
+                        all_device_data: List[Dict[str, Any]], fetched_user_count: Optional[int] = None):
+        """
+        处理一轮采集结果并输出到Excel、数据库和控制台
 
-            # 5. 输出统计信息
-            total_users = sum(len(users) for users in machine_room_grouped_data.values()) if machine_room_grouped_data else 0
+        Args:
+            config_data: 设备配置信息列表
+            all_user_data: 用户数据列表
+            all_device_data: 设备数据列表
+            fetched_user_count: 采集到的用户数据条数（分片模式下用户数据已在分片内取TopN），默认为len(all_user_data)
+        """
+        if fetched_user_count is None:
+            fetched_user_count = len(all_user_data)
+
+        # 本轮采集完成后计算带宽利用率
+        room_utilization = []
+        hot_devices = []
+        if config.INCLUDE_BANDWIDTH_INFO and all_device_data:
+            room_utilization = self.calculate_bandwidth_utilization(all_device_data)
+            hot_devices = [device for device in all_device_data if device.get('is_hot')]
+
+        # 3. 处理数据
+        if not all_user_data and not all_device_data:
+            self.logger.warning("没有获取到任何数据，程序结束")
+            return
+
+        # 处理用户数据
+        machine_room_grouped_data = {}
+        if all_user_data:
+            machine_room_grouped_data = self.process_user_data_by_device(all_user_data, config_data)
+
+        # 4. 生成输出
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+
+        # 4.1 输出到Excel（如果启用）
+        if config.OUTPUT_TO_EXCEL:
+            output_filename = config.OUTPUT_FILENAME_TEMPLATE.format(
+                top_n=config.TOP_N_USERS_PER_DEVICE,
+                timestamp=timestamp
+            )
+            output_path = os.path.join(config.OUTPUT_DIR, output_filename)
+            self.create_output_excel(machine_room_grouped_data, all_device_data, output_path, room_utilization)
+            self.logger.info(f"Excel文件保存完成: {output_path}")
 
-            self.logger.info("=" * 50)
-            self.logger.info("处理完成统计信息:")
-            self.logger.info(f"处理设备数量: {len(config_data)}")
-            self.logger.info(f"获取用户总数: {len(all_user_data)}")
-            self.logger.info(f"获取设备总数: {len(all_device_data)}")
-            self.logger.info(f"输出机房数量: {len(machine_room_grouped_data)}")
-            self.logger.info(f"输出用户数量: {total_users}")
-            self.logger.info(f"每设备Top用户数: {config.TOP_N_USERS_PER_DEVICE}")
-            if config.OUTPUT_TO_EXCEL:
-                self.logger.info(f"Excel文件路径: {output_path}")
-            self.logger.info("=" * 50)
+        # 4.1.1 其他启用端点的采集结果
+        endpoint_paths = self.save_endpoint_results(timestamp)
 
-            print(f"\n✅ 处理完成！")
-            print(f"📊 处理了 {len(config_data)} 个设备")
-            print(f"👥 获取了 {len(all_user_data)} 条用户流速数据")
-            print(f"🖥️  获取了 {len(all_device_data)} 条设备流速数据")
-            print(f"🏢 输出 {len(machine_room_grouped_data)} 个机房")
-            print(f"🏆 每设备输出前 {config.TOP_N_USERS_PER_DEVICE} 名用户，总计 {total_users} 名用户")
-            if config.OUTPUT_TO_EXCEL:
-                print(f"📁 Excel文件: {output_path}")
-            if config.OUTPUT_TO_DATABASE:
-                print(f"💾 用户数据库: {config.DB_HOST}/{config.DB_NAME}.{config.DB_USER_TABLE}")
-                print(f"💾 设备数据库: {config.DB_HOST}/{config.DB_NAME}.{config.DB_DEVICE_TABLE}")
-            print(f"📏 流速单位: {config.OUTPUT_UNIT}")
-
-            # 按机房统计输出信息
+        # 4.2 输出到数据库（如果启用）
+        if config.OUTPUT_TO_DATABASE:
+            # 保存用户数据
             if machine_room_grouped_data:
-                print(f"\n📋 各机房统计:")
-                for machine_room_name, users in machine_room_grouped_data.items():
-                    device_count = len(set(user.get('source_ip') for user in users))
-                    user_count = len(users)
-                    print(f"   {machine_room_name}: {device_count}个设备, {user_count}个用户")
+                all_users = []
+                for machine_room_users in machine_room_grouped_data.values():
+                    all_users.extend(machine_room_users)
+
+                if self.save_user_data_to_database(all_users):
+                    self.logger.info("用户数据库保存完成")
+                else:
+                    self.logger.warning("用户数据库保存失败")
 
-            # 设备流速统计
+            # 保存设备数据
             if all_device_data:
-                print(f"\n🖥️  设备流速统计:")
-                for device in all_device_data:
-                    machine_room = device.get('machine_room', 'Unknown')
-                    device_ip = device.get('device_ip', 'Unknown')
-                    total_mbps = device.get('total_mbps', 0)
-                    print(f"   {machine_room} - {device_ip}: {total_mbps:.3f} Mbps")
+                if self.save_device_data_to_database(all_device_data):
+                    self.logger.info("设备数据库保存完成")
+                else:
+                    self.logger.warning("设备数据库保存失败")
+
+            # 保存热点设备数据
+            if hot_devices:
+                if self.save_hot_device_data_to_database(hot_devices):
+                    self.logger.info("热点设备数据库保存完成")
+                else:
+                    self.logger.warning("热点设备数据库保存失败")
+
+        # 5. 输出统计信息
+        total_users = sum(len(users) for users in machine_room_grouped_data.values()) if machine_room_grouped_data else 0
+
+        self.logger.info("=" * 50)
+        self.logger.info("处理完成统计信息:")
+        self.logger.info(f"处理设备数量: {len(config_data)}")
+        self.logger.info(f"获取用户总数: {fetched_user_count}")
+        self.logger.info(f"获取设备总数: {len(all_device_data)}")
+        self.logger.info(f"输出机房数量: {len(machine_room_grouped_data)}")
+        self.logger.info(f"输出用户数量: {total_users}")
+        self.logger.info(f"每设备Top用户数: {config.TOP_N_USERS_PER_DEVICE}")
+        if config.OUTPUT_TO_EXCEL:
+            self.logger.info(f"Excel文件路径: {output_path}")
+        self.logger.info("=" * 50)
+
+        print(f"\n✅ 处理完成！")
+        print(f"📊 处理了 {len(config_data)} 个设备")
+        print(f"👥 获取了 {fetched_user_count} 条用户流速数据")
+        print(f"🖥️  获取了 {len(all_device_data)} 条设备流速数据")
+        print(f"🏢 输出 {len(machine_room_grouped_data)} 个机房")
+        print(f"🏆 每设备输出前 {config.TOP_N_USERS_PER_DEVICE} 名用户，总计 {total_users} 名用户")
+        if config.OUTPUT_TO_EXCEL:
+            print(f"📁 Excel文件: {output_path}")
+        for endpoint_path in endpoint_paths:
+            print(f"📁 端点采集结果: {endpoint_path}")
+        if config.OUTPUT_TO_DATABASE:
+            print(f"💾 用户数据库: {config.DB_HOST}/{config.DB_NAME}.{config.DB_USER_TABLE}")
+            print(f"💾 设备数据库: {config.DB_HOST}/{config.DB_NAME}.{config.DB_DEVICE_TABLE}")
+        print(f"📏 流速单位: {config.OUTPUT_UNIT}")
+
+        # 按机房统计输出信息
+        if machine_room_grouped_data:
+            print(f"\n📋 各机房统计:")
+            for machine_room_name, users in machine_room_grouped_data.items():
+                device_count = len(set(user.get('source_ip') for user in users))
+                user_count = len(users)
+                print(f"   {machine_room_name}: {device_count}个设备, {user_count}个用户")
+
+        # 设备流速统计
+        if all_device_data:
+            print(f"\n🖥️  设备流速统计:")
+            for device in all_device_data:
+                machine_room = device.get('machine_room', 'Unknown')
+                device_ip = device.get('device_ip', 'Unknown')
+                total_mbps = device.get('total_mbps', 0)
+                print(f"   {machine_room} - {device_ip}: {total_mbps:.3f} Mbps")
+
+        # 带宽利用率统计
+        if room_utilization:
+            print(f"\n📶 机房带宽利用率:")
+            for room in room_utilization:
+                print(f"   {room['machine_room']}: {room['utilization']:.2f}% "
+                      f"(上行 {room['up_utilization']:.2f}%, 下行 {room['down_utilization']:.2f}%), "
+                      f"热点设备 {room['hot_device_count']} 台")
+        if hot_devices:
+            print(f"\n🔥 热点设备 (带宽利用率 >= {config.HOT_DEVICE_UTILIZATION_THRESHOLD}%):")
+            for device in hot_devices:
+                print(f"   {device.get('machine_room', 'Unknown')} - {device.get('device_ip', 'Unknown')}: "
+                      f"{device['utilization']:.2f}%")
 
-        except Exception as e:
-            self.logger.error(f"程序运行失败: {str(e)}")
-            print(f"\n❌ 程序运行失败: {str(e)}")
-            raise
 
 
 def main():
@@ -190,6 +190,13 @@ def create_usage_guide(package_dir):
 ├── data_quality_monitor.py         # 主程序
 ├── es_client.py                    # ES客户端
 ├── hive_client.py                  # Hive客户端
+├── hive_pool.py                    # Hive会话池
+├── hive_metrics.py                 # Hive单次扫描多指标查询
+├── hive_batch.py                   # Hive批量计数查询规划
+├── hive_stats.py                   # 基于分区统计信息的快速计数
+├── metrics_cache.py                # 指标缓存
+├── row_diff.py                     # 行级差异定位
+├── ods_client.py                   # ODS客户端
 ├── setup_and_run.sh               # 一键安装运行脚本
 ├── python_packages_offline/       # 离线Python包目录
 │   ├── install_offline.sh         # 离线安装脚本
@@ -263,7 +270,9 @@ def main():
     print("")
     
     # 检查当前目录
-    required_files = ['config.yaml', 'data_quality_monitor.py', 'es_client.py', 'hive_client.py']
+    required_files = ['config.yaml', 'data_quality_monitor.py', 'es_client.py', 'hive_client.py', 'ods_client.py',
+                      'hive_pool.py', 'hive_metrics.py', 'hive_batch.py',
+                      'hive_stats.py', 'metrics_cache.py', 'row_diff.py']
     for file in required_files:
         if not os.path.exists(file):
             print_colored(f"错误: 缺少文件 {file}", 'red')
@@ -294,6 +303,13 @@ def main():
         'data_quality_monitor.py',
         'es_client.py',
         'hive_client.py',
+        'hive_pool.py',
+        'hive_metrics.py',
+        'hive_batch.py',
+        'hive_stats.py',
+        'metrics_cache.py',
+        'row_diff.py',
+        'ods_client.py',
         'setup_and_run.sh',
         'requirements.txt',
         'README_offline_install.md'
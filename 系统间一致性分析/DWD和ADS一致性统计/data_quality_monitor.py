@@ -7,10 +7,36 @@ import os
 import csv
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import argparse
+import time
 import sys
 
 from hive_client import HiveClient
-from es_client import ESClient
+from hive_pool import HiveSessionPool, get_session_pool, close_all_pools
+from hive_batch import chunk
+from hive_metrics import date_range
+from hive_stats import COUNT_MODE_SCAN
+from metrics_cache import MetricsCache, query_hash
+from ods_client import ODSClient
+from row_diff import locate_missing_ids
+from es_client import (ESClient, ES_DISTINCT_CARDINALITY, ES_DISTINCT_EXACT, ES_DISTINCT_AUTO,
+                       ES_DISTINCT_MODES, DEFAULT_PRECISION_THRESHOLD)
+
+
+# 按小时结果CSV字段
+HOURLY_FIELDS = [
+    'protocol', 'query_date', 'capture_hour', 'hive_total', 'hive_late', 'es_total',
+    'diff', 'consistency_rate', 'status'
+]
+
+# 结果CSV字段
+RESULT_FIELDS = [
+    'protocol', 'query_date', 'ods_total', 'hive_total', 'hive_distinct',
+    'es_total', 'es_distinct', 'total_diff', 'distinct_diff',
+    'total_consistency_rate', 'distinct_consistency_rate', 'status',
+    'ods_count_mode', 'hive_count_mode', 'es_distinct_mode', 'cached', 'error'
+]
 
 
 class DataQualityMonitor:
@@ -26,6 +52,9 @@ class DataQualityMonitor:
         self.config = self._load_config(config_path)
         self._setup_logging()
         self.results = []
+        self.csv_file = None
+        self.metrics_cache = None
+        self.range_dates = None
     
     def _load_config(self, config_path: str) -> Dict[str, Any]:
         """加载配置文件"""
@@ -72,6 +101,19 @@ class DataQualityMonitor:
             # 使用当前日期
             return datetime.now().strftime(date_format)
     
+    def _get_date_range(self) -> Optional[Tuple[str, str]]:
+        """
+        多日范围模式的日期范围（date.range_start / date.range_end）
+
+        Returns:
+            (开始日期, 结束日期)，未配置 range_start 时返回None（单日模式）；
+            未配置 range_end 时结束日期为单日模式的查询日期
+        """
+        start_date = self.config['date'].get('range_start')
+        if not start_date:
+            return None
+        return str(start_date), str(self.config['date'].get('range_end') or self._get_query_date())
+
     def _format_index_pattern(self, pattern: str, query_date: str) -> str:
         """格式化ES索引模式"""
         date_obj = datetime.strptime(query_date, self.config['date']['date_format'])
@@ -80,115 +122,604 @@ class DataQualityMonitor:
             month=date_obj.month
         )
     
-    def compare_protocol_data(self, protocol_name: str, protocol_config: Dict[str, str], 
-                            query_date: str) -> Dict[str, Any]:
+    def _hive_config(self) -> Dict[str, Any]:
+        """DWD Hive连接配置（兼容旧版配置中的 hive 节点）"""
+        return self.config.get('hive_dwd') or self.config['hive']
+
+    def _session_pool(self, hive_config: Dict[str, Any]) -> Optional[HiveSessionPool]:
         """
-        比较单个协议的DWD和ADS数据
-        
+        获取Hive连接配置对应的共享会话池（同一HiveServer2上的DWD和ODS共用）
+
+        Returns:
+            会话池，hive_pool.enabled 为false时返回None（每次查询新建连接）
+        """
+        pool_config = self.config.get('hive_pool') or {}
+        if not pool_config.get('enabled', True):
+            return None
+        parallel_config = self.config.get('parallel') or {}
+        return get_session_pool(
+            host=hive_config['host'],
+            port=hive_config['port'],
+            username=hive_config.get('username'),
+            password=hive_config.get('password'),
+            auth=hive_config.get('auth', 'PLAIN'),
+            max_size=int(pool_config.get('max_size') or parallel_config.get('hive_workers', 4)),
+            session_settings=pool_config.get('session_settings'),
+            health_check_interval=int(pool_config.get('health_check_interval', 300))
+        )
+
+    def _metrics_config(self) -> Dict[str, Any]:
+        """指标配置（去重方式和去重字段）"""
+        metrics_config = {
+            'distinct_mode': 'none',
+            'count_mode': COUNT_MODE_SCAN,
+            'hive_distinct_field': 'data_id',
+            'es_distinct_field': 'data_idField',
+            'approx_function': 'approx_count_distinct',
+            'es_distinct_mode': ES_DISTINCT_CARDINALITY,
+            'es_precision_threshold': None,
+            'es_composite_page_size': 10000,
+            'es_exact_slices': 1
+        }
+        metrics_config.update(self.config.get('metrics') or {})
+        if metrics_config['es_distinct_mode'] not in ES_DISTINCT_MODES:
+            raise ValueError(f"不支持的ES去重方式: {metrics_config['es_distinct_mode']}，可选: {ES_DISTINCT_MODES}")
+        return metrics_config
+
+    def _open_metrics_cache(self) -> Optional[MetricsCache]:
+        """按 metrics_cache 配置打开指标缓存，未启用时返回None"""
+        cache_config = self.config.get('metrics_cache') or {}
+        if not cache_config.get('enabled', False):
+            return None
+        try:
+            return MetricsCache(cache_config.get('path', './cache/metrics_cache.db'))
+        except Exception as e:
+            self.logger.error(f"打开指标缓存失败，本次不使用缓存: {e}")
+            return None
+
+    def _es_fingerprint_field(self) -> str:
+        """ES数据指纹使用的时间字段"""
+        return (self.config.get('metrics_cache') or {}).get('es_time_field', 'capture_timeField')
+
+    def _cache_spec(self, source: str, protocol_config: Dict[str, str]) -> str:
+        """影响指标结果的查询参数哈希（去重方式、去重字段、计数方式）"""
+        metrics_config = self._metrics_config()
+        spec = {'source': source, 'count_mode': metrics_config['count_mode']}
+        if source != 'ods' and metrics_config['distinct_mode'] != 'none':
+            field_key = 'hive_distinct_field' if source == 'hive' else 'es_distinct_field'
+            spec.update({
+                'distinct_mode': metrics_config['distinct_mode'],
+                'distinct_field': protocol_config.get(field_key, metrics_config[field_key]),
+                'approx_function': metrics_config['approx_function']
+            })
+            if source == 'es':
+                spec.update({
+                    'es_distinct_mode': metrics_config['es_distinct_mode'],
+                    'es_precision_threshold': metrics_config['es_precision_threshold']
+                })
+        return query_hash(spec)
+
+    def _cache_lookup(self, source: str, object_name: str, date_field: str, query_date: str,
+                      spec_hash: str, fingerprint_func) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        查找缓存的指标
+
         Args:
-            protocol_name: 协议名称
-            protocol_config: 协议配置
+            source: 数据源（hive/ods/es）
+            object_name: 表名或索引模式
+            date_field: 日期字段
             query_date: 查询日期
-            
+            spec_hash: 查询参数哈希
+            fingerprint_func: 获取当前数据指纹的函数
+
         Returns:
-            比较结果字典
+            (缓存的指标（未命中为None）, 当前数据指纹（未启用缓存或无法获取时为None）)
         """
-        self.logger.info(f"开始比较协议 {protocol_name} 的数据一致性")
-        
-        result = {
-            'protocol': protocol_name,
-            'query_date': query_date,
-            'hive_total': None,
-            'hive_distinct': None,
-            'es_total': None,
-            'es_distinct': None,
-            'total_diff': None,
-            'distinct_diff': None,
-            'total_consistency_rate': None,
-            'distinct_consistency_rate': None,
-            'status': 'FAILED',
-            'error': None
-        }
-        
+        if self.metrics_cache is None:
+            return None, None
+        fingerprint = fingerprint_func()
+        if fingerprint is None:
+            return None, None
+        cached = self.metrics_cache.get(source, object_name, date_field, query_date, spec_hash, fingerprint)
+        if cached is not None:
+            cached[f"{source}_cached"] = True
+        return cached, fingerprint
+
+    def _cache_store(self, source: str, object_name: str, date_field: str, query_date: str,
+                     spec_hash: str, fingerprint: Optional[str], metrics: Dict[str, Any]) -> None:
+        """保存计算成功的指标（查询失败或无法获取指纹时不缓存）"""
+        if self.metrics_cache is None or fingerprint is None or metrics.get(f"{source}_total") is None:
+            return
         try:
-            # 连接Hive并查询数据
-            hive_config = self.config['hive']
-            with HiveClient(
-                host=hive_config['host'],
-                port=hive_config['port'],
-                username=hive_config.get('username'),
-                password=hive_config.get('password'),
-                database=hive_config['database'],
-                auth=hive_config.get('auth', 'PLAIN')
-            ) as hive_client:
-                
-                hive_total, hive_distinct = hive_client.get_hive_metrics(
-                    table_name=protocol_config['hive_table'],
-                    query_date=query_date
-                )
-                
-                result['hive_total'] = hive_total
-                result['hive_distinct'] = hive_distinct
-            
-            # 连接ES并查询数据
-            es_config = self.config['elasticsearch']
-            with ESClient(
-                host=es_config['host'],
-                port=es_config['port'],
-                timeout=es_config.get('timeout', 30)
-            ) as es_client:
-                
-                index_pattern = self._format_index_pattern(
-                    protocol_config['es_index_pattern'], 
-                    query_date
-                )
-                
-                es_total, es_distinct = es_client.get_es_metrics(
+            self.metrics_cache.put(source, object_name, date_field, query_date, spec_hash, fingerprint, metrics)
+        except Exception as e:
+            self.logger.error(f"写入指标缓存失败: {e}")
+
+    def _query_dwd(self, protocol_config: Dict[str, str], query_date: str) -> Dict[str, Any]:
+        """
+        查询DWD层（Hive）指标：仅总数时沿用COUNT(*)（count_mode为stats时优先使用分区统计信息），
+        需要去重数时总数和去重数在一次扫描中完成
+
+        Returns:
+            {'hive_total', 'hive_distinct', 'hive_count_mode'}
+        """
+        hive_config = self._hive_config()
+        table_name = protocol_config.get('dwd_table') or protocol_config['hive_table']
+        with HiveClient(
+            host=hive_config['host'],
+            port=hive_config['port'],
+            username=hive_config.get('username'),
+            password=hive_config.get('password'),
+            database=hive_config['database'],
+            auth=hive_config.get('auth', 'PLAIN'),
+            pool=self._session_pool(hive_config)
+        ) as hive_client:
+            spec_hash = self._cache_spec('hive', protocol_config)
+            cached, fingerprint = self._cache_lookup(
+                'hive', table_name, 'insert_day', query_date, spec_hash,
+                lambda: hive_client.data_fingerprint(table_name, query_date))
+            if cached is not None:
+                return cached
+            metrics = self._compute_dwd(hive_client, protocol_config, table_name, query_date)
+            self._cache_store('hive', table_name, 'insert_day', query_date, spec_hash, fingerprint, metrics)
+            return metrics
+
+    def _compute_dwd(self, hive_client: HiveClient, protocol_config: Dict[str, str], table_name: str,
+                     query_date: str) -> Dict[str, Any]:
+        """在已连接的Hive客户端上计算DWD指标"""
+        metrics_config = self._metrics_config()
+        if metrics_config['distinct_mode'] == 'none':
+            if metrics_config['count_mode'] == 'stats':
+                total, count_mode = hive_client.get_fast_total_count(table_name, query_date)
+                return {'hive_total': total, 'hive_count_mode': count_mode}
+            return {'hive_total': hive_client.get_hive_metrics(table_name=table_name, query_date=query_date),
+                    'hive_count_mode': COUNT_MODE_SCAN}
+
+        metrics = hive_client.get_table_metrics(
+            table_name=table_name,
+            query_date=query_date,
+            distinct_field=protocol_config.get('hive_distinct_field', metrics_config['hive_distinct_field']),
+            distinct_mode=metrics_config['distinct_mode'],
+            approx_function=metrics_config['approx_function']
+        )
+        if metrics is None:
+            return {'hive_total': None}
+        return {'hive_total': metrics['total'], 'hive_distinct': metrics['distinct'],
+                'hive_count_mode': COUNT_MODE_SCAN}
+
+    def _query_ods(self, protocol_config: Dict[str, str], query_date: str) -> Dict[str, Any]:
+        """
+        查询ODS层总记录数（支持逗号分隔的多表，count_mode为stats时优先使用分区统计信息）
+
+        Returns:
+            {'ods_total', 'ods_count_mode'}
+        """
+        ods_config = self.config['hive_ods']
+        date_field = protocol_config.get('date_field', 'capture_day')
+        with ODSClient(
+            host=ods_config['host'],
+            port=ods_config['port'],
+            username=ods_config.get('username'),
+            password=ods_config.get('password'),
+            database=ods_config['database'],
+            auth=ods_config.get('auth', 'PLAIN'),
+            pool=self._session_pool(ods_config)
+        ) as ods_client:
+            table_name = protocol_config['ods_table']
+            spec_hash = self._cache_spec('ods', protocol_config)
+            cached, fingerprint = self._cache_lookup(
+                'ods', table_name, date_field, query_date, spec_hash,
+                lambda: ods_client.data_fingerprint(table_name, query_date, date_field))
+            if cached is not None:
+                return cached
+
+            if self._metrics_config()['count_mode'] == 'stats':
+                total, count_mode = ods_client.get_fast_total_count(table_name, query_date, date_field)
+                metrics = {'ods_total': total, 'ods_count_mode': count_mode}
+            else:
+                metrics = {'ods_total': ods_client.get_ods_metrics(
+                    table_name=table_name,
+                    query_date=query_date,
+                    date_field=date_field
+                ), 'ods_count_mode': COUNT_MODE_SCAN}
+            self._cache_store('ods', table_name, date_field, query_date, spec_hash, fingerprint, metrics)
+            return metrics
+
+    def _query_es(self, es_client: ESClient, protocol_config: Dict[str, str], query_date: str) -> Dict[str, Any]:
+        """
+        查询ADS层（ES）指标
+
+        Returns:
+            {'es_total', 'es_distinct'}
+        """
+        metrics_config = self._metrics_config()
+        index_pattern = self._format_index_pattern(protocol_config['es_index_pattern'], query_date)
+        date_field = protocol_config['es_date_field']
+        spec_hash = self._cache_spec('es', protocol_config)
+        cached, fingerprint = self._cache_lookup(
+            'es', index_pattern, date_field, query_date, spec_hash,
+            lambda: es_client.index_fingerprint(index_pattern, date_field, query_date, self._es_fingerprint_field()))
+        if cached is not None:
+            return cached
+
+        metrics = {'es_total': es_client.get_es_metrics(
+            index_pattern=index_pattern,
+            query_date=query_date,
+            date_field=protocol_config['es_date_field']
+        )}
+        if metrics_config['distinct_mode'] != 'none':
+            distinct_field = protocol_config.get('es_distinct_field', metrics_config['es_distinct_field'])
+            cardinality = None
+            if metrics_config['es_distinct_mode'] != ES_DISTINCT_EXACT:
+                cardinality = es_client.get_distinct_count(
                     index_pattern=index_pattern,
+                    distinct_field=distinct_field,
+                    date_field=protocol_config['es_date_field'],
                     query_date=query_date,
-                    date_field=protocol_config['es_date_field']
+                    precision_threshold=metrics_config['es_precision_threshold']
                 )
-                
-                result['es_total'] = es_total
-                result['es_distinct'] = es_distinct
-            
-            # 计算差异和一致性率
-            if hive_total is not None and es_total is not None:
-                result['total_diff'] = hive_total - es_total
-                if max(hive_total, es_total) > 0:
-                    result['total_consistency_rate'] = min(hive_total, es_total) / max(hive_total, es_total) * 100
-                else:
-                    result['total_consistency_rate'] = 100.0
-            
-            if hive_distinct is not None and es_distinct is not None:
-                result['distinct_diff'] = hive_distinct - es_distinct
-                if max(hive_distinct, es_distinct) > 0:
-                    result['distinct_consistency_rate'] = min(hive_distinct, es_distinct) / max(hive_distinct, es_distinct) * 100
-                else:
-                    result['distinct_consistency_rate'] = 100.0
-            
-            # 判断状态
-            if (result['total_consistency_rate'] is not None and 
-                result['distinct_consistency_rate'] is not None):
-                if (result['total_consistency_rate'] >= 95 and 
-                    result['distinct_consistency_rate'] >= 95):
-                    result['status'] = 'GOOD'
-                elif (result['total_consistency_rate'] >= 90 and 
-                      result['distinct_consistency_rate'] >= 90):
-                    result['status'] = 'WARNING'
-                else:
-                    result['status'] = 'ERROR'
-            
-            self.logger.info(f"协议 {protocol_name} 比较完成 - 状态: {result['status']}")
-            
-        except Exception as e:
-            self.logger.error(f"比较协议 {protocol_name} 时发生错误: {e}")
-            result['error'] = str(e)
-        
+            metrics['es_distinct'], metrics['es_distinct_mode'] = self._resolve_es_distinct(
+                es_client, index_pattern, protocol_config['es_date_field'], distinct_field, query_date, cardinality)
+        self._cache_store('es', index_pattern, date_field, query_date, spec_hash, fingerprint, metrics)
+        return metrics
+
+    def _query_dwd_batch(self, protocol_configs: Dict[str, Dict[str, str]], query_date: str) -> Dict[str, Dict[str, Any]]:
+        """
+        一条合并查询获取多个协议的DWD总记录数
+
+        Returns:
+            {协议名: {'hive_total'}}
+        """
+        hive_config = self._hive_config()
+        with HiveClient(
+            host=hive_config['host'],
+            port=hive_config['port'],
+            username=hive_config.get('username'),
+            password=hive_config.get('password'),
+            database=hive_config['database'],
+            auth=hive_config.get('auth', 'PLAIN'),
+            pool=self._session_pool(hive_config)
+        ) as hive_client:
+            tables = {name: config.get('dwd_table') or config['hive_table'] for name, config in protocol_configs.items()}
+            results, fingerprints = {}, {}
+            for name, table in tables.items():
+                spec_hash = self._cache_spec('hive', protocol_configs[name])
+                cached, fingerprints[name] = self._cache_lookup(
+                    'hive', table, 'insert_day', query_date, spec_hash,
+                    lambda: hive_client.data_fingerprint(table, query_date))
+                if cached is not None:
+                    results[name] = cached
+
+            misses = {name: table for name, table in tables.items() if name not in results}
+            counts = hive_client.get_batch_total_counts(misses, query_date) if misses else {}
+        for name, count in counts.items():
+            results[name] = {'hive_total': count, 'hive_count_mode': COUNT_MODE_SCAN}
+            self._cache_store('hive', tables[name], 'insert_day', query_date,
+                              self._cache_spec('hive', protocol_configs[name]), fingerprints[name], results[name])
+        return results
+
+    def _query_ods_batch(self, protocol_configs: Dict[str, Dict[str, str]], query_date: str,
+                         date_field: str) -> Dict[str, Dict[str, Any]]:
+        """
+        一条合并查询获取多个协议的ODS总记录数
+
+        Returns:
+            {协议名: {'ods_total'}}
+        """
+        ods_config = self.config['hive_ods']
+        with ODSClient(
+            host=ods_config['host'],
+            port=ods_config['port'],
+            username=ods_config.get('username'),
+            password=ods_config.get('password'),
+            database=ods_config['database'],
+            auth=ods_config.get('auth', 'PLAIN'),
+            pool=self._session_pool(ods_config)
+        ) as ods_client:
+            tables = {name: config['ods_table'] for name, config in protocol_configs.items()}
+            results, fingerprints = {}, {}
+            for name, table in tables.items():
+                spec_hash = self._cache_spec('ods', protocol_configs[name])
+                cached, fingerprints[name] = self._cache_lookup(
+                    'ods', table, date_field, query_date, spec_hash,
+                    lambda: ods_client.data_fingerprint(table, query_date, date_field))
+                if cached is not None:
+                    results[name] = cached
+
+            misses = {name: table for name, table in tables.items() if name not in results}
+            counts = ods_client.get_batch_total_counts(misses, query_date, date_field) if misses else {}
+        for name, count in counts.items():
+            results[name] = {'ods_total': count, 'ods_count_mode': COUNT_MODE_SCAN}
+            self._cache_store('ods', tables[name], date_field, query_date,
+                              self._cache_spec('ods', protocol_configs[name]), fingerprints[name], results[name])
+        return results
+
+    def _resolve_es_distinct(self, es_client: ESClient, index_pattern: str, date_field: str, distinct_field: str,
+                             query_date: str, cardinality: Optional[int]) -> Tuple[Optional[int], str]:
+        """
+        按 metrics.es_distinct_mode 确定ES去重数：cardinality直接使用近似值；exact用composite聚合精确计数；
+        auto在近似值超过precision_threshold（HLL开始产生误差）或近似查询失败时改用精确计数
+
+        Args:
+            cardinality: 已查询的cardinality近似值（exact模式或查询失败时为None）
+
+        Returns:
+            (去重数, 实际使用的去重方式)
+        """
+        metrics_config = self._metrics_config()
+        mode = metrics_config['es_distinct_mode']
+        threshold = int(metrics_config['es_precision_threshold'] or DEFAULT_PRECISION_THRESHOLD)
+        if mode == ES_DISTINCT_CARDINALITY or (
+                mode == ES_DISTINCT_AUTO and cardinality is not None and cardinality <= threshold):
+            return cardinality, ES_DISTINCT_CARDINALITY
+
+        if mode == ES_DISTINCT_AUTO:
+            self.logger.info(f"ES去重近似值 {cardinality} 超过精度阈值 {threshold}，使用精确去重复核: {index_pattern}")
+        distinct = es_client.get_exact_distinct_count(
+            index_pattern=index_pattern,
+            distinct_field=distinct_field,
+            date_field=date_field,
+            query_date=query_date,
+            page_size=int(metrics_config['es_composite_page_size']),
+            slices=int(metrics_config['es_exact_slices'])
+        )
+        return distinct, ES_DISTINCT_EXACT
+
+    def _query_es_batch(self, es_client: ESClient, protocol_configs: Dict[str, Dict[str, str]],
+                        query_date: str) -> Dict[str, Dict[str, Any]]:
+        """
+        一次 _msearch 请求获取多个协议的ADS层（ES）指标（缓存命中的协议不参与查询）
+
+        Returns:
+            {协议名: {'es_total', 'es_distinct'}}
+        """
+        metrics_config = self._metrics_config()
+        results, fingerprints, searches = {}, {}, {}
+        for name, config in protocol_configs.items():
+            index_pattern = self._format_index_pattern(config['es_index_pattern'], query_date)
+            cached, fingerprints[name] = self._cache_lookup(
+                'es', index_pattern, config['es_date_field'], query_date, self._cache_spec('es', config),
+                lambda: es_client.index_fingerprint(index_pattern, config['es_date_field'], query_date,
+                                                    self._es_fingerprint_field()))
+            if cached is not None:
+                results[name] = cached
+                continue
+            searches[name] = {
+                'index_pattern': index_pattern,
+                'date_field': config['es_date_field'],
+                'query_date': query_date,
+                # exact模式不需要cardinality近似值，批量请求中只查总数
+                'distinct_field': config.get('es_distinct_field', metrics_config['es_distinct_field'])
+                if metrics_config['distinct_mode'] != 'none'
+                and metrics_config['es_distinct_mode'] != ES_DISTINCT_EXACT else None,
+                'precision_threshold': metrics_config['es_precision_threshold']
+            }
+
+        batch = es_client.get_batch_metrics(searches) if searches else {}
+        for name, metrics in batch.items():
+            config = protocol_configs[name]
+            results[name] = {'es_total': metrics['total'] if metrics else None}
+            if metrics_config['distinct_mode'] != 'none':
+                results[name]['es_distinct'], results[name]['es_distinct_mode'] = self._resolve_es_distinct(
+                    es_client, searches[name]['index_pattern'], config['es_date_field'],
+                    config.get('es_distinct_field', metrics_config['es_distinct_field']), query_date,
+                    metrics['distinct'] if metrics else None)
+            self._cache_store('es', searches[name]['index_pattern'], config['es_date_field'], query_date,
+                              self._cache_spec('es', config), fingerprints[name], results[name])
+        return results
+
+    def _query_dwd_range(self, protocol_config: Dict[str, str], dates: list) -> Dict[str, Dict[str, Any]]:
+        """
+        一次 GROUP BY 查询获取DWD层日期范围内每天的指标
+
+        Returns:
+            {日期: {'hive_total', 'hive_distinct', 'hive_count_mode'}}，查询失败时为空字典
+        """
+        metrics_config = self._metrics_config()
+        hive_config = self._hive_config()
+        with HiveClient(
+            host=hive_config['host'],
+            port=hive_config['port'],
+            username=hive_config.get('username'),
+            password=hive_config.get('password'),
+            database=hive_config['database'],
+            auth=hive_config.get('auth', 'PLAIN'),
+            pool=self._session_pool(hive_config)
+        ) as hive_client:
+            daily = hive_client.get_daily_metrics(
+                table_name=protocol_config.get('dwd_table') or protocol_config['hive_table'],
+                start_date=dates[0],
+                end_date=dates[-1],
+                distinct_field=protocol_config.get('hive_distinct_field', metrics_config['hive_distinct_field']),
+                distinct_mode=metrics_config['distinct_mode'],
+                approx_function=metrics_config['approx_function']
+            )
+        if daily is None:
+            return {}
+        # 查询成功但没有数据的日期记为0
+        distinct_default = 0 if metrics_config['distinct_mode'] != 'none' else None
+        return {day: {'hive_total': daily.get(day, {}).get('total', 0),
+                      'hive_distinct': daily.get(day, {}).get('distinct', distinct_default),
+                      'hive_count_mode': COUNT_MODE_SCAN}
+                for day in dates}
+
+    def _query_ods_range(self, protocol_config: Dict[str, str], dates: list) -> Dict[str, Dict[str, Any]]:
+        """
+        按日期分组获取ODS层日期范围内每天的总记录数（每个子表一次查询）
+
+        Returns:
+            {日期: {'ods_total', 'ods_count_mode'}}，查询失败时为空字典
+        """
+        ods_config = self.config['hive_ods']
+        with ODSClient(
+            host=ods_config['host'],
+            port=ods_config['port'],
+            username=ods_config.get('username'),
+            password=ods_config.get('password'),
+            database=ods_config['database'],
+            auth=ods_config.get('auth', 'PLAIN'),
+            pool=self._session_pool(ods_config)
+        ) as ods_client:
+            daily = ods_client.get_daily_counts(
+                table_name=protocol_config['ods_table'],
+                start_date=dates[0],
+                end_date=dates[-1],
+                date_field=protocol_config.get('date_field', 'capture_day')
+            )
+        if daily is None:
+            return {}
+        return {day: {'ods_total': daily.get(day, 0), 'ods_count_mode': COUNT_MODE_SCAN} for day in dates}
+
+    def _query_es_range(self, es_client: ESClient, protocol_config: Dict[str, str],
+                        dates: list) -> Dict[str, Dict[str, Any]]:
+        """
+        一次聚合查询获取ADS层（ES）日期范围内每天的指标，跨月时同时查询涉及的所有月份索引
+
+        Returns:
+            {日期: {'es_total', 'es_distinct'}}，查询失败时为空字典
+        """
+        metrics_config = self._metrics_config()
+        patterns = dict.fromkeys(self._format_index_pattern(protocol_config['es_index_pattern'], day)
+                                 for day in dates)
+        distinct_field = None
+        if metrics_config['distinct_mode'] != 'none':
+            distinct_field = protocol_config.get('es_distinct_field', metrics_config['es_distinct_field'])
+        daily = es_client.get_daily_metrics(
+            index_pattern=','.join(patterns),
+            date_field=protocol_config['es_date_field'],
+            start_date=dates[0],
+            end_date=dates[-1],
+            distinct_field=distinct_field,
+            precision_threshold=metrics_config['es_precision_threshold']
+        )
+        if daily is None:
+            return {}
+        distinct_default = 0 if distinct_field else None
+        # 多日模式的去重数来自按日分组的cardinality子聚合
+        distinct_mode = ES_DISTINCT_CARDINALITY if distinct_field else None
+        return {day: {'es_total': daily.get(day, {}).get('total', 0),
+                      'es_distinct': daily.get(day, {}).get('distinct', distinct_default),
+                      'es_distinct_mode': distinct_mode}
+                for day in dates}
+
+    def _batch_sides(self) -> set:
+        """
+        使用合并查询的数据源：hive_batch.enabled 时ODS总是合并；
+        DWD只在不计算去重数时合并（去重数需要单表扫描）；
+        count_mode为stats时Hive总数来自分区元数据，不合并；
+        es_batch.enabled 时ES查询合并为 _msearch 请求（ES去重可能需要精确计数时不合并，
+        使各协议的composite分页在ES线程池中并发执行）
+        """
+        sides = set()
+        batch_config = self.config.get('hive_batch') or {}
+        if batch_config.get('enabled', False) and self._metrics_config()['count_mode'] != 'stats':
+            sides.add('ods')
+            if self._metrics_config()['distinct_mode'] == 'none':
+                sides.add('hive')
+        metrics_config = self._metrics_config()
+        if (self.config.get('es_batch') or {}).get('enabled', False) and (
+                metrics_config['distinct_mode'] == 'none'
+                or metrics_config['es_distinct_mode'] == ES_DISTINCT_CARDINALITY):
+            sides.add('es')
+        return sides
+
+    def _protocol_sides(self, protocol_config: Dict[str, str]) -> list:
+        """协议需要查询的数据源：DWD和ES必查，配置了hive_ods和ods_table时同时查询ODS"""
+        sides = ['hive', 'es']
+        if self.config.get('hive_ods') and protocol_config.get('ods_table'):
+            sides.append('ods')
+        return sides
+
+    @staticmethod
+    def _consistency_rate(left: Optional[int], right: Optional[int]) -> Optional[float]:
+        """一致性率：较小值/较大值，任一方缺失时返回None"""
+        if left is None or right is None:
+            return None
+        if max(left, right) > 0:
+            return min(left, right) / max(left, right) * 100
+        return 100.0
+
+    def _build_result(self, protocol_name: str, query_date: str, metrics: Dict[str, Any],
+                      errors: list) -> Dict[str, Any]:
+        """
+        根据各数据源的查询结果计算差异、一致性率和状态
+
+        Args:
+            protocol_name: 协议名称
+            query_date: 查询日期
+            metrics: 各数据源指标（ods_total、hive_total、hive_distinct、es_total、es_distinct）
+            errors: 查询过程中的错误信息列表
+
+        Returns:
+            比较结果字典
+        """
+        result = {field: None for field in RESULT_FIELDS}
+        result.update({'protocol': protocol_name, 'query_date': query_date, 'status': 'FAILED'})
+        result.update(metrics)
+        result['cached'] = ','.join(side for side in ('ods', 'hive', 'es') if result.pop(f"{side}_cached", False))
+
+        hive_total, es_total = result['hive_total'], result['es_total']
+        hive_distinct, es_distinct = result['hive_distinct'], result['es_distinct']
+        if hive_total is not None and es_total is not None:
+            result['total_diff'] = hive_total - es_total
+        if hive_distinct is not None and es_distinct is not None:
+            result['distinct_diff'] = hive_distinct - es_distinct
+        result['total_consistency_rate'] = self._consistency_rate(hive_total, es_total)
+        result['distinct_consistency_rate'] = self._consistency_rate(hive_distinct, es_distinct)
+
+        # 判断状态（去重指标缺失时仅按总数判断）
+        rates = [rate for rate in (result['total_consistency_rate'], result['distinct_consistency_rate'])
+                 if rate is not None]
+        if result['total_consistency_rate'] is not None:
+            if min(rates) >= 95:
+                result['status'] = 'GOOD'
+            elif min(rates) >= 90:
+                result['status'] = 'WARNING'
+            else:
+                result['status'] = 'ERROR'
+        else:
+            if hive_total is None:
+                errors.append("Hive查询失败")
+            if es_total is None:
+                errors.append("ES查询失败")
+        if 'ods_total' in metrics and metrics['ods_total'] is None:
+            errors.append("ODS查询失败")
+
+        if errors:
+            result['error'] = '; '.join(errors)
         return result
-    
+
+    def _timed_query(self, side: str, protocol_name: str, func, *args) -> Dict[str, Any]:
+        """在工作线程中执行单个数据源查询并记录耗时"""
+        start = time.time()
+        try:
+            return func(*args)
+        finally:
+            self.logger.info(f"协议 {protocol_name} {side.upper()} 查询耗时 {time.time() - start:.1f} 秒")
+
+    def _open_result_csv(self, suffix: str = ""):
+        """创建结果CSV文件并写入表头，返回 (文件对象, writer)"""
+        output_dir = self.config['output']['csv_directory']
+        os.makedirs(output_dir, exist_ok=True)
+
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.csv_file = os.path.join(output_dir, f"dwd_ads_consistency{suffix}_{timestamp}.csv")
+        f = open(self.csv_file, 'w', newline='', encoding='utf-8')
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        f.flush()
+        return f, writer
+
     def run_comparison(self) -> None:
-        """运行完整的数据一致性比较"""
+        """
+        运行完整的数据一致性比较
+
+        所有协议的DWD/ODS（Hive）和ADS（ES）查询分别提交到两个线程池并发执行，
+        Hive和ES的并发数分别由 parallel.hive_workers / parallel.es_workers 限制；
+        启用 hive_batch 时多个协议的Hive计数合并为少量 UNION ALL 查询，
+        启用 es_batch 时ES查询合并为 _msearch 请求；
+        一个协议的所有查询完成后立即输出并追加写入结果CSV
+        """
         self.logger.info("开始执行DWD和ADS数据一致性比较")
         
         query_date = self._get_query_date()
@@ -196,23 +727,474 @@ class DataQualityMonitor:
         
         protocols = self.config['protocols']
         total_protocols = len(protocols)
-        
-        for i, (protocol_name, protocol_config) in enumerate(protocols.items(), 1):
-            self.logger.info(f"[{i}/{total_protocols}] 处理协议: {protocol_name}")
-            
-            result = self.compare_protocol_data(protocol_name, protocol_config, query_date)
-            self.results.append(result)
+        parallel_config = self.config.get('parallel') or {}
+        hive_workers = max(1, int(parallel_config.get('hive_workers', 4)))
+        es_workers = max(1, int(parallel_config.get('es_workers', 8)))
+        self.logger.info(f"并发配置: Hive {hive_workers} 个查询, ES {es_workers} 个查询")
+
+        es_config = self.config['elasticsearch']
+        self.metrics_cache = self._open_metrics_cache()
+        csv_handle, writer = self._open_result_csv()
+        pending = {}  # 协议名 -> {'sides': 未完成的数据源集合, 'metrics': {}, 'errors': []}
+        completed = 0
+
+        # ES客户端线程安全，所有ES查询共用一个连接
+        with ESClient(host=es_config['host'], port=es_config['port'],
+                      timeout=es_config.get('timeout', 30)) as es_client, \
+                ThreadPoolExecutor(max_workers=hive_workers, thread_name_prefix='hive') as hive_executor, \
+                ThreadPoolExecutor(max_workers=es_workers, thread_name_prefix='es') as es_executor:
+            futures = {}  # future -> (协议名列表, 数据源, 是否合并查询)
+            batch_sides = self._batch_sides()
+            batch_groups = {}  # (数据源, 日期字段) -> {协议名: 协议配置}
+            for protocol_name, protocol_config in protocols.items():
+                sides = self._protocol_sides(protocol_config)
+                pending[protocol_name] = {'sides': set(sides), 'metrics': {}, 'errors': []}
+                for side in sides:
+                    if side in batch_sides:
+                        date_field = protocol_config.get('date_field', 'capture_day') if side == 'ods' else None
+                        batch_groups.setdefault((side, date_field), {})[protocol_name] = protocol_config
+                        continue
+                    if side == 'hive':
+                        future = hive_executor.submit(self._timed_query, side, protocol_name,
+                                                      self._query_dwd, protocol_config, query_date)
+                    elif side == 'ods':
+                        future = hive_executor.submit(self._timed_query, side, protocol_name,
+                                                      self._query_ods, protocol_config, query_date)
+                    else:
+                        future = es_executor.submit(self._timed_query, side, protocol_name,
+                                                    self._query_es, es_client, protocol_config, query_date)
+                    futures[future] = ([protocol_name], side, False)
+
+            # 合并查询：Hive按 hive_batch.max_protocols_per_query 切分为若干条 UNION ALL 查询，
+            # ES按 es_batch.max_protocols_per_request 切分为若干个 _msearch 请求
+            max_tables = int((self.config.get('hive_batch') or {}).get('max_protocols_per_query', 30))
+            max_searches = int((self.config.get('es_batch') or {}).get('max_protocols_per_request', 30))
+            for (side, date_field), group in batch_groups.items():
+                for names in chunk(list(group), max_searches if side == 'es' else max_tables):
+                    configs = {name: group[name] for name in names}
+                    label = f"{len(names)}个协议"
+                    if side == 'hive':
+                        future = hive_executor.submit(self._timed_query, side, label,
+                                                      self._query_dwd_batch, configs, query_date)
+                    elif side == 'es':
+                        future = es_executor.submit(self._timed_query, side, label,
+                                                    self._query_es_batch, es_client, configs, query_date)
+                    else:
+                        future = hive_executor.submit(self._timed_query, side, label,
+                                                      self._query_ods_batch, configs, query_date, date_field)
+                    futures[future] = (names, side, True)
 
-            # 每完成一个协议就输出结果
-            self._print_protocol_result(result, i, total_protocols)
+            try:
+                for future in as_completed(futures):
+                    names, side, is_batch = futures[future]
+                    try:
+                        metrics = future.result()
+                        metrics_by_protocol = metrics if is_batch else {names[0]: metrics}
+                    except Exception as e:
+                        self.logger.error(f"查询协议 {', '.join(names)} 的 {side.upper()} 数据时发生错误: {e}")
+                        metrics_by_protocol = {}
+                        for protocol_name in names:
+                            pending[protocol_name]['errors'].append(f"{side.upper()}: {e}")
+
+                    for protocol_name in names:
+                        state = pending[protocol_name]
+                        state['metrics'].update(metrics_by_protocol.get(protocol_name, {}))
+                        state['sides'].discard(side)
+                        if state['sides']:
+                            continue
+
+                        result = self._build_result(protocol_name, query_date, state['metrics'], state['errors'])
+                        del pending[protocol_name]
+                        completed += 1
+                        self.results.append(result)
+                        writer.writerow(result)
+                        csv_handle.flush()
+                        self.logger.info(f"[{completed}/{total_protocols}] 协议 {protocol_name} 比较完成 - 状态: {result['status']}")
+                        self._print_protocol_result(result, completed, total_protocols)
+            finally:
+                csv_handle.close()
+                close_all_pools()
+                if self.metrics_cache:
+                    self.metrics_cache.close()
+                    self.metrics_cache = None
         
         self.logger.info("数据一致性比较完成")
-    
+
+    def run_range_comparison(self, start_date: str, end_date: str) -> None:
+        """
+        多日范围模式：每个协议每个数据源只执行一次查询（Hive按capture_day分组，ES按日期字段聚合），
+        查询次数与天数无关；结果按 (协议, 日期) 写入结果CSV，并输出 协议×日期 一致性矩阵
+
+        Args:
+            start_date: 开始日期
+            end_date: 结束日期
+        """
+        dates = date_range(start_date, end_date)
+        self.range_dates = dates
+        self.logger.info(f"开始执行多日DWD和ADS数据一致性比较 - 日期范围: {start_date} ~ {end_date}（{len(dates)} 天）")
+
+        protocols = self.config['protocols']
+        parallel_config = self.config.get('parallel') or {}
+        hive_workers = max(1, int(parallel_config.get('hive_workers', 4)))
+        es_workers = max(1, int(parallel_config.get('es_workers', 8)))
+
+        es_config = self.config['elasticsearch']
+        csv_handle, writer = self._open_result_csv(f"_{start_date}_{end_date}")
+        pending = {}  # 协议名 -> {'sides': 未完成的数据源集合, 'daily': {日期: 指标}, 'errors': []}
+        completed = 0
+
+        with ESClient(host=es_config['host'], port=es_config['port'],
+                      timeout=es_config.get('timeout', 30)) as es_client, \
+                ThreadPoolExecutor(max_workers=hive_workers, thread_name_prefix='hive') as hive_executor, \
+                ThreadPoolExecutor(max_workers=es_workers, thread_name_prefix='es') as es_executor:
+            futures = {}  # future -> (协议名, 数据源)
+            for protocol_name, protocol_config in protocols.items():
+                sides = self._protocol_sides(protocol_config)
+                pending[protocol_name] = {'sides': set(sides), 'daily': {day: {} for day in dates}, 'errors': []}
+                for side in sides:
+                    if side == 'hive':
+                        future = hive_executor.submit(self._timed_query, side, protocol_name,
+                                                      self._query_dwd_range, protocol_config, dates)
+                    elif side == 'ods':
+                        future = hive_executor.submit(self._timed_query, side, protocol_name,
+                                                      self._query_ods_range, protocol_config, dates)
+                    else:
+                        future = es_executor.submit(self._timed_query, side, protocol_name,
+                                                    self._query_es_range, es_client, protocol_config, dates)
+                    futures[future] = (protocol_name, side)
+
+            try:
+                for future in as_completed(futures):
+                    protocol_name, side = futures[future]
+                    state = pending[protocol_name]
+                    try:
+                        for day, metrics in future.result().items():
+                            state['daily'][day].update(metrics)
+                    except Exception as e:
+                        self.logger.error(f"查询协议 {protocol_name} 的 {side.upper()} 数据时发生错误: {e}")
+                        state['errors'].append(f"{side.upper()}: {e}")
+                    state['sides'].discard(side)
+                    if state['sides']:
+                        continue
+
+                    del pending[protocol_name]
+                    completed += 1
+                    for day in dates:
+                        metrics = state['daily'][day]
+                        # ODS查询失败时各日期都没有ods_total，补None使结果标记ODS查询失败
+                        if 'ods' in self._protocol_sides(protocols[protocol_name]):
+                            metrics.setdefault('ods_total', None)
+                        result = self._build_result(protocol_name, day, metrics, list(state['errors']))
+                        self.results.append(result)
+                        writer.writerow(result)
+                    csv_handle.flush()
+                    self.logger.info(f"[{completed}/{len(protocols)}] 协议 {protocol_name} 多日比较完成")
+            finally:
+                csv_handle.close()
+                close_all_pools()
+
+        self._write_range_matrix(dates)
+        self.logger.info("多日数据一致性比较完成")
+
+    def _write_range_matrix(self, dates: list) -> None:
+        """
+        输出 协议×日期 一致性矩阵：单元格为总数一致性率（%），查询失败为FAILED；
+        写入与结果CSV同目录的 *_matrix.csv 并打印到控制台
+        """
+        cells = {}
+        for result in self.results:
+            rate = result['total_consistency_rate']
+            cells.setdefault(result['protocol'], {})[result['query_date']] = \
+                f"{rate:.2f}" if rate is not None else result['status']
+
+        matrix_file = self.csv_file.replace('.csv', '_matrix.csv')
+        try:
+            with open(matrix_file, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['protocol'] + dates)
+                for protocol_name in self.config['protocols']:
+                    row = cells.get(protocol_name, {})
+                    writer.writerow([protocol_name] + [row.get(day, '') for day in dates])
+            self.logger.info(f"一致性矩阵已保存到: {matrix_file}")
+        except Exception as e:
+            self.logger.error(f"保存一致性矩阵失败: {e}")
+
+        status_color = {'GOOD': '\033[92m', 'WARNING': '\033[93m', 'ERROR': '\033[91m', 'FAILED': '\033[91m'}
+        reset_color = '\033[0m'
+        statuses = {(r['protocol'], r['query_date']): r['status'] for r in self.results}
+        width = max([len(name) for name in self.config['protocols']] + [8])
+        print("\n总数一致性率矩阵（%）")
+        print(" " * width + "".join(f"  {day[5:]:>7}" for day in dates))
+        for protocol_name in self.config['protocols']:
+            line = f"{protocol_name:<{width}}"
+            for day in dates:
+                cell = cells.get(protocol_name, {}).get(day, '-')
+                color = status_color.get(statuses.get((protocol_name, day)), '')
+                line += f"  {color}{cell:>7}{reset_color}"
+            print(line)
+
+    def _hourly_config(self) -> Dict[str, Any]:
+        """按小时比较配置"""
+        hourly_config = {
+            'hive_hour_field': 'capture_hour',
+            'es_time_field': 'capture_timeField',
+            'es_time_zone': None,
+            'deficit_threshold': 95
+        }
+        hourly_config.update(self.config.get('hourly') or {})
+        if not hourly_config['es_time_zone']:
+            raise ValueError("按小时比较需要配置 hourly.es_time_zone（DWD采集小时所在时区，如 +01:00），"
+                             "否则ES按UTC划分小时，与DWD的 capture_hour 错开")
+        ESClient.parse_time_zone(hourly_config['es_time_zone'])
+        return hourly_config
+
+    def _query_dwd_hourly(self, protocol_config: Dict[str, str], query_date: str) -> Optional[Dict[int, Dict[str, int]]]:
+        """查询DWD层每个采集小时的窗口内/窗口外记录数"""
+        hive_config = self._hive_config()
+        with HiveClient(
+            host=hive_config['host'],
+            port=hive_config['port'],
+            username=hive_config.get('username'),
+            password=hive_config.get('password'),
+            database=hive_config['database'],
+            auth=hive_config.get('auth', 'PLAIN'),
+            pool=self._session_pool(hive_config)
+        ) as hive_client:
+            return hive_client.get_capture_hour_counts(
+                table_name=protocol_config.get('dwd_table') or protocol_config['hive_table'],
+                query_date=query_date,
+                hour_field=protocol_config.get('hour_field', self._hourly_config()['hive_hour_field'])
+            )
+
+    def _query_es_hourly(self, es_client: ESClient, protocol_config: Dict[str, str],
+                         query_date: str) -> Optional[Dict[int, int]]:
+        """查询ADS层（ES）每个采集小时的文档数"""
+        hourly_config = self._hourly_config()
+        return es_client.get_hourly_counts(
+            index_pattern=self._format_index_pattern(protocol_config['es_index_pattern'], query_date),
+            date_field=protocol_config['es_date_field'],
+            query_date=query_date,
+            time_field=protocol_config.get('es_time_field', hourly_config['es_time_field']),
+            time_zone=hourly_config['es_time_zone']
+        )
+
+    def _align_hourly(self, protocol_name: str, query_date: str, hive_hourly: Optional[Dict[int, Dict[str, int]]],
+                      es_hourly: Optional[Dict[int, int]]) -> list:
+        """
+        按采集小时对齐DWD和ES的记录数
+
+        状态：GOOD / DEFICIT（ES少于DWD且一致性率低于 hourly.deficit_threshold）/
+        SURPLUS（ES多于DWD且一致性率低于阈值，通常是DWD晚到数据未进入入库窗口）/ FAILED
+
+        Returns:
+            每小时一行的结果列表（字段见 HOURLY_FIELDS）
+        """
+        threshold = float(self._hourly_config()['deficit_threshold'])
+        rows = []
+        for hour in range(24):
+            row = {field: None for field in HOURLY_FIELDS}
+            row.update({'protocol': protocol_name, 'query_date': query_date, 'capture_hour': hour, 'status': 'FAILED'})
+            if hive_hourly is not None:
+                row['hive_total'] = hive_hourly.get(hour, {}).get('total', 0)
+                row['hive_late'] = hive_hourly.get(hour, {}).get('late', 0)
+            if es_hourly is not None:
+                row['es_total'] = es_hourly.get(hour, 0)
+            if hive_hourly is not None and es_hourly is not None:
+                row['diff'] = row['hive_total'] - row['es_total']
+                row['consistency_rate'] = self._consistency_rate(row['hive_total'], row['es_total'])
+                if row['consistency_rate'] >= threshold:
+                    row['status'] = 'GOOD'
+                else:
+                    row['status'] = 'DEFICIT' if row['diff'] > 0 else 'SURPLUS'
+            rows.append(row)
+        return rows
+
+    def run_hourly_comparison(self) -> None:
+        """
+        按采集小时比较DWD和ADS：每个协议DWD一次 GROUP BY 采集小时查询、ES一次 date_histogram 聚合，
+        按采集小时对齐后输出 dwd_ads_hourly_*.csv 和 协议×小时 一致性矩阵，并列出有缺口的小时；
+        DWD的 hive_late 列为该小时不在入库窗口内（晚到）的记录数，可区分ES缺数和DWD晚到
+        """
+        if self.range_dates:
+            self.logger.warning("多日范围模式不执行按小时比较，请对具体日期单独运行")
+            return
+        self._hourly_config()  # 时区未配置或无法识别时在查询前报错
+
+        query_date = self._get_query_date()
+        protocols = self.config['protocols']
+        parallel_config = self.config.get('parallel') or {}
+        es_config = self.config['elasticsearch']
+        self.logger.info(f"开始按采集小时比较DWD和ADS数据 - 日期: {query_date}")
+
+        hourly = {name: {} for name in protocols}  # 协议名 -> {'hive': ..., 'es': ...}
+        with ESClient(host=es_config['host'], port=es_config['port'],
+                      timeout=es_config.get('timeout', 30)) as es_client, \
+                ThreadPoolExecutor(max_workers=max(1, int(parallel_config.get('hive_workers', 4))),
+                                   thread_name_prefix='hive') as hive_executor, \
+                ThreadPoolExecutor(max_workers=max(1, int(parallel_config.get('es_workers', 8))),
+                                   thread_name_prefix='es') as es_executor:
+            futures = {}
+            for protocol_name, protocol_config in protocols.items():
+                futures[hive_executor.submit(self._timed_query, 'hive', protocol_name, self._query_dwd_hourly,
+                                             protocol_config, query_date)] = (protocol_name, 'hive')
+                futures[es_executor.submit(self._timed_query, 'es', protocol_name, self._query_es_hourly,
+                                           es_client, protocol_config, query_date)] = (protocol_name, 'es')
+            try:
+                for future in as_completed(futures):
+                    protocol_name, side = futures[future]
+                    try:
+                        hourly[protocol_name][side] = future.result()
+                    except Exception as e:
+                        self.logger.error(f"按小时查询协议 {protocol_name} 的 {side.upper()} 数据时发生错误: {e}")
+            finally:
+                close_all_pools()
+
+        rows = []
+        for protocol_name in protocols:
+            rows.extend(self._align_hourly(protocol_name, query_date, hourly[protocol_name].get('hive'),
+                                           hourly[protocol_name].get('es')))
+        self._save_hourly(query_date, rows)
+
+    def _save_hourly(self, query_date: str, rows: list) -> None:
+        """保存按小时结果和 协议×小时 一致性矩阵，并打印有缺口的小时"""
+        output_dir = self.config['output']['csv_directory']
+        os.makedirs(output_dir, exist_ok=True)
+        hourly_file = os.path.join(output_dir, f"dwd_ads_hourly_{query_date}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+        try:
+            with open(hourly_file, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=HOURLY_FIELDS)
+                writer.writeheader()
+                writer.writerows(rows)
+
+            cells = {}
+            for row in rows:
+                rate = row['consistency_rate']
+                cells.setdefault(row['protocol'], []).append(f"{rate:.2f}" if rate is not None else row['status'])
+            with open(hourly_file.replace('.csv', '_matrix.csv'), 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['protocol'] + [f"{hour:02d}" for hour in range(24)])
+                for protocol_name, values in cells.items():
+                    writer.writerow([protocol_name] + values)
+            self.logger.info(f"按小时结果已保存到: {hourly_file}")
+        except Exception as e:
+            self.logger.error(f"保存按小时结果失败: {e}")
+
+        print("\n" + "=" * 60)
+        print(f"按采集小时一致性（{query_date}）")
+        print("=" * 60)
+        flagged = {}
+        for row in rows:
+            if row['status'] != 'GOOD':
+                flagged.setdefault(row['protocol'], []).append(row)
+        if not flagged:
+            print("所有协议各小时均一致")
+        for protocol_name, protocol_rows in flagged.items():
+            if all(row['status'] == 'FAILED' for row in protocol_rows):
+                print(f"  {protocol_name}: 查询失败")
+                continue
+            print(f"  {protocol_name}:")
+            for row in protocol_rows:
+                late = f", DWD窗口外 {row['hive_late']:,}" if row['hive_late'] else ''
+                label = 'ES缺失' if row['status'] == 'DEFICIT' else 'ES多余'
+                print(f"    {row['capture_hour']:02d}时 {label} {abs(row['diff']):,} "
+                      f"(DWD {row['hive_total']:,} / ES {row['es_total']:,}, {row['consistency_rate']:.1f}%{late})")
+
+    def run_row_diff(self) -> None:
+        """
+        对总数不一致的协议做行级比较，定位ES缺失/多余的 data_id（见 row_diff.locate_missing_ids），
+        id写入结果目录下的 dwd_ads_row_diff_*.csv；只处理 row_diff.statuses 中的状态，多日范围模式不执行
+        """
+        if self.range_dates:
+            self.logger.warning("多日范围模式不执行行级比较，请对具体日期单独运行")
+            return
+
+        diff_config = {
+            'statuses': ['WARNING', 'ERROR'],
+            'buckets': 1024,
+            'fanout': 16,
+            'max_fetch_rows': 10000,
+            'max_depth': 3,
+            'check_samples': 20
+        }
+        diff_config.update(self.config.get('row_diff') or {})
+        targets = [r for r in self.results if r['status'] in diff_config['statuses'] and r['total_diff']]
+        if not targets:
+            self.logger.info("没有需要行级比较的协议")
+            return
+
+        metrics_config = self._metrics_config()
+        hive_config = self._hive_config()
+        es_config = self.config['elasticsearch']
+        output_dir = self.config['output']['csv_directory']
+        os.makedirs(output_dir, exist_ok=True)
+        diff_file = os.path.join(output_dir, f"dwd_ads_row_diff_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+
+        print("\n" + "=" * 60)
+        print("行级差异定位")
+        print("=" * 60)
+        with open(diff_file, 'w', newline='', encoding='utf-8') as f, \
+                ESClient(host=es_config['host'], port=es_config['port'],
+                         timeout=es_config.get('timeout', 30)) as es_client:
+            writer = csv.writer(f)
+            writer.writerow(['protocol', 'query_date', 'data_id', 'diff_type'])
+            for result in targets:
+                protocol_name, query_date = result['protocol'], result['query_date']
+                protocol_config = self.config['protocols'][protocol_name]
+                self.logger.info(f"开始行级比较协议 {protocol_name} - 总数差异 {result['total_diff']}")
+                with HiveClient(
+                    host=hive_config['host'],
+                    port=hive_config['port'],
+                    username=hive_config.get('username'),
+                    password=hive_config.get('password'),
+                    database=hive_config['database'],
+                    auth=hive_config.get('auth', 'PLAIN'),
+                    pool=self._session_pool(hive_config)
+                ) as hive_client:
+                    try:
+                        diff = locate_missing_ids(
+                            hive_client, es_client,
+                            table_name=protocol_config.get('dwd_table') or protocol_config['hive_table'],
+                            index_pattern=self._format_index_pattern(protocol_config['es_index_pattern'], query_date),
+                            es_date_field=protocol_config['es_date_field'],
+                            query_date=query_date,
+                            hive_id_field=protocol_config.get('hive_distinct_field', metrics_config['hive_distinct_field']),
+                            es_id_field=protocol_config.get('es_distinct_field', metrics_config['es_distinct_field']),
+                            buckets=int(diff_config['buckets']),
+                            fanout=int(diff_config['fanout']),
+                            max_fetch_rows=int(diff_config['max_fetch_rows']),
+                            max_depth=int(diff_config['max_depth']),
+                            check_samples=int(diff_config['check_samples'])
+                        )
+                    except ValueError as e:
+                        self.logger.error(f"协议 {protocol_name} 行级比较中止: {e}")
+                        print(f"  {protocol_name}: 行级比较中止 - {e}")
+                        continue
+                if diff is None:
+                    print(f"  {protocol_name}: 行级比较失败")
+                    continue
+
+                for diff_type in ('missing_in_es', 'extra_in_es'):
+                    for data_id in diff[diff_type]:
+                        writer.writerow([protocol_name, query_date, data_id, diff_type])
+                f.flush()
+                levels = ' -> '.join(f"{level['modulus']}:{level['mismatched_buckets']}" for level in diff['levels'])
+                print(f"  {protocol_name}: ES缺失 {len(diff['missing_in_es'])} 条, ES多余 {len(diff['extra_in_es'])} 条, "
+                      f"DWD重复 {diff['hive_duplicates']} 条（分桶 模数:不一致桶数 {levels}）")
+
+        close_all_pools()
+        self.logger.info(f"行级差异已保存到: {diff_file}")
+
     def save_results(self) -> None:
         """保存比较结果到CSV文件"""
         if not self.results:
             self.logger.warning("没有结果需要保存")
             return
+
+        if self.csv_file:
+            # run_comparison 已逐条写入结果
+            self.logger.info(f"结果已保存到: {self.csv_file}")
+            self._print_summary()
+            return
         
         # 创建输出目录
         output_dir = self.config['output']['csv_directory']
@@ -223,15 +1205,9 @@ class DataQualityMonitor:
         csv_file = os.path.join(output_dir, f"dwd_ads_consistency_{timestamp}.csv")
         
         # 写入CSV文件
-        fieldnames = [
-            'protocol', 'query_date', 'hive_total', 'hive_distinct', 
-            'es_total', 'es_distinct', 'total_diff', 'distinct_diff',
-            'total_consistency_rate', 'distinct_consistency_rate', 'status', 'error'
-        ]
-        
         try:
             with open(csv_file, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
+                writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
                 writer.writeheader()
                 writer.writerows(self.results)
             
@@ -255,12 +1231,25 @@ class DataQualityMonitor:
 
         color = status_color.get(result['status'], '')
 
+        def fmt_count(value):
+            return f"{value:,}" if value is not None else '-'
+
+        def fmt_rate(value):
+            return f"{value:.1f}%" if value is not None else '-'
+
         print(f"\n[{current}/{total}] {color}{result['protocol'].upper()}{reset_color} - {color}{result['status']}{reset_color}")
-        print(f"  Hive: 总数={result['hive_total']:,}, 去重={result['hive_distinct']:,}")
-        print(f"  ES:   总数={result['es_total']:,}, 去重={result['es_distinct']:,}")
+        def fmt_mode(mode):
+            return f" [{mode}]" if mode and mode != COUNT_MODE_SCAN else ''
+
+        if result.get('ods_total') is not None:
+            print(f"  ODS:  总数={fmt_count(result['ods_total'])}{fmt_mode(result.get('ods_count_mode'))}")
+        print(f"  Hive: 总数={fmt_count(result['hive_total'])}, 去重={fmt_count(result['hive_distinct'])}"
+              f"{fmt_mode(result.get('hive_count_mode'))}")
+        print(f"  ES:   总数={fmt_count(result['es_total'])}, 去重={fmt_count(result['es_distinct'])}"
+              f"{fmt_mode(result.get('es_distinct_mode') if result['es_distinct'] is not None else None)}")
 
         if result['status'] != 'FAILED':
-            print(f"  一致性: 总数={result['total_consistency_rate']:.1f}%, 去重={result['distinct_consistency_rate']:.1f}%")
+            print(f"  一致性: 总数={fmt_rate(result['total_consistency_rate'])}, 去重={fmt_rate(result['distinct_consistency_rate'])}")
 
         if result['error']:
             print(f"  错误: {result['error']}")
@@ -279,7 +1268,11 @@ class DataQualityMonitor:
         print("\n" + "="*60)
         print("数据一致性统计摘要")
         print("="*60)
-        print(f"总协议数: {total_count}")
+        if self.range_dates:
+            print(f"日期范围: {self.range_dates[0]} ~ {self.range_dates[-1]}（{len(self.range_dates)} 天）")
+            print(f"总检查数（协议×日期）: {total_count}")
+        else:
+            print(f"总协议数: {total_count}")
         print(f"良好 (GOOD): {good_count} ({good_count/total_count*100:.1f}%)")
         print(f"警告 (WARNING): {warning_count} ({warning_count/total_count*100:.1f}%)")
         print(f"错误 (ERROR): {error_count} ({error_count/total_count*100:.1f}%)")
@@ -289,9 +1282,30 @@ class DataQualityMonitor:
 
 def main():
     """主函数"""
-    monitor = DataQualityMonitor()
-    monitor.run_comparison()
+    parser = argparse.ArgumentParser(description='DWD和ADS数据一致性统计')
+    parser.add_argument('--config', default='config.yaml', help='配置文件路径')
+    parser.add_argument('--start-date', help='多日范围模式开始日期（覆盖 date.range_start）')
+    parser.add_argument('--end-date', help='多日范围模式结束日期（覆盖 date.range_end，默认为查询日期）')
+    parser.add_argument('--row-diff', action='store_true', help='比较完成后对总数不一致的协议做行级差异定位')
+    parser.add_argument('--hourly', action='store_true', help='比较完成后按采集小时比较DWD和ADS并标出缺口小时')
+    args = parser.parse_args()
+
+    monitor = DataQualityMonitor(args.config)
+    date_range_config = monitor._get_date_range()
+    if args.start_date:
+        date_range_config = (args.start_date, args.end_date or monitor._get_query_date())
+    elif args.end_date and date_range_config:
+        date_range_config = (date_range_config[0], args.end_date)
+
+    if date_range_config:
+        monitor.run_range_comparison(*date_range_config)
+    else:
+        monitor.run_comparison()
     monitor.save_results()
+    if args.row_diff or (monitor.config.get('row_diff') or {}).get('enabled', False):
+        monitor.run_row_diff()
+    if args.hourly or (monitor.config.get('hourly') or {}).get('enabled', False):
+        monitor.run_hourly_comparison()
 
 
 if __name__ == "__main__":
@@ -3,11 +3,27 @@ Elasticsearch数据库连接和查询模块
 """
 from elasticsearch import Elasticsearch
 from typing import Optional, Dict, Any, Tuple
+from concurrent.futures import ThreadPoolExecutor
 import logging
-from datetime import datetime
+import re
+from datetime import datetime, timedelta, timezone, tzinfo
 
 logger = logging.getLogger(__name__)
 
+# ES去重方式：cardinality（HLL近似，precision_threshold以下接近精确）/ exact（composite聚合分页精确计数）/
+# auto（先用cardinality，结果超过precision_threshold时改用exact复核）
+ES_DISTINCT_CARDINALITY = 'cardinality'
+ES_DISTINCT_EXACT = 'exact'
+ES_DISTINCT_AUTO = 'auto'
+ES_DISTINCT_MODES = (ES_DISTINCT_CARDINALITY, ES_DISTINCT_EXACT, ES_DISTINCT_AUTO)
+
+# cardinality聚合未指定precision_threshold时ES的默认值
+DEFAULT_PRECISION_THRESHOLD = 3000
+
+# 按字段值哈希分桶的Painless表达式，与Hive的 pmod(hash(字段), N) 一致
+# （ASCII字符串的Hive hash()与Java String.hashCode()相同）
+HASH_BUCKET_EXPRESSION = "Math.floorMod(doc[params.field].value.hashCode(), params.buckets)"
+
 
 class ESClient:
     """Elasticsearch客户端类"""
@@ -105,15 +121,17 @@ class ESClient:
             return None
     
     def get_distinct_count(self, index_pattern: str, distinct_field: str, 
-                          date_field: str, query_date: str) -> Optional[int]:
+                          date_field: str, query_date: str,
+                          precision_threshold: Optional[int] = None) -> Optional[int]:
         """
-        获取指定日期按指定字段去重后的文档数
+        获取指定日期按指定字段去重后的文档数（cardinality聚合，超过precision_threshold后为近似值）
         
         Args:
             index_pattern: 索引模式
             distinct_field: 去重字段名
             date_field: 日期字段名
             query_date: 查询日期
+            precision_threshold: cardinality精度阈值（最大40000），为空时使用ES默认值
             
         Returns:
             去重后文档数，失败时返回None
@@ -133,9 +151,7 @@ class ESClient:
                 },
                 "aggs": {
                     "distinct_count": {
-                        "cardinality": {
-                            "field": distinct_field  # 直接使用字段名，因为data_idField已经是keyword类型
-                        }
+                        "cardinality": self._cardinality(distinct_field, precision_threshold)
                     }
                 }
             }
@@ -156,6 +172,464 @@ class ESClient:
             logger.error(f"执行ES去重查询失败: {e}")
             return None
     
+    @staticmethod
+    def _cardinality(distinct_field: str, precision_threshold: Optional[int] = None) -> Dict[str, Any]:
+        """cardinality聚合参数"""
+        # 直接使用字段名，因为data_idField已经是keyword类型
+        cardinality = {"field": distinct_field}
+        if precision_threshold:
+            cardinality["precision_threshold"] = int(precision_threshold)
+        return cardinality
+
+    def get_exact_distinct_count(self, index_pattern: str, distinct_field: str, date_field: str,
+                                 query_date: str, page_size: int = 10000, slices: int = 1) -> Optional[int]:
+        """
+        精确去重计数：composite聚合按去重字段分页遍历所有取值（after_key翻页），累加桶数；
+        只在服务端保留一页桶，不拉取文档。slices>1时按字段值哈希把取值切分为互不相交的若干片并行分页
+        （每片都要对当天文档执行一次哈希脚本过滤，总开销增加、耗时缩短）
+
+        Args:
+            index_pattern: 索引模式
+            distinct_field: 去重字段名（keyword）
+            date_field: 日期字段名
+            query_date: 查询日期
+            page_size: 每页桶数
+            slices: 并行切片数
+
+        Returns:
+            去重后文档数，失败时返回None
+        """
+        if not self.client:
+            logger.error("ES连接未建立，请先调用connect()方法")
+            return None
+
+        slices = max(1, int(slices))
+        logger.info(f"执行ES精确去重查询 - 索引: {index_pattern}, 去重字段: {distinct_field}, 切片数: {slices}")
+        try:
+            if slices == 1:
+                distinct_count = self._count_composite_buckets(
+                    index_pattern, {"term": {date_field: query_date}}, distinct_field, page_size)
+            else:
+                queries = [{
+                    "bool": {
+                        "filter": [
+                            {"term": {date_field: query_date}},
+                            {"script": {"script": {
+                                "source": f"doc[params.field].size() > 0 && {HASH_BUCKET_EXPRESSION} == params.slice",
+                                "params": {"field": distinct_field, "buckets": slices, "slice": i}
+                            }}}
+                        ]
+                    }
+                } for i in range(slices)]
+                with ThreadPoolExecutor(max_workers=slices, thread_name_prefix='es-slice') as executor:
+                    distinct_count = sum(executor.map(
+                        lambda query: self._count_composite_buckets(index_pattern, query, distinct_field, page_size),
+                        queries))
+            logger.info(f"ES精确去重查询成功，返回去重文档数: {distinct_count}")
+            return distinct_count
+
+        except Exception as e:
+            logger.error(f"执行ES精确去重查询失败: {e}")
+            return None
+
+    def _count_composite_buckets(self, index_pattern: str, query: Dict[str, Any], field: str,
+                                 page_size: int) -> int:
+        """composite聚合分页遍历字段的所有取值，返回取值个数（缺少该字段的文档不计入）"""
+        return sum(len(page) for page in self._composite_pages(index_pattern, query, field, page_size))
+
+    def _composite_pages(self, index_pattern: str, query: Dict[str, Any], field: str, page_size: int):
+        """composite聚合按after_key分页，逐页返回字段取值列表"""
+        pages = 0
+        after_key = None
+        while True:
+            composite = {"size": page_size, "sources": [{"value": {"terms": {"field": field}}}]}
+            if after_key:
+                composite["after"] = after_key
+            response = self.client.search(
+                index=index_pattern,
+                body={"size": 0, "query": query, "aggs": {"distinct_values": {"composite": composite}}}
+            )
+            aggregation = response['aggregations']['distinct_values']
+            pages += 1
+            yield [bucket['key']['value'] for bucket in aggregation['buckets']]
+            after_key = aggregation.get('after_key')
+            if len(aggregation['buckets']) < page_size or not after_key:
+                break
+        logger.debug(f"composite聚合分页完成: {pages} 页")
+
+    @staticmethod
+    def _hash_bucket_query(date_field: str, query_date: str, id_field: str,
+                           modulus: int = None, buckets: list = None) -> Dict[str, Any]:
+        """指定日期、id存在且（指定modulus时）id哈希落在buckets内的查询条件"""
+        filters = [{"term": {date_field: query_date}}, {"exists": {"field": id_field}}]
+        if modulus:
+            filters.append({"script": {"script": {
+                "source": f"params.targets.contains({HASH_BUCKET_EXPRESSION})",
+                "params": {"field": id_field, "buckets": modulus, "targets": list(buckets)}
+            }}})
+        return {"bool": {"filter": filters}}
+
+    def get_hash_bucket_counts(self, index_pattern: str, date_field: str, query_date: str, id_field: str,
+                               modulus: int, parent_modulus: int = None,
+                               parent_buckets: list = None) -> Optional[Dict[int, int]]:
+        """
+        按id哈希分桶计数（与Hive的 pmod(hash(id), modulus) 一致）
+
+        Args:
+            index_pattern: 索引模式
+            date_field: 日期字段名
+            query_date: 查询日期
+            id_field: id字段名（keyword）
+            modulus: 分桶模数
+            parent_modulus: 上一层分桶模数，指定时只统计落在 parent_buckets 内的文档
+            parent_buckets: 上一层不一致的桶号
+
+        Returns:
+            {桶号: 文档数}，失败时返回None
+        """
+        if not self.client:
+            logger.error("ES连接未建立，请先调用connect()方法")
+            return None
+
+        try:
+            # 子桶嵌套在父桶内，每个父桶最多对应 modulus/parent_modulus 个子桶
+            size = modulus if not parent_modulus else len(parent_buckets) * (modulus // parent_modulus)
+            query = {
+                "size": 0,
+                "query": self._hash_bucket_query(date_field, query_date, id_field, parent_modulus, parent_buckets),
+                "aggs": {
+                    "hash_buckets": {
+                        "terms": {
+                            "script": {
+                                "source": HASH_BUCKET_EXPRESSION,
+                                "params": {"field": id_field, "buckets": modulus}
+                            },
+                            "size": size
+                        }
+                    }
+                }
+            }
+            logger.info(f"执行ES分桶计数 - 索引: {index_pattern}, 模数: {modulus}")
+            response = self.client.search(index=index_pattern, body=query)
+            return {int(bucket['key']): bucket['doc_count']
+                    for bucket in response['aggregations']['hash_buckets']['buckets']}
+
+        except Exception as e:
+            logger.error(f"执行ES分桶计数失败: {e}")
+            return None
+
+    def get_hash_bucket_total(self, index_pattern: str, date_field: str, query_date: str,
+                              id_field: str) -> Optional[int]:
+        """
+        参与分桶的文档总数（与get_hash_bucket_counts的第一层范围相同：指定日期id存在的文档）
+
+        Returns:
+            文档数，失败时返回None
+        """
+        if not self.client:
+            logger.error("ES连接未建立，请先调用connect()方法")
+            return None
+
+        try:
+            response = self.client.count(index=index_pattern,
+                                         body={"query": self._hash_bucket_query(date_field, query_date, id_field)})
+            return response['count']
+        except Exception as e:
+            logger.error(f"执行ES分桶总数查询失败: {e}")
+            return None
+
+    def get_id_buckets(self, index_pattern: str, date_field: str, query_date: str, id_field: str,
+                       ids: list, modulus: int) -> Optional[Dict[str, int]]:
+        """
+        查询指定id在ES中按 HASH_BUCKET_EXPRESSION 计算的桶号，用于与Hive抽样结果核对
+
+        Returns:
+            {id: 桶号}（ES中不存在的id不出现），失败时返回None
+        """
+        if not self.client:
+            logger.error("ES连接未建立，请先调用connect()方法")
+            return None
+
+        try:
+            query = {
+                "size": 0,
+                "query": {"bool": {"filter": [{"term": {date_field: query_date}}, {"terms": {id_field: list(ids)}}]}},
+                "aggs": {
+                    "ids": {
+                        "terms": {"field": id_field, "size": len(ids)},
+                        "aggs": {
+                            "hash_bucket": {
+                                "terms": {
+                                    "script": {
+                                        "source": HASH_BUCKET_EXPRESSION,
+                                        "params": {"field": id_field, "buckets": modulus}
+                                    },
+                                    "size": 1
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+            response = self.client.search(index=index_pattern, body=query)
+            return {str(bucket['key']): int(bucket['hash_bucket']['buckets'][0]['key'])
+                    for bucket in response['aggregations']['ids']['buckets'] if bucket['hash_bucket']['buckets']}
+        except Exception as e:
+            logger.error(f"查询ES id桶号失败: {e}")
+            return None
+
+    def get_ids_in_buckets(self, index_pattern: str, date_field: str, query_date: str, id_field: str,
+                           modulus: int, buckets: list, page_size: int = 10000) -> Optional[list]:
+        """
+        用composite聚合分页取出指定哈希桶内的所有id
+
+        Returns:
+            id列表（去重），失败时返回None
+        """
+        if not self.client:
+            logger.error("ES连接未建立，请先调用connect()方法")
+            return None
+
+        try:
+            query = self._hash_bucket_query(date_field, query_date, id_field, modulus, buckets)
+            ids = []
+            for page in self._composite_pages(index_pattern, query, id_field, page_size):
+                ids.extend(str(value) for value in page)
+            logger.info(f"ES取出 {len(buckets)} 个桶内的 {len(ids)} 个id")
+            return ids
+
+        except Exception as e:
+            logger.error(f"取出ES桶内id失败: {e}")
+            return None
+
+    def get_batch_metrics(self, searches: Dict[str, Dict[str, Any]]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        一次 _msearch 请求获取多个协议的文档数（和去重数）；
+        单个协议的子查询失败（返回error或有分片失败）时只对该协议退回单独查询
+
+        Args:
+            searches: {协议名: {'index_pattern', 'date_field', 'query_date', 'distinct_field'（为空时不去重）,
+                               'precision_threshold'（可选）}}
+
+        Returns:
+            {协议名: {'total', 'distinct'}}，查询失败的协议为None
+        """
+        if not self.client:
+            logger.error("ES连接未建立，请先调用connect()方法")
+            return {name: None for name in searches}
+
+        names = list(searches)
+        body = []
+        for name in names:
+            search = searches[name]
+            query = {
+                "size": 0,
+                "track_total_hits": True,
+                "query": {
+                    "term": {
+                        search['date_field']: search['query_date']
+                    }
+                }
+            }
+            if search.get('distinct_field'):
+                query["aggs"] = {"distinct_count": {"cardinality": self._cardinality(
+                    search['distinct_field'], search.get('precision_threshold'))}}
+            body.append({"index": search['index_pattern']})
+            body.append(query)
+
+        results = {name: None for name in names}
+        try:
+            logger.info(f"执行ES批量查询 - {len(names)} 个协议")
+            responses = self.client.msearch(body=body)['responses']
+        except Exception as e:
+            logger.error(f"执行ES批量查询失败，退回逐个查询: {e}")
+            responses = [None] * len(names)
+
+        for name, response in zip(names, responses):
+            if response is None:
+                pass
+            elif 'error' in response:
+                logger.warning(f"ES批量查询中协议 {name} 失败（索引 {searches[name]['index_pattern']}）: "
+                               f"{response['error']}")
+            elif response.get('_shards', {}).get('failed', 0) > 0:
+                logger.warning(f"ES批量查询中协议 {name} 有 {response['_shards']['failed']} 个分片失败，结果不完整")
+            else:
+                total = response['hits']['total']
+                results[name] = {
+                    'total': total['value'] if isinstance(total, dict) else total,
+                    'distinct': response['aggregations']['distinct_count']['value']
+                    if searches[name].get('distinct_field') else None
+                }
+
+        failed = [name for name in names if results[name] is None]
+        if failed:
+            logger.info(f"ES批量查询成功 {len(names) - len(failed)} 个协议，{len(failed)} 个协议退回单独查询")
+        for name in failed:
+            search = searches[name]
+            total = self.get_total_count(search['index_pattern'], search['date_field'], search['query_date'])
+            if total is None:
+                continue
+            distinct = None
+            if search.get('distinct_field'):
+                distinct = self.get_distinct_count(search['index_pattern'], search['distinct_field'],
+                                                   search['date_field'], search['query_date'],
+                                                   search.get('precision_threshold'))
+            results[name] = {'total': total, 'distinct': distinct}
+        return results
+
+    def get_daily_metrics(self, index_pattern: str, date_field: str, start_date: str, end_date: str,
+                          distinct_field: str = None,
+                          precision_threshold: Optional[int] = None) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        一次聚合查询获取日期范围内每天的文档数（和去重数）
+
+        Args:
+            index_pattern: 索引模式，跨月时为逗号分隔的多个模式
+            date_field: 日期字段名（keyword类型，值为yyyy-MM-dd）
+            start_date: 开始日期
+            end_date: 结束日期
+            distinct_field: 去重字段名，为空时不计算去重数（cardinality近似）
+            precision_threshold: cardinality精度阈值
+
+        Returns:
+            {日期: {'total', 'distinct'}}（没有数据的日期不在结果中），失败时返回None
+        """
+        if not self.client:
+            logger.error("ES连接未建立，请先调用connect()方法")
+            return None
+
+        try:
+            days = (datetime.strptime(end_date, '%Y-%m-%d') - datetime.strptime(start_date, '%Y-%m-%d')).days + 1
+            # 日期字段是keyword，按terms分组（每天一个桶）；date类型字段时key_as_string同样为日期
+            by_day = {"terms": {"field": date_field, "size": max(days, 1)}}
+            if distinct_field:
+                by_day["aggs"] = {"distinct_count": {"cardinality": self._cardinality(distinct_field, precision_threshold)}}
+            query = {
+                "size": 0,
+                "query": {
+                    "range": {
+                        date_field: {"gte": start_date, "lte": end_date}
+                    }
+                },
+                "aggs": {"by_day": by_day}
+            }
+
+            logger.info(f"执行ES多日聚合查询 - 索引: {index_pattern}, 日期范围: {start_date} ~ {end_date}")
+            response = self.client.search(
+                index=index_pattern,
+                body=query,
+                ignore_unavailable=True
+            )
+
+            daily = {}
+            for bucket in response['aggregations']['by_day']['buckets']:
+                day = str(bucket.get('key_as_string', bucket['key']))[:10]
+                daily[day] = {
+                    'total': bucket['doc_count'],
+                    'distinct': bucket['distinct_count']['value'] if distinct_field else None
+                }
+            logger.info(f"ES多日聚合查询成功，返回 {len(daily)} 天的数据")
+            return daily
+
+        except Exception as e:
+            logger.error(f"执行ES多日聚合查询失败: {e}")
+            return None
+
+    @staticmethod
+    def parse_time_zone(time_zone: str) -> tzinfo:
+        """
+        解析ES date_histogram 的 time_zone 参数（固定偏移如 +01:00，或时区名如 Africa/Algiers）
+
+        Raises:
+            ValueError: 无法识别的时区
+        """
+        match = re.fullmatch(r"([+-])(\d{2}):?(\d{2})", time_zone or '')
+        if match:
+            offset = timedelta(hours=int(match.group(2)), minutes=int(match.group(3)))
+            return timezone(-offset if match.group(1) == '-' else offset)
+        try:
+            from zoneinfo import ZoneInfo
+            return ZoneInfo(time_zone)
+        except Exception:
+            raise ValueError(f"无法识别的时区: {time_zone}") from None
+
+    def get_hourly_counts(self, index_pattern: str, date_field: str, query_date: str,
+                          time_field: str = "capture_timeField", time_zone: str = None) -> Optional[Dict[int, int]]:
+        """
+        一次 date_histogram 聚合获取查询日期每个采集小时的文档数
+
+        Args:
+            index_pattern: 索引模式
+            date_field: 日期字段名
+            query_date: 查询日期
+            time_field: 采集时间字段（毫秒时间戳或date类型）
+            time_zone: 小时划分使用的时区（如 +01:00），必须与Hive采集小时的时区一致
+
+        Returns:
+            {采集小时: 文档数}，失败时返回None
+        """
+        if not self.client:
+            logger.error("ES连接未建立，请先调用connect()方法")
+            return None
+
+        try:
+            zone = self.parse_time_zone(time_zone)
+            # long类型字段上 format 按数值格式处理，不能用 "HH" 取小时，改为由桶的毫秒时间戳换算
+            histogram = {"field": time_field, "fixed_interval": "1h", "time_zone": time_zone, "min_doc_count": 0}
+            query = {
+                "size": 0,
+                "query": {
+                    "term": {
+                        date_field: query_date
+                    }
+                },
+                "aggs": {"by_hour": {"date_histogram": histogram}}
+            }
+            logger.info(f"执行ES按小时聚合查询 - 索引: {index_pattern}, 日期: {query_date}")
+            response = self.client.search(index=index_pattern, body=query)
+
+            hourly = {}
+            for bucket in response['aggregations']['by_hour']['buckets']:
+                # 采集时间跨天的异常数据会落在其他日期的同一小时，按小时合并
+                hour = datetime.fromtimestamp(bucket['key'] / 1000, zone).hour
+                hourly[hour] = hourly.get(hour, 0) + bucket['doc_count']
+            return hourly
+
+        except Exception as e:
+            logger.error(f"执行ES按小时聚合查询失败: {e}")
+            return None
+
+    def index_fingerprint(self, index_pattern: str, date_field: str, query_date: str,
+                          time_field: str = "capture_timeField") -> Optional[str]:
+        """
+        查询日期的数据指纹：该日期的文档数和时间字段最大值
+        只统计查询日期的文档，同一索引中其他日期的写入不会使该日期的缓存失效
+
+        Args:
+            index_pattern: 索引模式
+            date_field: 日期字段名
+            query_date: 查询日期
+            time_field: 时间字段名（毫秒时间戳）
+
+        Returns:
+            指纹字符串，失败时返回None
+        """
+        if not self.client:
+            logger.error("ES连接未建立，请先调用connect()方法")
+            return None
+
+        try:
+            response = self.client.search(index=index_pattern, body={
+                "size": 0,
+                "track_total_hits": True,
+                "query": {"term": {date_field: query_date}},
+                "aggs": {"max_time": {"max": {"field": time_field}}}
+            })
+            return f"{response['hits']['total']['value']}:{response['aggregations']['max_time']['value']}"
+        except Exception as e:
+            logger.error(f"获取ES数据指纹失败: {e}")
+            return None
+
     def get_es_metrics(self, index_pattern: str, query_date: str,
                       date_field: str = "capture_dayField") -> Optional[int]:
         """
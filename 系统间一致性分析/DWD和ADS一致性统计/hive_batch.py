@@ -0,0 +1,83 @@
+"""
+Hive批量计数查询规划
+把多个协议（及其多个子表）的COUNT(*)合并为一条 UNION ALL 查询，按协议标签 GROUP BY 后拆分结果，
+每个日期只提交少量大作业；不存在的表在提交前剔除，合并查询失败时退回逐表查询
+"""
+from typing import Optional, Dict, List, Tuple, Callable
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def build_union_count_sql(branches: List[Tuple[str, str, str]]) -> str:
+    """
+    构造合并计数查询：每个分支先在子查询内聚合，外层按协议标签汇总
+
+    Args:
+        branches: [(协议标签, 表名, WHERE条件)]，同一协议可以有多个分支（多子表）
+
+    Returns:
+        SQL语句，结果行为 (协议标签, 记录数)
+    """
+    union_sql = "\n            UNION ALL\n".join(
+        f"            SELECT '{tag}' AS protocol_tag, COUNT(*) AS cnt FROM {table} WHERE {where}"
+        for tag, table, where in branches
+    )
+    return f"""
+        SELECT protocol_tag, SUM(cnt) FROM (
+{union_sql}
+        ) batch_counts
+        GROUP BY protocol_tag
+        """
+
+
+def chunk(items: list, size: int) -> List[list]:
+    """按大小切分列表（size<=0时不切分）"""
+    if size <= 0:
+        return [items] if items else []
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def run_batch_counts(execute_query: Callable[[str], Optional[list]], branches: List[Tuple[str, str, str]],
+                     existing_tables: Optional[set] = None) -> Dict[str, Optional[int]]:
+    """
+    执行合并计数查询并按协议拆分结果
+
+    Args:
+        execute_query: 客户端的 execute_query 方法（失败返回None）
+        branches: [(协议标签, 表名, WHERE条件)]
+        existing_tables: 数据库中已存在的表名集合，None表示不检查
+
+    Returns:
+        {协议标签: 记录数}；协议的所有子表都不存在或查询失败时为None，
+        部分子表失败时返回其余子表之和（与 ODSClient.get_multi_table_count 一致）
+    """
+    tags = list(dict.fromkeys(tag for tag, _, _ in branches))
+    counts = {tag: None for tag in tags}
+
+    if existing_tables is not None:
+        missing = [(tag, table) for tag, table, _ in branches if table.lower() not in existing_tables]
+        for tag, table in missing:
+            logger.warning(f"表 {table}（协议 {tag}）不存在，跳过")
+        branches = [branch for branch in branches if branch[1].lower() in existing_tables]
+    if not branches:
+        return counts
+
+    results = execute_query(build_union_count_sql(branches))
+    if results is not None:
+        for tag, count in results:
+            counts[tag] = int(count) if count is not None else 0
+        # 查询成功但没有返回的协议（如表为空分区）记为0
+        for tag in set(tag for tag, _, _ in branches):
+            if counts[tag] is None:
+                counts[tag] = 0
+        return counts
+
+    logger.warning(f"合并计数查询失败，退回逐表查询（{len(branches)} 个表）")
+    for tag, table, where in branches:
+        results = execute_query(f"SELECT COUNT(*) FROM {table} WHERE {where}")
+        if results:
+            counts[tag] = (counts[tag] or 0) + int(results[0][0] or 0)
+        else:
+            logger.warning(f"子表 {table}（协议 {tag}）查询失败，跳过")
+    return counts
@@ -2,7 +2,12 @@
 Hive数据库连接和查询模块
 """
 from pyhive import hive
-from typing import Optional, Tuple
+from hive_pool import HiveSessionPool
+from hive_metrics import (distinct_expression, build_metrics_sql, parse_metrics_row,
+                          dwd_hour_buckets, shift_date, build_daily_metrics_sql, parse_daily_rows)
+from hive_batch import run_batch_counts
+from hive_stats import count_from_stats, partition_fingerprint, COUNT_MODE_SCAN, COUNT_MODE_STATS
+from typing import Optional, Tuple, Dict, Any
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,7 +17,8 @@ class HiveClient:
     """Hive客户端类"""
     
     def __init__(self, host: str, port: int, username: str = None, 
-                 password: str = None, database: str = "default", auth: str = "PLAIN"):
+                 password: str = None, database: str = "default", auth: str = "PLAIN",
+                 pool: HiveSessionPool = None):
         """
         初始化Hive客户端
         
@@ -23,6 +29,7 @@ class HiveClient:
             password: 密码
             database: 数据库名
             auth: 认证方式
+            pool: 共享会话池，指定时从池中获取会话，断开时归还而不关闭
         """
         self.host = host
         self.port = port
@@ -30,7 +37,9 @@ class HiveClient:
         self.password = password
         self.database = database
         self.auth = auth
+        self.pool = pool
         self.connection = None
+        self.query_failed = False
     
     def connect(self) -> bool:
         """
@@ -39,6 +48,15 @@ class HiveClient:
         Returns:
             连接是否成功
         """
+        if self.pool:
+            try:
+                self.connection = self.pool.acquire(self.database)
+                self.query_failed = False
+                return True
+            except Exception as e:
+                logger.error(f"从会话池获取Hive连接失败: {e}")
+                return False
+
         try:
             self.connection = hive.Connection(
                 host=self.host,
@@ -57,7 +75,11 @@ class HiveClient:
     
     def disconnect(self) -> None:
         """断开Hive连接"""
-        if self.connection:
+        if self.connection and self.pool:
+            # 查询失败的会话归还后，下次取出前先做健康检查
+            self.pool.release(self.connection, healthy=not self.query_failed)
+            self.connection = None
+        elif self.connection:
             try:
                 self.connection.close()
                 logger.info("已断开Hive数据库连接")
@@ -91,6 +113,7 @@ class HiveClient:
         
         except Exception as e:
             logger.error(f"执行SQL查询失败: {e}")
+            self.query_failed = True
             return None
     
     def get_total_count(self, table_name: str, date_field: str, query_date: str) -> Optional[int]:
@@ -157,6 +180,295 @@ class HiveClient:
             return results[0][0]
         return None
     
+    @staticmethod
+    def _window_condition(date_field: str, query_date: str, hour_field: str = "insert_hour") -> str:
+        """扩展时间范围条件：前一天19:00-23:59 + 当天 + 后一天00:00-05:59"""
+        return f"""capture_day = '{query_date}'
+        AND (
+            ({date_field} = DATE_SUB('{query_date}', 1) AND {hour_field} >= 19)
+            OR
+            ({date_field} = DATE_ADD('{query_date}', 1) AND {hour_field} <= 5)
+            OR
+            ({date_field} = '{query_date}')
+        )"""
+
+    def list_tables(self) -> Optional[set]:
+        """
+        当前数据库的表名集合（小写）
+
+        Returns:
+            表名集合，失败时返回None
+        """
+        results = self.execute_query("SHOW TABLES")
+        if results is None:
+            return None
+        return {row[0].lower() for row in results}
+
+    def get_batch_total_counts(self, tables: Dict[str, str], query_date: str,
+                               date_field: str = "insert_day") -> Dict[str, Optional[int]]:
+        """
+        一条 UNION ALL 查询获取多个协议表的总记录数（扩展时间范围同get_total_count）
+
+        Args:
+            tables: {协议名: 表名}
+            query_date: 查询日期
+            date_field: 日期字段名
+
+        Returns:
+            {协议名: 总记录数}，表不存在或查询失败的协议为None
+        """
+        branches = [(protocol, table, self._window_condition(date_field, query_date))
+                    for protocol, table in tables.items()]
+        logger.info(f"合并查询 {len(branches)} 个Hive表 - 日期: {query_date}")
+        return run_batch_counts(self.execute_query, branches, self.list_tables())
+
+    @staticmethod
+    def _window_partition_filter(query_date: str, date_field: str = "insert_day", hour_field: str = "insert_hour"):
+        """按分区值判断分区是否落在扩展时间范围内（与 _window_condition 一致）"""
+        previous_day, next_day = shift_date(query_date, -1), shift_date(query_date, 1)
+
+        def in_window(spec):
+            day, hour = spec[date_field], int(spec[hour_field])
+            return day == query_date or (day == previous_day and hour >= 19) or (day == next_day and hour <= 5)
+        return in_window
+
+    def data_fingerprint(self, table_name: str, query_date: str) -> Optional[str]:
+        """
+        扩展时间范围内分区的数据指纹，用于判断缓存的指标是否仍然有效
+        （只读取窗口内的分区元数据，窗口外的分区变化不影响结果）
+
+        Returns:
+            指纹字符串，无法获取时返回None
+        """
+        return partition_fingerprint(self.execute_query, table_name, {'capture_day': query_date},
+                                     self._window_partition_filter(query_date))
+
+    def get_fast_total_count(self, table_name: str, query_date: str, date_field: str = "insert_day",
+                             hour_field: str = "insert_hour") -> Tuple[Optional[int], str]:
+        """
+        快速计数：优先用分区统计信息（numRows）计算扩展时间范围内的记录数，
+        capture_day/入库日期/入库小时不全是分区字段或统计信息不可用时退回 COUNT(*) 扫描
+
+        Args:
+            table_name: 表名
+            query_date: 查询日期
+            date_field: 入库日期字段名
+            hour_field: 入库小时字段名
+
+        Returns:
+            (总记录数, 计数方式 stats/scan)，失败时总记录数为None
+        """
+        count, reason = count_from_stats(self.execute_query, table_name, {'capture_day': query_date},
+                                         ('capture_day', date_field, hour_field),
+                                         self._window_partition_filter(query_date, date_field, hour_field))
+        if count is not None:
+            return count, COUNT_MODE_STATS
+
+        logger.info(f"表 {table_name} 无法使用统计信息（{reason}），退回扫描计数")
+        return self.get_total_count(table_name, date_field, query_date), COUNT_MODE_SCAN
+
+    def get_table_metrics(self, table_name: str, query_date: str, date_field: str = "insert_day",
+                          distinct_field: str = None, distinct_mode: str = "exact",
+                          hourly: bool = False, hour_field: str = "insert_hour",
+                          approx_function: str = "approx_count_distinct") -> Optional[Dict[str, Any]]:
+        """
+        单次扫描获取总数、去重数和入库小时分布（与get_total_count相同的扩展时间范围）
+
+        Args:
+            table_name: 表名
+            query_date: 查询日期
+            date_field: 入库日期字段名
+            distinct_field: 去重字段名，为空时不计算去重数
+            distinct_mode: exact（COUNT DISTINCT）/ approx（近似去重函数）/ none
+            hourly: 是否计算按入库小时的分布
+            hour_field: 入库小时字段名
+            approx_function: 近似去重函数名
+
+        Returns:
+            {'total', 'distinct', 'distinct_mode', 'hourly': [{'day', 'hour', 'count'}]}，失败时返回None
+        """
+        distinct_expr = distinct_expression(distinct_field, distinct_mode, approx_function)
+        hour_buckets = dwd_hour_buckets(query_date) if hourly else None
+        sql = build_metrics_sql(
+            table_name,
+            self._window_condition(date_field, query_date, hour_field),
+            distinct_expr, date_field, hour_field if hourly else None, hour_buckets
+        )
+        results = self.execute_query(sql)
+
+        if results and len(results) > 0:
+            return parse_metrics_row(results[0], distinct_mode if distinct_expr else 'none', hour_buckets)
+        return None
+
+    def get_daily_metrics(self, table_name: str, start_date: str, end_date: str,
+                          date_field: str = "insert_day", hour_field: str = "insert_hour",
+                          distinct_field: str = None, distinct_mode: str = "none",
+                          approx_function: str = "approx_count_distinct") -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        一次 GROUP BY capture_day 查询获取日期范围内每天的总数（和去重数），
+        每天的扩展时间范围与get_total_count一致（相对各自的capture_day）
+
+        Args:
+            table_name: 表名
+            start_date: 开始日期
+            end_date: 结束日期
+            date_field: 入库日期字段名
+            hour_field: 入库小时字段名
+            distinct_field: 去重字段名，为空时不计算去重数
+            distinct_mode: exact / approx / none
+            approx_function: 近似去重函数名
+
+        Returns:
+            {日期: {'total', 'distinct'}}（没有数据的日期不在结果中），失败时返回None
+        """
+        distinct_expr = distinct_expression(distinct_field, distinct_mode, approx_function)
+        # 入库日期的字面量范围用于分区裁剪，逐行条件再按各自的capture_day判断窗口
+        where = f"""capture_day BETWEEN '{start_date}' AND '{end_date}'
+        AND {date_field} BETWEEN '{shift_date(start_date, -1)}' AND '{shift_date(end_date, 1)}'
+        AND (
+            ({date_field} = DATE_SUB(capture_day, 1) AND {hour_field} >= 19)
+            OR
+            ({date_field} = DATE_ADD(capture_day, 1) AND {hour_field} <= 5)
+            OR
+            ({date_field} = capture_day)
+        )"""
+        logger.info(f"多日查询Hive表 {table_name} - 日期范围: {start_date} ~ {end_date}")
+        results = self.execute_query(build_daily_metrics_sql(table_name, where, 'capture_day', distinct_expr))
+        if results is None:
+            return None
+        return parse_daily_rows(results, distinct_mode if distinct_expr else 'none')
+
+    def get_capture_hour_counts(self, table_name: str, query_date: str, hour_field: str = "capture_hour",
+                                date_field: str = "insert_day") -> Optional[Dict[int, Dict[str, int]]]:
+        """
+        一次查询获取查询日期每个采集小时的记录数，同时区分是否在扩展时间范围（入库窗口）内：
+        窗口外的记录是晚到（后一天05点以后入库）或提前入库的数据，不计入按天统计的总数
+
+        Args:
+            table_name: 表名
+            query_date: 查询日期（capture_day）
+            hour_field: 采集小时字段名
+            date_field: 入库日期字段名
+
+        Returns:
+            {采集小时: {'total': 窗口内记录数, 'late': 窗口外记录数}}，失败时返回None
+        """
+        sql = f"""
+        SELECT
+            {hour_field},
+            SUM(CASE WHEN {self._window_condition(date_field, query_date)} THEN 1 ELSE 0 END) AS in_window,
+            COUNT(*) AS all_rows
+        FROM {table_name}
+        WHERE capture_day = '{query_date}'
+        GROUP BY {hour_field}
+        """
+        results = self.execute_query(sql)
+        if results is None:
+            return None
+        hourly = {}
+        for hour, in_window, all_rows in results:
+            if hour is None:
+                continue
+            in_window, all_rows = int(in_window or 0), int(all_rows or 0)
+            hourly[int(hour)] = {'total': in_window, 'late': all_rows - in_window}
+        return hourly
+
+    @staticmethod
+    def _hash_bucket_condition(id_field: str, modulus: int, buckets: list) -> str:
+        """id哈希桶过滤条件（与ES的 HASH_BUCKET_EXPRESSION 一致）"""
+        return f"pmod(hash({id_field}), {modulus}) IN ({', '.join(str(bucket) for bucket in buckets)})"
+
+    def get_hash_bucket_counts(self, table_name: str, query_date: str, id_field: str, modulus: int,
+                               parent_modulus: int = None, parent_buckets: list = None,
+                               date_field: str = "insert_day") -> Optional[Dict[int, int]]:
+        """
+        按 pmod(hash(id), modulus) 分桶计数（扩展时间范围同get_total_count）
+
+        Args:
+            table_name: 表名
+            query_date: 查询日期
+            id_field: id字段名
+            modulus: 分桶模数
+            parent_modulus: 上一层分桶模数，指定时只统计落在 parent_buckets 内的记录
+            parent_buckets: 上一层不一致的桶号
+            date_field: 入库日期字段名
+
+        Returns:
+            {桶号: 记录数}，失败时返回None
+        """
+        where = f"{self._window_condition(date_field, query_date)}\n        AND {id_field} IS NOT NULL"
+        if parent_modulus:
+            where += f"\n        AND {self._hash_bucket_condition(id_field, parent_modulus, parent_buckets)}"
+        sql = f"""
+        SELECT pmod(hash({id_field}), {modulus}) AS bucket, COUNT(*) FROM {table_name}
+        WHERE {where}
+        GROUP BY pmod(hash({id_field}), {modulus})
+        """
+        results = self.execute_query(sql)
+        if results is None:
+            return None
+        return {int(bucket): int(count) for bucket, count in results}
+
+    def get_hash_bucket_total(self, table_name: str, query_date: str, id_field: str,
+                              date_field: str = "insert_day") -> Optional[int]:
+        """
+        参与分桶的记录总数（与get_hash_bucket_counts的第一层范围相同：扩展时间范围内id非空的记录）
+
+        Returns:
+            记录数，失败时返回None
+        """
+        sql = f"""
+        SELECT COUNT(*) FROM {table_name}
+        WHERE {self._window_condition(date_field, query_date)}
+        AND {id_field} IS NOT NULL
+        """
+        results = self.execute_query(sql)
+        if results is None:
+            return None
+        return int(results[0][0])
+
+    def sample_id_buckets(self, table_name: str, query_date: str, id_field: str, modulus: int,
+                          limit: int = 20, date_field: str = "insert_day") -> Optional[Dict[str, int]]:
+        """
+        抽样id及其哈希桶号，用于核对两侧分桶是否一致；
+        除普通id外再单独抽取含非ASCII字符的id（Hive按UTF-8字节、ES按UTF-16字符计算哈希，只有这类id可能不一致）
+
+        Returns:
+            {id: 桶号}，失败时返回None
+        """
+        samples = {}
+        for condition in ("", f"\n        AND {id_field} RLIKE '[^\\\\x00-\\\\x7F]'"):
+            sql = f"""
+        SELECT {id_field}, pmod(hash({id_field}), {modulus}) FROM {table_name}
+        WHERE {self._window_condition(date_field, query_date)}
+        AND {id_field} IS NOT NULL{condition}
+        LIMIT {limit}
+        """
+            results = self.execute_query(sql)
+            if results is None:
+                return None
+            samples.update((str(data_id), int(bucket)) for data_id, bucket in results)
+        return samples
+
+    def get_ids_in_buckets(self, table_name: str, query_date: str, id_field: str, modulus: int,
+                           buckets: list, date_field: str = "insert_day") -> Optional[list]:
+        """
+        取出指定哈希桶内的所有id
+
+        Returns:
+            id列表（含重复），失败时返回None
+        """
+        sql = f"""
+        SELECT {id_field} FROM {table_name}
+        WHERE {self._window_condition(date_field, query_date)}
+        AND {id_field} IS NOT NULL
+        AND {self._hash_bucket_condition(id_field, modulus, buckets)}
+        """
+        results = self.execute_query(sql)
+        if results is None:
+            return None
+        return [str(row[0]) for row in results]
+
     def get_hive_metrics(self, table_name: str, query_date: str,
                         date_field: str = "insert_day") -> Optional[int]:
         """
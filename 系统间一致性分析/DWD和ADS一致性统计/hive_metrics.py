@@ -0,0 +1,182 @@
+"""
+Hive单次扫描多指标查询
+在一条SELECT中同时计算总数、去重数（精确或近似）和按小时的分布，
+每个表每个日期只扫描一次；HiveClient和ODSClient共用
+"""
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List, Tuple
+
+# 去重方式
+DISTINCT_MODES = ('none', 'exact', 'approx')
+
+
+def shift_date(query_date: str, days: int) -> str:
+    """日期字符串（%Y-%m-%d）加减天数"""
+    return (datetime.strptime(query_date, '%Y-%m-%d') + timedelta(days=days)).strftime('%Y-%m-%d')
+
+
+def date_range(start_date: str, end_date: str) -> List[str]:
+    """
+    日期范围内的所有日期（含首尾）
+
+    Raises:
+        ValueError: 开始日期晚于结束日期
+    """
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    if start > end:
+        raise ValueError(f"开始日期 {start_date} 晚于结束日期 {end_date}")
+    return [(start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range((end - start).days + 1)]
+
+
+def dwd_hour_buckets(query_date: str) -> List[Tuple[str, int]]:
+    """
+    DWD表的入库小时窗口：前一天19-23点 + 当天0-23点 + 后一天0-5点
+    （与 HiveClient.get_total_count 的扩展时间范围一致）
+
+    Returns:
+        [(入库日期, 入库小时)]
+    """
+    return ([(shift_date(query_date, -1), hour) for hour in range(19, 24)]
+            + [(query_date, hour) for hour in range(24)]
+            + [(shift_date(query_date, 1), hour) for hour in range(6)])
+
+
+def distinct_expression(distinct_field: str, distinct_mode: str,
+                        approx_function: str = "approx_count_distinct") -> Optional[str]:
+    """
+    去重计数表达式
+
+    Args:
+        distinct_field: 去重字段
+        distinct_mode: none / exact / approx
+        approx_function: 近似去重函数名（Hive需要对应UDF，Spark Thrift Server/Impala内置）
+
+    Returns:
+        SQL表达式，不去重时返回None
+    """
+    if distinct_mode not in DISTINCT_MODES:
+        raise ValueError(f"不支持的去重方式: {distinct_mode}，可选: {DISTINCT_MODES}")
+    if distinct_mode == 'none' or not distinct_field:
+        return None
+    if distinct_mode == 'approx':
+        return f"{approx_function}({distinct_field})"
+    return f"COUNT(DISTINCT {distinct_field})"
+
+
+def build_metrics_sql(table_name: str, where: str, distinct_expr: Optional[str] = None,
+                      day_field: Optional[str] = None, hour_field: Optional[str] = None,
+                      hour_buckets: Optional[List[Tuple[str, int]]] = None) -> str:
+    """
+    构造单次扫描多指标查询：总数、去重数和每个小时桶的条件计数都在同一行返回
+
+    Args:
+        table_name: 表名
+        where: WHERE条件（不含WHERE关键字）
+        distinct_expr: 去重计数表达式，None表示不计算
+        day_field: 小时桶对应的日期字段（如insert_day），为空时只按小时字段区分
+        hour_field: 小时字段（如insert_hour），为空时不计算小时分布
+        hour_buckets: [(日期, 小时)]
+
+    Returns:
+        SQL语句
+    """
+    columns = ["COUNT(*) AS total_count"]
+    if distinct_expr:
+        columns.append(f"{distinct_expr} AS distinct_count")
+    if hour_field:
+        for i, (day, hour) in enumerate(hour_buckets or []):
+            condition = f"{hour_field} = {hour}"
+            if day_field:
+                condition = f"{day_field} = '{day}' AND {condition}"
+            columns.append(f"SUM(CASE WHEN {condition} THEN 1 ELSE 0 END) AS h{i}")
+
+    select_list = ",\n            ".join(columns)
+    return f"""
+        SELECT
+            {select_list}
+        FROM {table_name}
+        WHERE {where}
+        """
+
+
+def parse_metrics_row(row: tuple, distinct_mode: str,
+                      hour_buckets: Optional[List[Tuple[str, int]]] = None) -> Dict[str, Any]:
+    """
+    解析单次扫描多指标查询的结果行
+
+    Args:
+        row: 查询结果的第一行
+        distinct_mode: 去重方式（none时结果中没有去重列）
+        hour_buckets: 查询时使用的小时桶，None表示没有小时分布列
+
+    Returns:
+        {
+            'total': 总数,
+            'distinct': 去重数（未计算时为None）,
+            'distinct_mode': 去重方式,
+            'hourly': [{'day', 'hour', 'count'}]（未计算时为None）
+        }
+    """
+    values = list(row)
+    total = values.pop(0)
+    distinct = values.pop(0) if distinct_mode != 'none' else None
+    hourly = None
+    if hour_buckets:
+        hourly = [{'day': day, 'hour': hour, 'count': int(count or 0)}
+                  for (day, hour), count in zip(hour_buckets, values)]
+    return {
+        'total': int(total) if total is not None else 0,
+        'distinct': int(distinct) if distinct is not None else None,
+        'distinct_mode': distinct_mode,
+        'hourly': hourly
+    }
+
+
+def build_daily_metrics_sql(table_name: str, where: str, day_field: str,
+                            distinct_expr: Optional[str] = None) -> str:
+    """
+    构造按日期分组的多日指标查询：一次扫描返回范围内每天的总数（和去重数）
+
+    Args:
+        table_name: 表名
+        where: WHERE条件（不含WHERE关键字），应同时限定分区范围
+        day_field: 分组的日期字段（如capture_day）
+        distinct_expr: 去重计数表达式，None表示不计算
+
+    Returns:
+        SQL语句，结果行为 (日期, 总数[, 去重数])
+    """
+    columns = [day_field, "COUNT(*) AS total_count"]
+    if distinct_expr:
+        columns.append(f"{distinct_expr} AS distinct_count")
+    select_list = ",\n            ".join(columns)
+    return f"""
+        SELECT
+            {select_list}
+        FROM {table_name}
+        WHERE {where}
+        GROUP BY {day_field}
+        """
+
+
+def parse_daily_rows(rows: list, distinct_mode: str) -> Dict[str, Dict[str, Any]]:
+    """
+    解析按日期分组的多日指标查询结果
+
+    Args:
+        rows: 查询结果行 (日期, 总数[, 去重数])
+        distinct_mode: 去重方式（none时结果中没有去重列）
+
+    Returns:
+        {日期: {'total', 'distinct'}}，没有数据的日期不在结果中
+    """
+    daily = {}
+    for row in rows:
+        day = str(row[0])[:10]
+        distinct = row[2] if distinct_mode != 'none' and len(row) > 2 else None
+        daily[day] = {
+            'total': int(row[1] or 0),
+            'distinct': int(distinct) if distinct is not None else None
+        }
+    return daily
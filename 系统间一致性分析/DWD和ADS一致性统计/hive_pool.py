@@ -0,0 +1,216 @@
+"""
+HiveServer2会话池
+HiveClient和ODSClient共用，按数据库维护空闲会话，避免每次查询都重新建立Thrift/SASL连接和会话；
+会话建立时应用统一的会话参数（队列、hive.exec.parallel等），空闲过久的会话取出前做健康检查
+"""
+from pyhive import hive
+from typing import Dict, Any
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# 已创建的会话池：(host, port, username, auth) -> HiveSessionPool
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class HiveSessionPool:
+    """HiveServer2会话池（按数据库分别维护会话）"""
+
+    def __init__(self, host: str, port: int, username: str = None, password: str = None,
+                 auth: str = "PLAIN", max_size: int = 4, session_settings: Dict[str, Any] = None,
+                 health_check_interval: int = 300, acquire_timeout: int = 600):
+        """
+        初始化会话池
+
+        Args:
+            host: Hive服务器地址
+            port: Hive服务器端口
+            username: 用户名
+            password: 密码
+            auth: 认证方式
+            max_size: 每个数据库的最大会话数
+            session_settings: 会话参数，如 {'mapreduce.job.queuename': 'etl', 'hive.exec.parallel': 'true'}
+            health_check_interval: 空闲超过该秒数的会话取出前执行健康检查
+            acquire_timeout: 等待空闲会话的超时时间（秒）
+        """
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.auth = auth
+        self.max_size = max(1, max_size)
+        self.session_settings = {str(k): str(v) for k, v in (session_settings or {}).items()}
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self.idle = {}    # 数据库 -> [(连接, 最近一次确认可用的时间)]
+        self.owner = {}   # id(连接) -> (数据库, 连接)，即使用中的会话
+        self.size = {}    # 数据库 -> 已建立的会话数（空闲+使用中）
+        self.closed = False
+        # idle、owner、size、closed 和 stats 都只在持有 condition 时修改
+        self.condition = threading.Condition()
+        self.stats = {'created': 0, 'reused': 0, 'health_checks': 0, 'discarded': 0}
+
+    def _count(self, name: str) -> None:
+        """统计计数加一"""
+        with self.condition:
+            self.stats[name] += 1
+
+    def _create(self, database: str):
+        """建立新会话并应用会话参数"""
+        connection = hive.Connection(
+            host=self.host,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            database=database,
+            auth=self.auth,
+            configuration=self.session_settings or None
+        )
+        self._count('created')
+        logger.info(f"新建Hive会话: {self.host}:{self.port}/{database}")
+        return connection
+
+    def _is_healthy(self, connection) -> bool:
+        """健康检查：执行不触发计算任务的轻量查询"""
+        self._count('health_checks')
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception as e:
+            logger.warning(f"Hive会话健康检查失败，将重建会话: {e}")
+            return False
+
+    def _close(self, connection) -> None:
+        """关闭会话（忽略关闭时的错误）"""
+        try:
+            connection.close()
+        except Exception as e:
+            logger.debug(f"关闭Hive会话时出错: {e}")
+
+    def acquire(self, database: str):
+        """
+        获取指定数据库的会话，没有空闲会话且已达上限时等待
+
+        Args:
+            database: 数据库名
+
+        Returns:
+            Hive连接
+
+        Raises:
+            TimeoutError: 等待超时
+            RuntimeError: 会话池已关闭
+        """
+        deadline = time.time() + self.acquire_timeout
+        with self.condition:
+            while True:
+                if self.closed:
+                    raise RuntimeError("Hive会话池已关闭")
+                idle = self.idle.get(database)
+                if idle:
+                    connection, checked_at = idle.pop()
+                    break
+                if self.size.get(database, 0) < self.max_size:
+                    self.size[database] = self.size.get(database, 0) + 1
+                    connection, checked_at = None, None
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise TimeoutError(f"等待Hive会话超时（{self.acquire_timeout}秒）")
+                self.condition.wait(remaining)
+
+        # 建立会话和健康检查都在锁外进行，不阻塞其他线程
+        if connection is not None:
+            if time.time() - checked_at < self.health_check_interval or self._is_healthy(connection):
+                self._checkout(database, connection)
+                with self.condition:
+                    self.stats['reused'] += 1
+                return connection
+            self._close(connection)
+            self._count('discarded')
+
+        try:
+            connection = self._create(database)
+        except Exception:
+            with self.condition:
+                self.size[database] -= 1
+                self.condition.notify_all()
+            raise
+        self._checkout(database, connection)
+        return connection
+
+    def _checkout(self, database: str, connection) -> None:
+        """登记使用中的会话；取出期间会话池已关闭时关闭该会话并抛出 RuntimeError"""
+        with self.condition:
+            if not self.closed:
+                self.owner[id(connection)] = (database, connection)
+                return
+        self._close(connection)
+        raise RuntimeError("Hive会话池已关闭")
+
+    def release(self, connection, healthy: bool = True) -> None:
+        """
+        归还会话
+
+        Args:
+            connection: acquire 返回的连接
+            healthy: 会话是否确认可用；为False时下次取出前先做健康检查
+        """
+        with self.condition:
+            # 会话池关闭时使用中的会话已一并关闭，之后归还的会话不再放回空闲列表
+            owned = self.owner.pop(id(connection), None)
+            if owned is None:
+                return
+            self.idle.setdefault(owned[0], []).append((connection, time.time() if healthy else 0))
+            self.condition.notify_all()
+
+    def close(self) -> None:
+        """关闭会话池：关闭所有空闲会话和仍在使用中的会话，之后不能再取出会话"""
+        with self.condition:
+            self.closed = True
+            connections = [connection for idle in self.idle.values() for connection, _ in idle]
+            in_use = [connection for _, connection in self.owner.values()]
+            self.idle.clear()
+            self.owner.clear()
+            self.condition.notify_all()
+        if in_use:
+            logger.warning(f"关闭Hive会话池时仍有 {len(in_use)} 个会话在使用中，一并关闭")
+        for connection in connections + in_use:
+            self._close(connection)
+        logger.info(f"Hive会话池已关闭 - 新建 {self.stats['created']} 个会话, 复用 {self.stats['reused']} 次, "
+                    f"健康检查 {self.stats['health_checks']} 次, 丢弃 {self.stats['discarded']} 个")
+
+
+def get_session_pool(host: str, port: int, username: str = None, password: str = None,
+                     auth: str = "PLAIN", max_size: int = 4, session_settings: Dict[str, Any] = None,
+                     health_check_interval: int = 300) -> HiveSessionPool:
+    """
+    获取（不存在时创建）指定HiveServer2的共享会话池，DWD和ODS在同一HiveServer2时共用一个池
+
+    Args:
+        参数同 HiveSessionPool，池已存在时忽略 max_size 等池参数
+
+    Returns:
+        HiveSessionPool实例
+    """
+    key = (host, port, username, auth)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = HiveSessionPool(host, port, username, password, auth, max_size,
+                                                 session_settings, health_check_interval)
+        return pool
+
+
+def close_all_pools() -> None:
+    """关闭所有共享会话池"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
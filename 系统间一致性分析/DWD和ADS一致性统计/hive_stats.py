@@ -0,0 +1,163 @@
+"""
+基于Hive分区统计信息的快速计数
+通过 SHOW PARTITIONS 找到查询条件覆盖的分区，逐个分区 DESCRIBE FORMATTED 读取 numRows，
+只访问元数据不启动计算任务；统计信息缺失或不准确（COLUMN_STATS_ACCURATE 中 BASIC_STATS 不为true）时
+返回None，由调用方退回全表扫描
+"""
+from typing import Optional, Dict, Callable, Tuple
+from urllib.parse import unquote
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 计数方式（写入结果CSV）
+COUNT_MODE_SCAN = 'scan'      # COUNT(*) 扫描
+COUNT_MODE_STATS = 'stats'    # 分区统计信息
+COUNT_MODE_MIXED = 'stats+scan'  # 多表协议中部分子表使用统计信息
+
+
+def parse_partition_spec(partition: str) -> Dict[str, str]:
+    """
+    解析 SHOW PARTITIONS 返回的分区名
+
+    Args:
+        partition: 如 capture_day=2025-01-01/insert_hour=19
+
+    Returns:
+        {分区字段: 值}
+    """
+    spec = {}
+    for part in partition.split('/'):
+        key, _, value = part.partition('=')
+        spec[key] = unquote(value)
+    return spec
+
+
+def partition_clause(spec: Dict[str, str]) -> str:
+    """分区规格 -> PARTITION(...) 子句"""
+    return ", ".join(f"{key}='{value}'" for key, value in spec.items())
+
+
+def parse_partition_parameters(rows: list) -> Dict[str, str]:
+    """
+    从 DESCRIBE FORMATTED 结果中提取 Partition Parameters（numRows、COLUMN_STATS_ACCURATE 等）
+
+    Args:
+        rows: DESCRIBE FORMATTED 的结果行 (col_name, data_type, comment)
+
+    Returns:
+        {参数名: 值}
+    """
+    params = {}
+    for row in rows:
+        fields = [str(field).strip() if field is not None else '' for field in row]
+        if len(fields) >= 3 and not fields[0] and fields[1]:
+            params[fields[1]] = fields[2]
+    return params
+
+
+def stats_are_fresh(params: Dict[str, str]) -> bool:
+    """
+    分区基础统计信息是否可用：numRows存在且非负，且 COLUMN_STATS_ACCURATE 标记 BASIC_STATS 为true
+    （LOAD DATA、直接写HDFS文件等不更新统计信息的操作会清除该标记）
+    """
+    try:
+        if int(params.get('numRows', -1)) < 0:
+            return False
+        accurate = json.loads(params.get('COLUMN_STATS_ACCURATE', '{}'))
+    except ValueError:
+        return False
+    return str(accurate.get('BASIC_STATS', '')).lower() == 'true'
+
+
+def count_from_stats(execute_query: Callable[[str], Optional[list]], table_name: str,
+                     prefix_spec: Dict[str, str], required_keys: Tuple[str, ...],
+                     partition_filter: Callable[[Dict[str, str]], bool]) -> Tuple[Optional[int], str]:
+    """
+    用分区统计信息计算满足条件的记录数
+
+    Args:
+        execute_query: 客户端的 execute_query 方法（失败返回None）
+        table_name: 表名
+        prefix_spec: SHOW PARTITIONS 使用的分区前缀，如 {'capture_day': '2025-01-01'}
+        required_keys: 查询条件涉及的字段，必须都是分区字段，否则统计信息无法回答
+        partition_filter: 判断分区是否满足查询条件的函数
+
+    Returns:
+        (记录数, 原因)，统计信息不可用时记录数为None
+    """
+    partitions = execute_query(f"SHOW PARTITIONS {table_name} PARTITION({partition_clause(prefix_spec)})")
+    if partitions is None:
+        return None, "无法列出分区（表不存在或非分区表）"
+
+    specs = [parse_partition_spec(row[0]) for row in partitions]
+    if not specs:
+        return 0, "查询条件下没有分区"
+    if any(key not in specs[0] for key in required_keys):
+        return None, f"查询字段 {', '.join(required_keys)} 不全是分区字段"
+
+    total = 0
+    matched = 0
+    for spec in specs:
+        if not partition_filter(spec):
+            continue
+        rows = execute_query(f"DESCRIBE FORMATTED {table_name} PARTITION({partition_clause(spec)})")
+        if rows is None:
+            return None, f"读取分区 {spec} 的统计信息失败"
+        params = parse_partition_parameters(rows)
+        if not stats_are_fresh(params):
+            return None, f"分区 {spec} 的统计信息缺失或已过期"
+        total += int(params['numRows'])
+        matched += 1
+
+    logger.info(f"表 {table_name} 使用 {matched} 个分区的统计信息计数: {total}")
+    return total, f"{matched} 个分区统计信息"
+
+
+def partition_fingerprint(execute_query: Callable[[str], Optional[list]], table_name: str,
+                          prefix_spec: Dict[str, str],
+                          partition_filter: Optional[Callable[[Dict[str, str]], bool]] = None) -> Optional[str]:
+    """
+    分区数据指纹：查询条件覆盖的分区的 修改时间/文件数/数据大小 的哈希，
+    分区有新增、删除、重写或追加文件时指纹变化
+
+    Args:
+        execute_query: 客户端的 execute_query 方法（失败返回None）
+        table_name: 表名
+        prefix_spec: 分区前缀，如 {'capture_day': '2025-01-01'}
+        partition_filter: 只读取满足条件的分区，None表示前缀下的所有分区
+
+    Returns:
+        指纹字符串，无法获取（非分区表、查询失败）时返回None
+    """
+    partitions = execute_query(f"SHOW PARTITIONS {table_name} PARTITION({partition_clause(prefix_spec)})")
+    if partitions is None:
+        return None
+
+    entries = []
+    for row in sorted(partitions):
+        spec = parse_partition_spec(row[0])
+        try:
+            if partition_filter and not partition_filter(spec):
+                continue
+        except (KeyError, ValueError):
+            pass  # 条件字段不是分区字段，无法按分区过滤，保留该分区
+        rows = execute_query(f"DESCRIBE FORMATTED {table_name} PARTITION({partition_clause(spec)})")
+        if rows is None:
+            return None
+        params = parse_partition_parameters(rows)
+        entries.append([row[0], params.get('transient_lastDdlTime'), params.get('numFiles'),
+                        params.get('totalSize')])
+    return hashlib.sha1(json.dumps(entries).encode('utf-8')).hexdigest()
+
+
+def combine_count_modes(modes: list) -> Optional[str]:
+    """合并多个子表的计数方式"""
+    modes = set(mode for mode in modes if mode)
+    if not modes:
+        return None
+    if len(modes) == 1:
+        return modes.pop()
+    return COUNT_MODE_MIXED
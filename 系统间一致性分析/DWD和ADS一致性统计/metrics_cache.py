@@ -0,0 +1,105 @@
+"""
+一致性指标本地缓存（SQLite）
+按 (数据源, 表/索引, 日期字段, 查询日期, 查询参数哈希) 保存已计算的指标，
+同时保存数据指纹（Hive分区修改时间/文件数/大小，ES索引文档数）；
+再次运行时指纹不变则直接复用缓存结果，指纹变化或无法获取指纹时重新计算
+"""
+from typing import Optional, Dict, Any
+from datetime import datetime
+import threading
+import hashlib
+import sqlite3
+import json
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics_cache (
+    source TEXT NOT NULL,
+    object_name TEXT NOT NULL,
+    date_field TEXT NOT NULL,
+    query_date TEXT NOT NULL,
+    query_hash TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    metrics TEXT NOT NULL,
+    computed_at TEXT NOT NULL,
+    PRIMARY KEY (source, object_name, date_field, query_date, query_hash)
+);
+"""
+
+
+def query_hash(spec: Dict[str, Any]) -> str:
+    """查询参数（去重方式、字段、计数方式等）的哈希，参数变化时不复用旧结果"""
+    return hashlib.sha1(json.dumps(spec, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+
+class MetricsCache:
+    """指标缓存"""
+
+    def __init__(self, db_path: str):
+        """
+        打开（不存在时创建）缓存库
+
+        Args:
+            db_path: SQLite文件路径
+        """
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        # 多个查询线程共用一个连接，读写由锁串行化
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0}
+
+    def get(self, source: str, object_name: str, date_field: str, query_date: str,
+            spec_hash: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """
+        读取缓存
+
+        Args:
+            source: 数据源（hive/ods/es）
+            object_name: 表名或索引模式
+            date_field: 日期字段
+            query_date: 查询日期
+            spec_hash: 查询参数哈希
+            fingerprint: 当前数据指纹
+
+        Returns:
+            缓存的指标，不存在或指纹已变化时返回None
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT fingerprint, metrics FROM metrics_cache WHERE source = ? AND object_name = ? "
+                "AND date_field = ? AND query_date = ? AND query_hash = ?",
+                (source, object_name, date_field, query_date, spec_hash)).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            if row[0] != fingerprint:
+                self.stats['stale'] += 1
+                logger.info(f"缓存已失效（数据已变化）: {source} {object_name} {query_date}")
+                return None
+            self.stats['hits'] += 1
+        logger.info(f"使用缓存结果: {source} {object_name} {query_date}")
+        return json.loads(row[1])
+
+    def put(self, source: str, object_name: str, date_field: str, query_date: str,
+            spec_hash: str, fingerprint: str, metrics: Dict[str, Any]) -> None:
+        """写入（覆盖）缓存"""
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO metrics_cache (source, object_name, date_field, query_date, query_hash, "
+                "fingerprint, metrics, computed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (source, object_name, date_field, query_date, spec_hash, fingerprint,
+                 json.dumps(metrics, ensure_ascii=False), datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+    def close(self) -> None:
+        """关闭缓存库"""
+        with self.lock:
+            self.connection.close()
+        logger.info(f"指标缓存: 命中 {self.stats['hits']} 次, 未命中 {self.stats['misses']} 次, "
+                    f"失效 {self.stats['stale']} 次")
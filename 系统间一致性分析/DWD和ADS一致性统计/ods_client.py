@@ -3,7 +3,13 @@ ODS数据库连接和查询模块
 基于HiveClient，专门用于查询ODS数据源
 """
 from pyhive import hive
-from typing import Optional
+from hive_pool import HiveSessionPool
+from hive_metrics import (distinct_expression, build_metrics_sql, parse_metrics_row,
+                          build_daily_metrics_sql, parse_daily_rows)
+from hive_batch import run_batch_counts
+from hive_stats import (count_from_stats, combine_count_modes, partition_fingerprint,
+                        COUNT_MODE_SCAN, COUNT_MODE_STATS)
+from typing import Optional, Dict, Any, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
@@ -13,7 +19,8 @@ class ODSClient:
     """ODS数据客户端类"""
     
     def __init__(self, host: str, port: int, username: str = None, 
-                 password: str = None, database: str = "v64_deye_dw_ods", auth: str = "PLAIN"):
+                 password: str = None, database: str = "v64_deye_dw_ods", auth: str = "PLAIN",
+                 pool: HiveSessionPool = None):
         """
         初始化ODS客户端
         
@@ -24,6 +31,7 @@ class ODSClient:
             password: 密码
             database: ODS数据库名
             auth: 认证方式
+            pool: 共享会话池，指定时从池中获取会话，断开时归还而不关闭
         """
         self.host = host
         self.port = port
@@ -31,7 +39,9 @@ class ODSClient:
         self.password = password
         self.database = database
         self.auth = auth
+        self.pool = pool
         self.connection = None
+        self.query_failed = False
     
     def connect(self) -> bool:
         """
@@ -40,6 +50,15 @@ class ODSClient:
         Returns:
             连接是否成功
         """
+        if self.pool:
+            try:
+                self.connection = self.pool.acquire(self.database)
+                self.query_failed = False
+                return True
+            except Exception as e:
+                logger.error(f"从会话池获取ODS连接失败: {e}")
+                return False
+
         try:
             self.connection = hive.Connection(
                 host=self.host,
@@ -58,7 +77,11 @@ class ODSClient:
     
     def disconnect(self) -> None:
         """断开ODS连接"""
-        if self.connection:
+        if self.connection and self.pool:
+            # 查询失败的会话归还后，下次取出前先做健康检查
+            self.pool.release(self.connection, healthy=not self.query_failed)
+            self.connection = None
+        elif self.connection:
             try:
                 self.connection.close()
                 logger.info("已断开ODS数据库连接")
@@ -92,6 +115,7 @@ class ODSClient:
         
         except Exception as e:
             logger.error(f"执行ODS SQL查询失败: {e}")
+            self.query_failed = True
             return None
     
     def get_total_count(self, table_name: str, date_field: str, query_date: str) -> Optional[int]:
@@ -141,6 +165,139 @@ class ODSClient:
             return results[0][0]
         return None
     
+    def list_tables(self) -> Optional[set]:
+        """
+        当前ODS数据库的表名集合（小写）
+
+        Returns:
+            表名集合，失败时返回None
+        """
+        results = self.execute_query("SHOW TABLES")
+        if results is None:
+            return None
+        return {row[0].lower() for row in results}
+
+    def get_batch_total_counts(self, tables: Dict[str, str], query_date: str,
+                               date_field: str = "capture_day") -> Dict[str, Optional[int]]:
+        """
+        一条 UNION ALL 查询获取多个协议的ODS总记录数（协议的逗号分隔子表合并计数）
+
+        Args:
+            tables: {协议名: ODS表名（支持逗号分隔的多表名）}
+            query_date: 查询日期
+            date_field: 日期字段名
+
+        Returns:
+            {协议名: 总记录数}，所有子表都不存在或查询失败的协议为None
+        """
+        branches = [(protocol, table.strip(), f"{date_field} = '{query_date}'")
+                    for protocol, table_names in tables.items()
+                    for table in table_names.split(',')]
+        logger.info(f"合并查询 {len(branches)} 个ODS表 - 日期: {query_date}")
+        return run_batch_counts(self.execute_query, branches, self.list_tables())
+
+    def data_fingerprint(self, table_name: str, query_date: str,
+                         date_field: str = "capture_day") -> Optional[str]:
+        """
+        查询日期下分区的数据指纹（多表时合并各子表指纹），用于判断缓存的指标是否仍然有效
+
+        Returns:
+            指纹字符串，任一子表无法获取时返回None
+        """
+        fingerprints = []
+        for table in [t.strip() for t in table_name.split(',')]:
+            fingerprint = partition_fingerprint(self.execute_query, table, {date_field: query_date})
+            if fingerprint is None:
+                return None
+            fingerprints.append(fingerprint)
+        return ','.join(fingerprints)
+
+    def get_fast_total_count(self, table_name: str, query_date: str,
+                             date_field: str = "capture_day") -> Tuple[Optional[int], Optional[str]]:
+        """
+        快速计数：优先用分区统计信息（numRows），统计信息不可用的子表退回 COUNT(*) 扫描
+
+        Args:
+            table_name: ODS表名，支持逗号分隔的多表名
+            query_date: 查询日期
+            date_field: 日期字段名（需为分区字段）
+
+        Returns:
+            (总记录数, 计数方式 stats/scan/stats+scan)，所有子表都失败时总记录数为None
+        """
+        total_count = None
+        modes = []
+        for table in [t.strip() for t in table_name.split(',')]:
+            count, reason = count_from_stats(self.execute_query, table, {date_field: query_date},
+                                             (date_field,), lambda spec: True)
+            mode = COUNT_MODE_STATS
+            if count is None:
+                logger.info(f"ODS表 {table} 无法使用统计信息（{reason}），退回扫描计数")
+                count = self.get_total_count(table, date_field, query_date)
+                mode = COUNT_MODE_SCAN
+            if count is None:
+                logger.warning(f"子表 {table} 查询失败，跳过")
+                continue
+            total_count = (total_count or 0) + count
+            modes.append(mode)
+
+        return total_count, combine_count_modes(modes)
+
+    def get_table_metrics(self, table_name: str, query_date: str, date_field: str = "capture_day",
+                          distinct_field: str = None, distinct_mode: str = "exact",
+                          hour_field: str = None,
+                          approx_function: str = "approx_count_distinct") -> Optional[Dict[str, Any]]:
+        """
+        单次扫描获取ODS表的总数、去重数和小时分布
+
+        Args:
+            table_name: ODS表名
+            query_date: 查询日期
+            date_field: 日期字段名
+            distinct_field: 去重字段名，为空时不计算去重数
+            distinct_mode: exact（COUNT DISTINCT）/ approx（近似去重函数）/ none
+            hour_field: 小时字段名，为空时不计算小时分布
+            approx_function: 近似去重函数名
+
+        Returns:
+            {'total', 'distinct', 'distinct_mode', 'hourly': [{'day', 'hour', 'count'}]}，失败时返回None
+        """
+        distinct_expr = distinct_expression(distinct_field, distinct_mode, approx_function)
+        hour_buckets = [(query_date, hour) for hour in range(24)] if hour_field else None
+        sql = build_metrics_sql(table_name, f"{date_field} = '{query_date}'", distinct_expr,
+                                None, hour_field, hour_buckets)
+        results = self.execute_query(sql)
+
+        if results and len(results) > 0:
+            return parse_metrics_row(results[0], distinct_mode if distinct_expr else 'none', hour_buckets)
+        return None
+
+    def get_daily_counts(self, table_name: str, start_date: str, end_date: str,
+                         date_field: str = "capture_day") -> Optional[Dict[str, int]]:
+        """
+        按日期分组获取日期范围内每天的ODS总记录数（每个子表一次查询，多表按日期合并）
+
+        Args:
+            table_name: ODS表名，支持逗号分隔的多表名
+            start_date: 开始日期
+            end_date: 结束日期
+            date_field: 日期字段名
+
+        Returns:
+            {日期: 总记录数}（没有数据的日期不在结果中），所有子表都失败时返回None
+        """
+        daily_counts = None
+        for table in [t.strip() for t in table_name.split(',')]:
+            sql = build_daily_metrics_sql(table, f"{date_field} BETWEEN '{start_date}' AND '{end_date}'", date_field)
+            results = self.execute_query(sql)
+            if results is None:
+                logger.warning(f"子表 {table} 查询失败，跳过")
+                continue
+            daily_counts = daily_counts or {}
+            for day, metrics in parse_daily_rows(results, 'none').items():
+                daily_counts[day] = daily_counts.get(day, 0) + metrics['total']
+        return daily_counts
+
     def get_ods_metrics(self, table_name: str, query_date: str,
                        date_field: str = "capture_day") -> Optional[int]:
         """
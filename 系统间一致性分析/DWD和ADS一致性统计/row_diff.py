@@ -0,0 +1,171 @@
+"""
+DWD与ADS（ES）行级差异定位
+两侧都按 pmod(hash(data_id), N) 把记录分到N个桶，只比较每个桶的记录数；
+数量不一致的桶再按更大的模数细分（子桶天然嵌套在父桶内），逐层缩小范围，
+直到不一致的桶内记录足够少时才取出这些桶内的id求差集，全程不拉取完整的id列表。
+Hive的hash()按UTF-8字节计算，ES脚本的String.hashCode()按UTF-16字符计算，只有ASCII id两侧桶号一致，
+因此第一层分桶后先核对两侧桶计数之和与总数、以及抽样id的桶号，不一致时中止
+"""
+from typing import Optional, Dict, Any, List, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def mismatched_buckets(hive_counts: Dict[int, int], es_counts: Dict[int, int]) -> Dict[int, Tuple[int, int]]:
+    """
+    找出两侧记录数不一致的桶
+
+    Args:
+        hive_counts: {桶号: Hive记录数}
+        es_counts: {桶号: ES文档数}
+
+    Returns:
+        {桶号: (Hive记录数, ES文档数)}
+    """
+    mismatched = {}
+    for bucket in set(hive_counts) | set(es_counts):
+        hive_count, es_count = hive_counts.get(bucket, 0), es_counts.get(bucket, 0)
+        if hive_count != es_count:
+            mismatched[bucket] = (hive_count, es_count)
+    return mismatched
+
+
+def diff_ids(hive_ids: List[str], es_ids: List[str]) -> Dict[str, List[str]]:
+    """
+    两侧id求差集
+
+    Returns:
+        {'missing_in_es': Hive有ES没有的id, 'extra_in_es': ES有Hive没有的id}
+    """
+    hive_set, es_set = set(hive_ids), set(es_ids)
+    return {
+        'missing_in_es': sorted(hive_set - es_set),
+        'extra_in_es': sorted(es_set - hive_set)
+    }
+
+
+def check_hash_buckets(hive_client, es_client, table_name: str, index_pattern: str, es_date_field: str,
+                       query_date: str, hive_id_field: str, es_id_field: str, modulus: int,
+                       hive_counts: Dict[int, int], es_counts: Dict[int, int], samples: int = 20) -> None:
+    """
+    核对两侧分桶方式一致：各自的桶计数之和等于各自的总数，抽样id在两侧落在同一个桶
+
+    Args:
+        modulus: 第一层分桶模数
+        hive_counts: 第一层Hive桶计数
+        es_counts: 第一层ES桶计数
+        samples: 抽样id数（普通id和含非ASCII字符的id各抽取这么多），为0时不抽样
+        其余参数同 locate_missing_ids
+
+    Raises:
+        ValueError: 核对不通过或核对查询失败
+    """
+    hive_total = hive_client.get_hash_bucket_total(table_name, query_date, hive_id_field)
+    es_total = es_client.get_hash_bucket_total(index_pattern, es_date_field, query_date, es_id_field)
+    if hive_total is None or es_total is None:
+        raise ValueError(f"分桶核对失败: 无法获取 {table_name} / {index_pattern} 的总数")
+    if sum(hive_counts.values()) != hive_total:
+        raise ValueError(f"分桶核对失败: {table_name} 桶计数之和 {sum(hive_counts.values())} 与总数 {hive_total} 不一致")
+    if sum(es_counts.values()) != es_total:
+        raise ValueError(f"分桶核对失败: {index_pattern} 桶计数之和 {sum(es_counts.values())} 与总数 {es_total} 不一致")
+    if samples <= 0:
+        return
+
+    hive_buckets = hive_client.sample_id_buckets(table_name, query_date, hive_id_field, modulus, samples)
+    if hive_buckets is None:
+        raise ValueError(f"分桶核对失败: 无法从 {table_name} 抽样id")
+    if not hive_buckets:
+        return
+    es_buckets = es_client.get_id_buckets(index_pattern, es_date_field, query_date, es_id_field,
+                                          list(hive_buckets), modulus)
+    if es_buckets is None:
+        raise ValueError(f"分桶核对失败: 无法查询 {index_pattern} 中抽样id的桶号")
+    different = sorted(data_id for data_id, bucket in es_buckets.items() if hive_buckets.get(data_id) != bucket)
+    if different:
+        raise ValueError(f"分桶核对失败: {len(different)} 个抽样id在DWD和ES中落在不同的桶（如 {different[:3]}），"
+                         f"两侧哈希不一致（常见于含非ASCII字符的id），无法按桶定位差异")
+    logger.info(f"分桶核对通过 {table_name} - 抽样 {len(hive_buckets)} 个id，ES中找到 {len(es_buckets)} 个，桶号一致")
+
+
+def locate_missing_ids(hive_client, es_client, table_name: str, index_pattern: str, es_date_field: str,
+                       query_date: str, hive_id_field: str = "data_id", es_id_field: str = "data_idField",
+                       buckets: int = 1024, fanout: int = 16, max_fetch_rows: int = 10000,
+                       max_depth: int = 3, check_samples: int = 20) -> Optional[Dict[str, Any]]:
+    """
+    逐层分桶定位DWD和ES之间缺失/多余的记录
+
+    Args:
+        hive_client: 已连接的HiveClient
+        es_client: 已连接的ESClient
+        table_name: DWD表名
+        index_pattern: ES索引模式
+        es_date_field: ES日期字段名
+        query_date: 查询日期
+        hive_id_field: Hive的id字段
+        es_id_field: ES的id字段（keyword）
+        buckets: 第一层桶数
+        fanout: 每次细分时一个桶拆成的子桶数
+        max_fetch_rows: 不一致的桶内记录总数不超过该值时取出id求差集
+        max_depth: 最多细分的次数，达到后即使记录数仍超过max_fetch_rows也取出id
+        check_samples: 第一层分桶后核对两侧桶号时的抽样id数（见 check_hash_buckets）
+
+    Returns:
+        {
+            'levels': [{'modulus', 'mismatched_buckets', 'rows'}],
+            'modulus': 最终分桶模数,
+            'buckets': 最终不一致的桶号列表,
+            'hive_duplicates': 不一致的桶内DWD重复id的记录数,
+            'missing_in_es': [id], 'extra_in_es': [id]
+        }，查询失败时返回None
+
+    Raises:
+        ValueError: 两侧分桶核对不通过
+    """
+    modulus = buckets
+    parent_modulus, parent_buckets = None, None
+    levels = []
+    depth = 0
+    while True:
+        hive_counts = hive_client.get_hash_bucket_counts(table_name, query_date, hive_id_field, modulus,
+                                                         parent_modulus, parent_buckets)
+        es_counts = es_client.get_hash_bucket_counts(index_pattern, es_date_field, query_date, es_id_field,
+                                                     modulus, parent_modulus, parent_buckets)
+        if hive_counts is None or es_counts is None:
+            logger.error(f"分桶计数失败: {table_name} / {index_pattern} 模数 {modulus}")
+            return None
+        if depth == 0:
+            check_hash_buckets(hive_client, es_client, table_name, index_pattern, es_date_field, query_date,
+                               hive_id_field, es_id_field, modulus, hive_counts, es_counts, check_samples)
+
+        mismatched = mismatched_buckets(hive_counts, es_counts)
+        rows = sum(max(counts) for counts in mismatched.values())
+        levels.append({'modulus': modulus, 'mismatched_buckets': len(mismatched), 'rows': rows})
+        logger.info(f"分桶比较 {table_name} - 模数 {modulus}: {len(mismatched)} 个桶不一致，涉及 {rows} 条记录")
+
+        if not mismatched:
+            return {'levels': levels, 'modulus': modulus, 'buckets': [], 'hive_duplicates': 0,
+                    'missing_in_es': [], 'extra_in_es': []}
+        if rows <= max_fetch_rows or depth >= max_depth:
+            break
+        parent_modulus, parent_buckets = modulus, sorted(mismatched)
+        modulus *= fanout
+        depth += 1
+
+    if rows > max_fetch_rows:
+        logger.warning(f"细分 {max_depth} 次后不一致的桶仍有 {rows} 条记录，超过 {max_fetch_rows}，仍取出比较")
+    bucket_list = sorted(mismatched)
+    hive_ids = hive_client.get_ids_in_buckets(table_name, query_date, hive_id_field, modulus, bucket_list)
+    es_ids = es_client.get_ids_in_buckets(index_pattern, es_date_field, query_date, es_id_field,
+                                          modulus, bucket_list)
+    if hive_ids is None or es_ids is None:
+        logger.error(f"取出不一致桶内的id失败: {table_name} / {index_pattern}")
+        return None
+
+    result = {'levels': levels, 'modulus': modulus, 'buckets': bucket_list,
+              # DWD内id重复也会造成桶计数不一致，但不会出现在差集中
+              'hive_duplicates': len(hive_ids) - len(set(hive_ids))}
+    result.update(diff_ids(hive_ids, es_ids))
+    logger.info(f"行级比较 {table_name} 完成 - ES缺失 {len(result['missing_in_es'])} 条, "
+                f"ES多余 {len(result['extra_in_es'])} 条")
+    return result